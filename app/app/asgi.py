@@ -13,4 +13,10 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# imported once django is set up
+from core.event_stream import with_event_stream  # noqa: E402
+
+# the change events stream is served here, next to the django views
+application = with_event_stream(django_application)
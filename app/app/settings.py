@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
+from datetime import timedelta
 from pathlib import Path
 import os
 
@@ -61,14 +62,33 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    # sheds load before any other work is done on the request
+    'core.middleware.AdmissionControlMiddleware',
+    # compresses the response body, so it has to run before anything that
+    # reads or writes the body on the way out
+    'core.middleware.CompressionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    # answers identical concurrent GETs with one response
+    'core.middleware.SingleFlightMiddleware',
+    # runs BROWSER_MIDDLEWARE for everything outside API_PATH_PREFIXES
+    'core.middleware.BrowserMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+# the API authenticates with tokens, so requests to it skip the session,
+# CSRF, auth and messages middleware the admin needs
+API_PATH_PREFIXES = ('/api/',)
+BROWSER_MIDDLEWARE = [
+    'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
-    'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# the admin checks only look for its middleware in MIDDLEWARE, they run
+# from BrowserMiddleware instead
+SILENCED_SYSTEM_CHECKS = ['admin.E408', 'admin.E409', 'admin.E410']
+
 ROOT_URLCONF = 'app.urls'
 
 TEMPLATES = [
@@ -159,9 +179,219 @@ AUTH_USER_MODEL = 'core.User'
 # tell rest api where to generate the schema from openapi of the class
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # orjson backed JSON renderer, the browsable API stays available
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    # token buckets per user (or address) and scope, see core.throttling
+    'DEFAULT_THROTTLE_CLASSES': [
+        'core.throttling.ScopedTokenBucketThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'auth': os.environ.get('THROTTLE_AUTH_RATE', '20/min'),
+        'uploads': os.environ.get('THROTTLE_UPLOADS_RATE', '60/hour'),
+        'writes': os.environ.get('THROTTLE_WRITES_RATE', '120/min'),
+        'reads': os.environ.get('THROTTLE_READS_RATE', '1200/min'),
+    },
 }
 
+# where the throttle buckets are kept: 'file' shares them between the
+# workers of a node through THROTTLE_FILE, in the volume the image gives
+# to the app user, 'cache' between nodes through the THROTTLE_CACHE
+# cache, 'memory' keeps them per process
+THROTTLE_STORE = os.environ.get('THROTTLE_STORE', 'file')
+THROTTLE_FILE = os.environ.get(
+    'THROTTLE_FILE', '/vol/web/api-throttle.buckets',
+)
+THROTTLE_CACHE = os.environ.get('THROTTLE_CACHE', 'default')
+
 # enable to get the image obliged to work through the browser interface
 SPECTACULAR_SETTINGS = {
     'COMPONENT_SPLIT_REQUEST': True,
-}
\ No newline at end of file
+}
+
+# version the precomputed OpenAPI schema is tied to, set to the git sha on
+# deploy; left empty the version is a hash of the python sources
+CODE_VERSION = os.environ.get('CODE_VERSION', '')
+
+# file holding the schema generated by `manage.py generate_schema`
+SCHEMA_CACHE_FILE = os.environ.get(
+    'SCHEMA_CACHE_FILE',
+    '/vol/web/schema/openapi.json',
+)
+
+# API responses at least this many bytes are compressed with brotli or gzip
+COMPRESSION_PATH_PREFIXES = ('/api/',)
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_BROTLI_QUALITY = 5
+
+# build recipe list JSON inside postgres and stream it, skipping the
+# python serializers; ignored on other databases
+RECIPE_LIST_DB_JSON = bool(int(os.environ.get('RECIPE_LIST_DB_JSON', 0)))
+
+# every process logs its metrics (query budgets, load shedding,
+# invalidation lag, jobs...) to the core.metrics logger this often, see
+# core.metrics; 0 turns the logging off
+METRICS_LOG_SECONDS = int(os.environ.get('METRICS_LOG_SECONDS', 60))
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core.metrics': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+# default time in milliseconds the queries of an API request may take in
+# total, see core.budgets
+QUERY_BUDGET_MS = int(os.environ.get('QUERY_BUDGET_MS', 5000))
+# most ids a filter such as ?tags=1,2,3 accepts
+MAX_FILTER_IDS = 100
+# most changes returned by a page of the delta sync, see recipe.sync
+SYNC_PAGE_SIZE = 500
+
+# Server-Sent Events stream of changes, see core.event_stream. It is
+# served by the ASGI application only
+EVENT_STREAM_PATH = '/api/recipe/events/'
+# seconds between keepalive comments on an idle stream
+EVENT_STREAM_HEARTBEAT = 15
+# milliseconds a client waits before reconnecting
+EVENT_STREAM_RETRY_MS = 5000
+# events queued per stream before it is told to resync instead
+EVENT_STREAM_QUEUE_SIZE = 100
+# seconds before listening again after losing the database connection
+EVENT_STREAM_RECONNECT = 1
+
+# tag and ingredient autocomplete (?q=), see recipe.autocomplete: most
+# suggestions returned, names kept in memory per worker, most names kept
+# for one user and shortest query matching names with a typo. A trie
+# takes up to about 4 KB per name, so the names in memory take up to
+# about 80 MB
+AUTOCOMPLETE_MAX_RESULTS = 20
+AUTOCOMPLETE_CACHE_NAMES = 20000
+AUTOCOMPLETE_TRIE_MAX_NAMES = 2000
+AUTOCOMPLETE_FUZZY_MIN_LENGTH = 3
+
+# most tags or ingredients merged or renamed in one request, see
+# recipe.merges. With NORMALIZE_NAMES, names are stored with their runs of
+# whitespace collapsed and recipes reuse the tags and ingredients named
+# the same but for the case
+MERGE_MAX_ITEMS = 100
+NORMALIZE_NAMES = bool(int(os.environ.get('NORMALIZE_NAMES', 0)))
+
+# most items a bulk update or delete may select, and the items changed
+# per transaction, see recipe.bulk
+BULK_MAX_ROWS = 1000
+BULK_CHUNK_SIZE = 200
+
+# rows deleted per transaction when purging deleted accounts and
+# libraries, see core.purge
+PURGE_BATCH_SIZE = 500
+
+# background jobs, see core.jobs. JOB_QUEUES names the queues the workers
+# serve, in order, with the most jobs of each running at once across the
+# workers (None for no limit)
+JOB_QUEUES = {
+    'default': None,
+    'maintenance': 1,
+}
+JOB_MAX_ATTEMPTS = 5
+# seconds before the first retry of a failed job, doubled by every retry
+JOB_RETRY_DELAY = 10
+JOB_RETRY_MAX_DELAY = 3600
+# a job running for longer is taken for the job of a crashed worker
+JOB_TIMEOUT = timedelta(minutes=30)
+# how long finished jobs are kept around
+JOB_RETENTION = timedelta(days=7)
+# seconds a worker waits for jobs when none is due
+JOB_POLL_INTERVAL = 1
+
+# backfills of large tables, see core.backfill. Rows filled per
+# transaction, how long to pause after a batch relative to how long it
+# took, and the most other queries running before a batch waits
+# BACKFILL_BUSY_WAIT seconds for them
+BACKFILL_BATCH_SIZE = 1000
+BACKFILL_PAUSE_RATIO = 1
+BACKFILL_MAX_ACTIVE = int(os.environ.get('BACKFILL_MAX_ACTIVE', 10))
+BACKFILL_BUSY_WAIT = 5
+# seconds a backfill job runs before queueing the rest as a new job
+BACKFILL_JOB_SECONDS = 300
+
+# most requests in a call to the batch endpoint, see core.batch
+BATCH_MAX_REQUESTS = 20
+# threads running the GET requests of a batch concurrently
+BATCH_MAX_WORKERS = 4
+
+# bus dropping stale entries from the in-process caches of every worker,
+# see core.invalidation. 'postgres' reaches every node through
+# LISTEN/NOTIFY, 'socket' the workers of a node through unix sockets in
+# INVALIDATION_SOCKET_DIR, for databases reached through a transaction
+# pooler, where LISTEN does not work
+INVALIDATION_BUS = os.environ.get('INVALIDATION_BUS', 'postgres')
+INVALIDATION_SOCKET_DIR = os.environ.get(
+    'INVALIDATION_SOCKET_DIR', '/vol/web/invalidation-bus',
+)
+# seconds before listening again after losing the database connection
+INVALIDATION_RECONNECT = 1
+
+# admission control, see core.middleware.AdmissionControlMiddleware. The
+# first rule matching the method (None for any) and path of a request
+# gives its priority, requests matching none are normal
+ADMISSION_PRIORITIES = [
+    # logging in and reading recipes stay available the longest
+    ('POST', r'^/api/user/token/$', 'critical'),
+    ('GET', r'^/api/recipe/recipes/', 'critical'),
+    # the schema and docs, image uploads, exports and bulk operations are
+    # shed first
+    (None, r'^/api/(schema|docs)/', 'low'),
+    (None, r'/upload-image/$', 'low'),
+    (None, r'/(export|bulk)[^/]*/$', 'low'),
+]
+# threads of each uwsgi worker, see scripts/run.sh
+WORKER_THREADS = int(os.environ.get('WORKER_THREADS', 4))
+# per priority: the longest a request may have queued before a worker
+# picked it up, the most requests a worker runs at once, out of its
+# WORKER_THREADS, and the seconds a shed client is asked to wait.
+# Critical requests can take every thread, normal ones leave one free
+# and low priority ones a quarter at most
+ADMISSION_LIMITS = {
+    'critical': {
+        'queue_wait_ms': 10000,
+        'in_flight': WORKER_THREADS,
+        'retry_after': 1,
+    },
+    'normal': {
+        'queue_wait_ms': 2000,
+        'in_flight': max(WORKER_THREADS - 1, 1),
+        'retry_after': 5,
+    },
+    'low': {
+        'queue_wait_ms': 500,
+        'in_flight': max(WORKER_THREADS // 4, 1),
+        'retry_after': 30,
+    },
+}
+
+# identical concurrent GETs to these paths, for a library no write has
+# changed since, share one response, see
+# core.middleware.SingleFlightMiddleware. The threads of a worker
+# coalesce their requests, set SINGLE_FLIGHT_CACHE to a cache all workers
+# share to coalesce across workers too. Waiting requests give up after
+# SINGLE_FLIGHT_TIMEOUT seconds and compute their own
+SINGLE_FLIGHT_PATHS = [r'^/api/recipe/']
+SINGLE_FLIGHT_TIMEOUT = 10
+SINGLE_FLIGHT_CACHE = os.environ.get('SINGLE_FLIGHT_CACHE') or None
+SINGLE_FLIGHT_POLL_INTERVAL = 0.02
+
+# responses to requests sent with an Idempotency-Key header are replayed
+# to retries for IDEMPOTENCY_KEY_TTL, see core.idempotency. An attempt
+# that did not finish within IDEMPOTENCY_CLAIM_TIMEOUT can be retried
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+IDEMPOTENCY_CLAIM_TIMEOUT = timedelta(minutes=1)
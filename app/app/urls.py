@@ -15,19 +15,23 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from drf_spectacular.views import (
-    SpectacularAPIView,
-    SpectacularSwaggerView,
-)
+from drf_spectacular.views import SpectacularSwaggerView
 
 from django.conf.urls.static import static
 from django.conf import settings
 
+from core.batch import BatchView
+from core.schema import CachedSpectacularAPIView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
-    # create url that generates schema for the project (Yaml file
-    # describes the api)
-    path('api/schema/', SpectacularAPIView.as_view(), name='api-schema'),
+    # create url that serves the schema for the project (Yaml file
+    # describes the api), generated once per code version and kept in memory
+    path(
+        'api/schema/',
+        CachedSpectacularAPIView.as_view(),
+        name='api-schema',
+    ),
     # url that serve the swagger documentation that is using the
     # the schema to generat GUI to present the docs
     path(
@@ -35,6 +39,8 @@ urlpatterns = [
         SpectacularSwaggerView.as_view(url_name='api-schema'),
         name='api-docs',
     ),
+    # several API requests in one round trip
+    path('api/batch/', BatchView.as_view(), name='api-batch'),
     path('api/user/', include('user.urls')),
     path('api/recipe/', include('recipe.urls')),
 ]
@@ -0,0 +1,150 @@
+"""
+Backfills of large tables, run outside the migrations.
+
+A migration adding a column leaves filling it to a backfill, so deploying
+never waits on a table scan. Functions decorated with @backfill are given
+the ids of BACKFILL_BATCH_SIZE rows at a time, walking the table by
+primary key. Each batch commits with the checkpoint of the backfill, so a
+stopped backfill resumes after the last batch done, and two runners of
+the same backfill take turns instead of repeating batches. Between
+batches the runner pauses BACKFILL_PAUSE_RATIO times as long as the batch
+took, and while more than BACKFILL_MAX_ACTIVE other queries are running
+it waits, leaving the database to the requests.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from core.metrics import metrics
+from core.models import BackfillProgress
+
+# registered backfills by name
+backfills = {}
+
+
+class Backfill:
+    """Function filling rows of model, given their ids"""
+
+    def __init__(self, func, name, model, batch_size):
+        self.func = func
+        self.name = name
+        self.model = model
+        self.batch_size = batch_size
+
+    def __call__(self, ids):
+        return self.func(ids)
+
+
+def backfill(model, name=None, batch_size=None):
+    """Register the decorated function as a backfill of the rows of
+    model, which must have an integer primary key"""
+    def decorator(func):
+        registered = Backfill(
+            func,
+            name or f'{func.__module__}.{func.__name__}',
+            model,
+            batch_size or settings.BACKFILL_BATCH_SIZE,
+        )
+        backfills[registered.name] = registered
+        return registered
+    return decorator
+
+
+def discover():
+    """Register the backfills of the backfills modules of the apps"""
+    autodiscover_modules('backfills')
+    return backfills
+
+
+def _estimate(model):
+    """Return the number of rows of the table of model from the planner
+    statistics, None before the table was analyzed"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class '
+            'WHERE oid = %s::regclass',
+            [connection.ops.quote_name(model._meta.db_table)],
+        )
+        total = cursor.fetchone()[0]
+    return total if total >= 0 else None
+
+
+def busy():
+    """Return whether the database runs too many other queries for a
+    backfill batch"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT count(*) FROM pg_stat_activity WHERE state = 'active' "
+            'AND datname = current_database() AND pid <> pg_backend_pid()'
+        )
+        return cursor.fetchone()[0] > settings.BACKFILL_MAX_ACTIVE
+
+
+def _batch(registered):
+    """Fill the next batch of rows, return the checkpoint"""
+    with transaction.atomic():
+        progress = BackfillProgress.objects.select_for_update().get(
+            name=registered.name,
+        )
+        if progress.finished:
+            return progress
+        ids = list(registered.model._default_manager.filter(
+            pk__gt=progress.last_pk,
+        ).order_by('pk').values_list('pk', flat=True)[
+            :registered.batch_size
+        ])
+        if ids:
+            registered(ids)
+            progress.last_pk = ids[-1]
+            progress.rows += len(ids)
+        else:
+            progress.finished = timezone.now()
+        progress.save()
+    return progress
+
+
+def run(name, max_batches=None, seconds=None, stop=None, report=None):
+    """Run the backfill called name from its checkpoint until it is done,
+    stop (an Event) is set, max_batches ran or it ran for longer than
+    seconds. report is called with the checkpoint after each batch.
+    Return the checkpoint"""
+    registered = discover()[name]
+    stop = stop or threading.Event()
+    progress, created = BackfillProgress.objects.get_or_create(name=name)
+    if created:
+        progress.total = _estimate(registered.model)
+        progress.save(update_fields=['total'])
+    started = time.monotonic()
+    batches = 0
+    while not progress.finished:
+        while busy() and not stop.is_set():
+            metrics.increment('backfill.throttled', backfill=name)
+            stop.wait(settings.BACKFILL_BUSY_WAIT)
+        if stop.is_set():
+            break
+        batch_started = time.monotonic()
+        progress = _batch(registered)
+        took = time.monotonic() - batch_started
+        batches += 1
+        metrics.observe('backfill.batch_ms', took * 1000, backfill=name)
+        metrics.set('backfill.rows', progress.rows, backfill=name)
+        if report:
+            report(progress)
+        if progress.finished or (
+            max_batches is not None and batches >= max_batches
+        ) or (
+            seconds is not None and time.monotonic() - started >= seconds
+        ):
+            break
+        stop.wait(took * settings.BACKFILL_PAUSE_RATIO)
+    return progress
+
+
+def reset(name):
+    """Forget the checkpoint of the backfill called name, so it starts
+    over"""
+    BackfillProgress.objects.filter(name=name).delete()
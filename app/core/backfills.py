@@ -0,0 +1,41 @@
+"""
+Backfills of the core app, see core.backfill
+"""
+from core import changes, counts
+from core.backfill import backfill
+from core.models import Ingredient, Recipe, Tag
+
+
+@backfill(Tag)
+def tag_recipe_counts(ids):
+    """Repair drifted tag recipe counts"""
+    counts.reconcile_recipe_counts(Tag, ids)
+
+
+@backfill(Ingredient)
+def ingredient_recipe_counts(ids):
+    """Repair drifted ingredient recipe counts"""
+    counts.reconcile_recipe_counts(Ingredient, ids)
+
+
+def _number(model, ids):
+    """Give the rows created before the change feed a position in it"""
+    changes.touch(model.objects.filter(pk__in=ids, change_seq__isnull=True))
+
+
+@backfill(Recipe)
+def recipe_change_seqs(ids):
+    """Number the recipes created before the change feed"""
+    _number(Recipe, ids)
+
+
+@backfill(Tag)
+def tag_change_seqs(ids):
+    """Number the tags created before the change feed"""
+    _number(Tag, ids)
+
+
+@backfill(Ingredient)
+def ingredient_change_seqs(ids):
+    """Number the ingredients created before the change feed"""
+    _number(Ingredient, ids)
@@ -0,0 +1,185 @@
+"""
+Batch endpoint running several API requests in one round trip.
+
+The sub-requests are dispatched straight to the views of their paths with
+the user the batch request authenticated, so the token is looked up once,
+and run one after another on the connection of the batch request. With
+"parallel", consecutive GET requests run concurrently instead, each on a
+connection of its own.
+"""
+import io
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import orjson
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connection
+from django.urls import Resolver404, resolve
+from drf_spectacular.utils import extend_schema
+from rest_framework import serializers
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.parsers import JSONParser
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+METHODS = ['GET', 'POST', 'PUT', 'PATCH', 'DELETE']
+# headers of the batch request passed on to its sub-requests, the others
+# (Idempotency-Key, conditional headers...) are meant for the batch only
+INHERITED_HEADERS = [
+    'HTTP_AUTHORIZATION',
+    'HTTP_HOST',
+    'HTTP_USER_AGENT',
+    'HTTP_X_FORWARDED_FOR',
+    'HTTP_X_FORWARDED_PROTO',
+]
+
+
+class BatchItemSerializer(serializers.Serializer):
+    """Request to run as part of a batch"""
+    method = serializers.ChoiceField(choices=METHODS, default='GET')
+    path = serializers.CharField(help_text='Path and query string')
+    headers = serializers.DictField(
+        child=serializers.CharField(), required=False,
+    )
+    body = serializers.JSONField(required=False)
+
+    def validate_path(self, value):
+        if not value.startswith('/api/'):
+            raise serializers.ValidationError('Ensure this is an API path.')
+        return value
+
+
+class BatchSerializer(serializers.Serializer):
+    """Requests to run in one round trip"""
+    requests = serializers.ListField(
+        child=BatchItemSerializer(),
+        min_length=1,
+        max_length=settings.BATCH_MAX_REQUESTS,
+    )
+    parallel = serializers.BooleanField(
+        default=False,
+        help_text='Run consecutive GET requests concurrently',
+    )
+
+
+class BatchResultSerializer(serializers.Serializer):
+    """Response to a request of the batch"""
+    status = serializers.IntegerField()
+    headers = serializers.DictField(child=serializers.CharField())
+    body = serializers.JSONField(allow_null=True)
+
+
+class BatchResponseSerializer(serializers.Serializer):
+    """Responses in the order of the requests"""
+    responses = BatchResultSerializer(many=True)
+
+
+def _error(status, detail):
+    body = orjson.dumps({'detail': detail})
+    return {'status': status, 'headers': {}, 'body': orjson.Fragment(body)}
+
+
+def _content(response):
+    """Return the body of response to embed in the batch response"""
+    if response.streaming:
+        content = b''.join(response.streaming_content)
+    else:
+        content = response.content
+    if not content:
+        return None
+    if response.get('Content-Type', '').startswith('application/json'):
+        return orjson.Fragment(content)
+    return content.decode(response.charset)
+
+
+class BatchView(APIView):
+    """Run several API requests and return their responses at once"""
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    parser_classes = [JSONParser]
+    # every sub-request is throttled by its own view
+    throttle_classes = []
+
+    def _build_request(self, item):
+        """Return a request for item carrying the batch request's user"""
+        url = urlsplit(item['path'])
+        body = orjson.dumps(item['body']) if 'body' in item else b''
+        environ = {
+            name: value for name, value in self.request.META.items()
+            if not name.startswith('HTTP_') or name in INHERITED_HEADERS
+        }
+        environ.update({
+            'REQUEST_METHOD': item['method'],
+            'PATH_INFO': url.path,
+            'QUERY_STRING': url.query,
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(body)),
+            'HTTP_ACCEPT': 'application/json',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.url_scheme': self.request.scheme,
+        })
+        for name, value in item.get('headers', {}).items():
+            environ['HTTP_' + name.upper().replace('-', '_')] = value
+        request = WSGIRequest(environ)
+        # read by rest_framework.request.Request instead of running the
+        # authentication classes of the view again
+        request._force_auth_user = self.request.user
+        request._force_auth_token = self.request.auth
+        return request
+
+    def _run(self, item):
+        """Return the status, headers and body of the response to item"""
+        try:
+            match = resolve(urlsplit(item['path']).path)
+        except Resolver404:
+            return _error(404, 'Not found.')
+        if getattr(match.func, 'view_class', None) is type(self):
+            return _error(400, 'Batches can not be nested.')
+        response = match.func(
+            self._build_request(item), *match.args, **match.kwargs,
+        )
+        if hasattr(response, 'render'):
+            response.render()
+        return {
+            'status': response.status_code,
+            'headers': {
+                name: value for name, value in response.items()
+                if name != 'Content-Type'
+            },
+            'body': _content(response),
+        }
+
+    def _run_in_thread(self, item):
+        try:
+            return self._run(item)
+        finally:
+            # the thread's own connection
+            connection.close()
+
+    @extend_schema(
+        request=BatchSerializer,
+        responses=BatchResponseSerializer,
+    )
+    def post(self, request):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data['requests']
+        if not serializer.validated_data['parallel']:
+            return Response({'responses': [self._run(i) for i in items]})
+
+        results = []
+        reads = []
+        with ThreadPoolExecutor(settings.BATCH_MAX_WORKERS) as executor:
+            for item in items + [None]:
+                if item is not None and item['method'] == 'GET':
+                    reads.append(executor.submit(self._run_in_thread, item))
+                    continue
+                # a write waits for the reads before it, and the reads
+                # after it for the write
+                results.extend(future.result() for future in reads)
+                reads = []
+                if item is not None:
+                    results.append(self._run(item))
+        return Response({'responses': results})
@@ -0,0 +1,132 @@
+"""
+Per view time budgets for database queries
+"""
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from psycopg2 import Error as Psycopg2Error
+from psycopg2.errorcodes import QUERY_CANCELED
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from core.metrics import metrics
+
+SAVEPOINT_END_SQL = ('RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+class QueryBudgetExceeded(APIException):
+    """The request ran out of time for its database queries"""
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'The request took too long, try again later.'
+    default_code = 'query_budget_exceeded'
+
+
+def is_query_canceled(exc):
+    """Return whether exc comes from postgres cancelling a statement that
+    ran past statement_timeout"""
+    cause = getattr(exc, '__cause__', None)
+    return getattr(cause, 'pgcode', None) == QUERY_CANCELED
+
+
+def _set_statement_timeout(milliseconds):
+    """Set statement_timeout on the connection, or reset it when
+    milliseconds is None. The raw cursor keeps the setting out of the
+    execute wrappers and the queries of the request"""
+    with connection.connection.cursor() as cursor:
+        if milliseconds is None:
+            cursor.execute('RESET statement_timeout')
+        else:
+            cursor.execute('SET statement_timeout = %s', [milliseconds])
+
+
+@contextmanager
+def query_budget(milliseconds):
+    """Limit the queries run in the block to milliseconds in total.
+
+    Postgres cancels any statement running longer than the budget, and
+    no query starts once the budget is spent."""
+    deadline = time.monotonic() + milliseconds / 1000
+    timeout_set = False
+
+    def check_deadline(execute, sql, params, many, context):
+        nonlocal timeout_set
+        remaining = deadline - time.monotonic()
+        # closing a savepoint has to go through, or the transaction would
+        # be left open
+        if remaining <= 0 and not sql.startswith(SAVEPOINT_END_SQL):
+            raise QueryBudgetExceeded()
+        if not timeout_set and connection.vendor == 'postgresql':
+            # set lazily so requests without queries cost nothing
+            _set_statement_timeout(max(int(remaining * 1000), 1))
+            timeout_set = True
+        return execute(sql, params, many, context)
+
+    try:
+        with connection.execute_wrapper(check_deadline):
+            yield
+    finally:
+        if timeout_set and connection.connection is not None:
+            try:
+                _set_statement_timeout(None)
+            except Psycopg2Error:
+                # the transaction failed, rolling it back resets the
+                # timeout set inside it
+                pass
+
+
+class QueryBudgetMixin:
+    """Give the queries of each request to a view query_budget_ms in
+    total, answering 503 once they are spent"""
+    # milliseconds, None uses settings.QUERY_BUDGET_MS
+    query_budget_ms = None
+
+    def get_query_budget(self):
+        if self.query_budget_ms is None:
+            return settings.QUERY_BUDGET_MS
+        return self.query_budget_ms
+
+    def dispatch(self, request, *args, **kwargs):
+        budget = self.get_query_budget()
+        view = type(self).__name__
+        metrics.set('query_budget.budget_ms', budget, view=view)
+        start = time.monotonic()
+        self.query_deadline = start + budget / 1000
+        try:
+            with query_budget(budget):
+                return super().dispatch(request, *args, **kwargs)
+        finally:
+            metrics.observe(
+                'query_budget.elapsed_ms',
+                (time.monotonic() - start) * 1000,
+                view=view,
+            )
+
+    def budgeted(self, iterator):
+        """Iterate iterator within what is left of the budget of the
+        request, for the streamed responses whose queries run once
+        dispatch returned"""
+        remaining = (self.query_deadline - time.monotonic()) * 1000
+        try:
+            with query_budget(max(remaining, 0)):
+                yield from iterator
+        except Exception as exc:
+            if not isinstance(exc, QueryBudgetExceeded) and (
+                not is_query_canceled(exc)
+            ):
+                raise
+            # too late for a 503, the response is cut short
+            metrics.increment(
+                'query_budget.exceeded', view=type(self).__name__,
+            )
+            raise QueryBudgetExceeded() from exc
+
+    def handle_exception(self, exc):
+        if is_query_canceled(exc):
+            exc = QueryBudgetExceeded()
+        if isinstance(exc, QueryBudgetExceeded):
+            metrics.increment(
+                'query_budget.exceeded', view=type(self).__name__,
+            )
+        return super().handle_exception(exc)
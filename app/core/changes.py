@@ -0,0 +1,94 @@
+"""
+Per user change feed of recipes, tags and ingredients.
+
+Every write to a recipe, tag or ingredient, including relinking a recipe's
+tags and ingredients, moves the object to the end of its user's feed by
+giving it the next value of the core_change_seq sequence. Deletes leave a
+Tombstone at the end of the feed. recipe.sync reads the feed after a
+client's cursor.
+
+The value is taken while holding a per user advisory lock until the
+transaction ends, so the changes of one user commit in change_seq order
+and a client never moves its cursor past a change still to commit.
+"""
+from django.db.models import BigIntegerField, F, Func, Value
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from core.models import Ingredient, Recipe, Tag, Tombstone
+
+# first key of the advisory locks, the second one is the user id
+LOCK_NAMESPACE = 0x63686773
+
+
+class NextChangeSeq(Func):
+    """Next position in the change feed of the user expression"""
+    template = (
+        "(SELECT nextval('core_change_seq') FROM pg_advisory_xact_lock("
+        f"{LOCK_NAMESPACE}, mod(%(expressions)s, 2147483647)::integer))"
+    )
+    output_field = BigIntegerField()
+
+
+def _relation(model):
+    """Return the recipe relation holding objects of model"""
+    return 'tags' if model is Tag else 'ingredients'
+
+
+def touch(queryset):
+    """Move the objects in queryset to the end of their user's feed"""
+    queryset.update(change_seq=NextChangeSeq(F('user_id')))
+
+
+@receiver(pre_save, sender=Recipe)
+@receiver(pre_save, sender=Tag)
+@receiver(pre_save, sender=Ingredient)
+def assign_change_seq(sender, instance, **kwargs):
+    # the value is only known to the database, refresh_from_db() reads it
+    instance.change_seq = NextChangeSeq(Value(instance.user_id))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def touch_relinked_recipes(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            touch(Recipe.objects.filter(pk=instance.pk))
+    elif action in ('post_add', 'post_remove'):
+        touch(Recipe.objects.filter(pk__in=pk_set))
+    elif action == 'pre_clear':
+        # the links are gone after the clear, find the recipes now
+        touch(Recipe.objects.filter(**{_relation(type(instance)): instance}))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def touch_embedding_recipes(sender, instance, created, **kwargs):
+    # recipes embed the name of their tags and ingredients
+    if not created:
+        touch(Recipe.objects.filter(**{_relation(sender): instance}))
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def touch_unlinked_recipes(sender, instance, **kwargs):
+    touch(Recipe.objects.filter(**{_relation(sender): instance}))
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def record_tombstone(sender, instance, **kwargs):
+    Tombstone.objects.create(
+        user_id=instance.user_id,
+        kind=sender._meta.model_name,
+        object_id=instance.pk,
+        change_seq=NextChangeSeq(Value(instance.user_id)),
+    )
@@ -0,0 +1,35 @@
+"""
+Work gathered over a transaction and done once it commits
+"""
+import threading
+
+from django.db import transaction
+
+
+class CommitBatch:
+    """Items added during a transaction, handed together to flush once it
+    commits. Every add registers an on_commit callback; the first one to
+    run flushes the items of the transaction and the others find nothing
+    left. The items are kept per thread and database, and the ones added
+    in a rolled back transaction go with the next commit, so flush must
+    tolerate items that turned out unchanged"""
+
+    def __init__(self, flush):
+        self.flush = flush
+        self.local = threading.local()
+
+    def add(self, items, using=None):
+        """Flush items once the current transaction commits, or at once
+        outside of a transaction"""
+        connection = transaction.get_connection(using)
+        if not connection.in_atomic_block:
+            self.flush(set(items))
+            return
+        alias = connection.alias
+        self.local.__dict__.setdefault(alias, set()).update(items)
+        transaction.on_commit(lambda: self._commit(alias), using=alias)
+
+    def _commit(self, alias):
+        items = self.local.__dict__.pop(alias, None)
+        if items:
+            self.flush(items)
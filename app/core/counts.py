@@ -0,0 +1,140 @@
+"""
+Denormalized recipe counts on tags and ingredients
+"""
+from collections import Counter
+
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import m2m_changed, post_delete, pre_delete
+from django.dispatch import receiver
+
+from core.changes import NextChangeSeq
+from core.models import Ingredient, Recipe, Tag
+
+# recipe relation name for each model keeping a recipe_count
+COUNTED_RELATIONS = {
+    Tag: 'tags',
+    Ingredient: 'ingredients',
+}
+
+
+def _through(model):
+    """Return the recipe through model for model and its column"""
+    field = Recipe._meta.get_field(COUNTED_RELATIONS[model])
+    return field.remote_field.through, f'{model._meta.model_name}_id'
+
+
+def change_recipe_counts(model, counts, sign):
+    """Add (sign=1) or subtract (sign=-1) counts, a mapping of object id
+    to number of links, with one UPDATE per distinct amount"""
+    ids_by_amount = {}
+    for pk, amount in counts.items():
+        ids_by_amount.setdefault(amount, []).append(pk)
+    for amount, ids in ids_by_amount.items():
+        if sign > 0:
+            recipe_count = F('recipe_count') + amount
+        else:
+            # never go below zero, reconcile_recipe_counts fixes any drift
+            recipe_count = Greatest(F('recipe_count') - amount, 0)
+        # the count is part of the object's representation in the feed
+        model.objects.filter(id__in=ids).update(
+            recipe_count=recipe_count,
+            change_seq=NextChangeSeq(F('user_id')),
+        )
+
+
+def _linked_ids(through, column, instance, reverse, pk_set):
+    """Return the ids of the counted objects on the links about to be
+    removed, once per link"""
+    if reverse:
+        links = through.objects.filter(**{column: instance.pk})
+        if pk_set is not None:
+            links = links.filter(recipe_id__in=pk_set)
+    else:
+        links = through.objects.filter(recipe_id=instance.pk)
+        if pk_set is not None:
+            links = links.filter(**{f'{column}__in': pk_set})
+    return list(links.values_list(column, flat=True))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def update_recipe_counts(sender, instance, action, reverse, model, pk_set,
+                         **kwargs):
+    """Keep recipe_count in step with links added and removed through
+    recipe.tags / tag.recipe_set and the ingredient equivalents"""
+    counted = type(instance) if reverse else model
+    through, column = _through(counted)
+    removed = instance.__dict__.setdefault('_removed_recipe_links', {})
+
+    if action == 'post_add':
+        if reverse:
+            counts = {instance.pk: len(pk_set)}
+        else:
+            counts = Counter(pk_set)
+        change_recipe_counts(counted, counts, 1)
+    elif action in ('pre_remove', 'pre_clear'):
+        # pk_set can name objects that are not linked, so look up which
+        # links are actually going away before they are deleted
+        removed[sender] = _linked_ids(
+            through, column, instance, reverse, pk_set,
+        )
+    elif action in ('post_remove', 'post_clear'):
+        ids = removed.pop(sender, [])
+        change_recipe_counts(counted, Counter(ids), -1)
+
+
+@receiver(pre_delete, sender=Recipe)
+def collect_recipe_links(sender, instance, **kwargs):
+    """Remember the links of a recipe before the delete removes them"""
+    instance._deleted_recipe_links = {
+        model: _linked_ids(*_through(model), instance, False, None)
+        for model in COUNTED_RELATIONS
+    }
+
+
+@receiver(post_delete, sender=Recipe)
+def release_recipe_links(sender, instance, **kwargs):
+    """Decrement the counts of the tags and ingredients of a deleted
+    recipe"""
+    links = instance.__dict__.pop('_deleted_recipe_links', {})
+    for model, ids in links.items():
+        change_recipe_counts(model, Counter(ids), -1)
+
+
+def _actual_count(model):
+    """Return the expression counting the recipes of an object of model"""
+    through, column = _through(model)
+    linked = through.objects.filter(
+        **{column: OuterRef('pk')}
+    ).order_by().values(column).annotate(count=Count('pk')).values('count')
+    return Coalesce(Subquery(linked), 0)
+
+
+def recount_recipe_counts(model, ids):
+    """Count the recipes of the objects of model with the ids again,
+    after their links changed without going through the m2m signals"""
+    model.objects.filter(pk__in=ids).update(
+        recipe_count=_actual_count(model),
+        change_seq=NextChangeSeq(F('user_id')),
+    )
+
+
+def reconcile_recipe_counts(model, ids=None):
+    """Recount the recipes of every object of model, or of the ones with
+    the ids, whose recipe_count drifted, return how many were fixed"""
+    actual = _actual_count(model)
+    objects = model.objects.all()
+    if ids is not None:
+        objects = objects.filter(pk__in=ids)
+    drifted = list(
+        objects.annotate(actual=actual).exclude(
+            recipe_count=F('actual')
+        ).values_list('pk', flat=True)
+    )
+    if drifted:
+        model.objects.filter(pk__in=drifted).update(
+            recipe_count=actual,
+            change_seq=NextChangeSeq(F('user_id')),
+        )
+    return len(drifted)
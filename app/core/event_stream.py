@@ -0,0 +1,220 @@
+"""
+Server-Sent Events stream of the change events of core.events.
+
+Each worker process listens on the events channel with a single database
+connection and fans the notifications out to the open streams of their
+user, so a write made through any worker reaches every stream. Served
+from app.asgi in front of the django application.
+"""
+import asyncio
+
+import orjson
+import psycopg2
+import psycopg2.extensions
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connections
+from rest_framework.authtoken.models import Token
+
+from core.events import CHANNEL
+
+# sent when events may have been missed, the client syncs to catch up
+RESYNC = {'type': 'resync'}
+
+
+class NotificationHub:
+    """Listen on the events channel while any stream is open and queue
+    each event for the streams of its user"""
+
+    def __init__(self):
+        self.streams = {}
+        self.connection = None
+        self.loop = None
+        self.reconnect = None
+
+    def subscribe(self, user_id):
+        """Return the queue receiving the events of user_id"""
+        if self.connection is None and self.reconnect is None:
+            self.loop = asyncio.get_running_loop()
+            self._listen()
+        queue = asyncio.Queue(maxsize=settings.EVENT_STREAM_QUEUE_SIZE)
+        self.streams.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        queues = self.streams.get(user_id, set())
+        queues.discard(queue)
+        if not queues:
+            self.streams.pop(user_id, None)
+        if not self.streams:
+            self._close()
+
+    def _listen(self):
+        self.reconnect = None
+        params = connections['default'].get_connection_params()
+        try:
+            conn = psycopg2.connect(**params)
+            conn.set_isolation_level(
+                psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT,
+            )
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN {CHANNEL}')
+        except psycopg2.Error:
+            self._retry()
+            return
+        self.connection = conn
+        self.loop.add_reader(conn.fileno(), self._read)
+
+    def _read(self):
+        try:
+            self.connection.poll()
+        except psycopg2.Error:
+            # events sent until we listen again are lost
+            self._close()
+            self._broadcast(RESYNC)
+            self._retry()
+            return
+        notifies = self.connection.notifies
+        while notifies:
+            event = orjson.loads(notifies.pop(0).payload)
+            for queue in self.streams.get(event.pop('user'), ()):
+                self._put(queue, event)
+
+    def _retry(self):
+        self.reconnect = self.loop.call_later(
+            settings.EVENT_STREAM_RECONNECT, self._listen,
+        )
+
+    def _close(self):
+        if self.reconnect is not None:
+            self.reconnect.cancel()
+            self.reconnect = None
+        if self.connection is not None:
+            self.loop.remove_reader(self.connection.fileno())
+            self.connection.close()
+            self.connection = None
+
+    def _broadcast(self, event):
+        for queues in self.streams.values():
+            for queue in queues:
+                self._put(queue, event)
+
+    def _put(self, queue, event):
+        if queue.full():
+            # a stream that can't keep up resyncs instead
+            while not queue.empty():
+                queue.get_nowait()
+            event = RESYNC
+        queue.put_nowait(event)
+
+
+hub = NotificationHub()
+
+
+def _get_user_id(key):
+    """Return the id of the active user owning the token key"""
+    try:
+        return Token.objects.filter(
+            key=key, user__is_active=True,
+        ).values_list('user_id', flat=True).first()
+    finally:
+        close_old_connections()
+
+
+async def _authenticate(scope):
+    """Return the id of the user of the Authorization header"""
+    headers = dict(scope['headers'])
+    parts = headers.get(b'authorization', b'').split()
+    if len(parts) != 2 or parts[0].lower() != b'token':
+        return None
+    return await sync_to_async(_get_user_id)(parts[1].decode('latin-1'))
+
+
+async def _respond(send, status, headers=()):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': list(headers),
+    })
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+def format_event(event):
+    """Return event in the text/event-stream format"""
+    return b'event: change\ndata: ' + orjson.dumps(event) + b'\n\n'
+
+
+async def event_stream(scope, receive, send):
+    """ASGI application streaming the change events of the user"""
+    if scope['method'] != 'GET':
+        await _respond(send, 405, [(b'allow', b'GET')])
+        return
+    user_id = await _authenticate(scope)
+    if user_id is None:
+        await _respond(send, 401, [(b'www-authenticate', b'Token')])
+        return
+
+    async def wait_for_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    queue = hub.subscribe(user_id)
+    disconnected = asyncio.ensure_future(wait_for_disconnect())
+    next_event = None
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                # stop nginx buffering the events
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': f'retry: {settings.EVENT_STREAM_RETRY_MS}\n\n'.encode(),
+            'more_body': True,
+        })
+        while True:
+            if next_event is None:
+                next_event = asyncio.ensure_future(queue.get())
+            await asyncio.wait(
+                [next_event, disconnected],
+                timeout=settings.EVENT_STREAM_HEARTBEAT,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if disconnected.done():
+                break
+            if next_event.done():
+                body = format_event(next_event.result())
+                next_event = None
+            else:
+                # keep proxies from closing an idle connection
+                body = b': keepalive\n\n'
+            await send({
+                'type': 'http.response.body',
+                'body': body,
+                'more_body': True,
+            })
+    finally:
+        for task in (next_event, disconnected):
+            if task is not None:
+                task.cancel()
+        hub.unsubscribe(user_id, queue)
+
+
+def with_event_stream(application):
+    """Wrap the ASGI application to serve the event stream on
+    settings.EVENT_STREAM_PATH"""
+
+    async def route(scope, receive, send):
+        if scope['type'] == 'http' and (
+            scope['path'] == settings.EVENT_STREAM_PATH
+        ):
+            await event_stream(scope, receive, send)
+        else:
+            await application(scope, receive, send)
+
+    return route
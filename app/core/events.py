@@ -0,0 +1,81 @@
+"""
+Change events of recipes, tags and ingredients.
+
+Writes publish an event through Postgres NOTIFY on the recipe_events
+channel. The notification is part of the writing transaction, so events
+of rolled back writes are never seen, and Postgres delivers identical
+events of one transaction only once. core.event_stream streams them to
+the clients of the user.
+"""
+import orjson
+from django.db import connection
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from core.models import Ingredient, Recipe, Tag
+
+CHANNEL = 'recipe_events'
+
+
+def publish(user_id, obj_type, object_id, action):
+    """Send the event of object_id of obj_type to the streams of user_id"""
+    publish_many(user_id, obj_type, [object_id], action)
+
+
+def publish_many(user_id, obj_type, object_ids, action):
+    """Send the events of the objects of obj_type with object_ids to the
+    streams of user_id with one statement"""
+    payloads = [
+        orjson.dumps({
+            'user': user_id,
+            'type': obj_type,
+            'id': object_id,
+            'action': action,
+        }).decode()
+        for object_id in object_ids
+    ]
+    if not payloads:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) payload',
+            [CHANNEL, payloads],
+        )
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def object_saved(sender, instance, created, **kwargs):
+    # image uploads save the recipe, so they are published here too
+    publish(
+        instance.user_id,
+        sender._meta.model_name,
+        instance.pk,
+        'created' if created else 'updated',
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def object_deleted(sender, instance, **kwargs):
+    publish(instance.user_id, sender._meta.model_name, instance.pk, 'deleted')
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_relinked(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            publish(instance.user_id, 'recipe', instance.pk, 'updated')
+        return
+    if action in ('post_add', 'post_remove'):
+        recipe_ids = pk_set
+    elif action == 'pre_clear':
+        # the links are gone after the clear, find the recipes now
+        recipe_ids = instance.recipe_set.values_list('id', flat=True)
+    else:
+        return
+    for recipe_id in recipe_ids:
+        publish(instance.user_id, 'recipe', recipe_id, 'updated')
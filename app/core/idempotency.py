@@ -0,0 +1,169 @@
+"""
+Idempotency-Key support for API writes.
+
+A client retrying a request with the same Idempotency-Key header gets the
+response of the first attempt back instead of repeating its writes.
+"""
+import functools
+import hashlib
+import zlib
+
+import orjson
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
+from django.utils import timezone
+from drf_spectacular.utils import OpenApiParameter, OpenApiTypes
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.response import Response
+
+from core.models import IdempotencyKey
+from core.renderers import ORJSONRenderer
+
+HEADER = 'Idempotency-Key'
+
+# documents the header on the operations decorated with idempotent
+IDEMPOTENCY_PARAMETERS = [
+    OpenApiParameter(
+        HEADER,
+        OpenApiTypes.STR,
+        OpenApiParameter.HEADER,
+        description=(
+            'Unique key of the request, retries sent with the same key '
+            'get the response of the first attempt'
+        ),
+    ),
+]
+
+
+class IdempotencyConflict(APIException):
+    """Another attempt with the same key is still running"""
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = (
+        'A request with this Idempotency-Key is in progress, retry later.'
+    )
+    default_code = 'idempotency_conflict'
+
+
+class IdempotencyKeyReused(APIException):
+    """The key was used before for a different request"""
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = (
+        'This Idempotency-Key was used for a different request.'
+    )
+    default_code = 'idempotency_key_reused'
+
+
+def get_scope(request):
+    """Return who sent the request to which endpoint"""
+    if request.user and request.user.is_authenticated:
+        sender = f'user:{request.user.pk}'
+    else:
+        sender = 'anonymous'
+    return f'{sender}:{request.method}:{request.path}'
+
+
+def get_fingerprint(request):
+    """Return a hash of the URL and the request body"""
+    digest = hashlib.sha256(request.get_full_path().encode())
+    if request.content_type.startswith('multipart/'):
+        # uploads are not held in memory whole, so hash the parsed parts
+        for name, values in sorted(request.data.lists()):
+            digest.update(name.encode())
+            for value in values:
+                if isinstance(value, UploadedFile):
+                    for chunk in value.chunks():
+                        digest.update(chunk)
+                    value.seek(0)
+                else:
+                    digest.update(str(value).encode())
+    else:
+        digest.update(request.body)
+    return digest.hexdigest()
+
+
+def claim(scope, key, fingerprint):
+    """Claim the key for this attempt, return the stored record when an
+    earlier attempt already succeeded"""
+    now = timezone.now()
+    record, created = IdempotencyKey.objects.get_or_create(
+        scope=scope,
+        key=key,
+        defaults={'fingerprint': fingerprint, 'claimed': now},
+    )
+    if created:
+        return None
+    if record.created < now - settings.IDEMPOTENCY_KEY_TTL:
+        # expired but not purged yet, start over
+        record.delete()
+        return claim(scope, key, fingerprint)
+    if record.fingerprint != fingerprint:
+        raise IdempotencyKeyReused()
+    if record.status_code is not None:
+        return record
+
+    # take over the claim of an attempt that died, unless another retry
+    # took it over first
+    stale = now - settings.IDEMPOTENCY_CLAIM_TIMEOUT
+    if record.claimed >= stale or not IdempotencyKey.objects.filter(
+        pk=record.pk, claimed=record.claimed, status_code__isnull=True,
+    ).update(claimed=now):
+        raise IdempotencyConflict()
+    return None
+
+
+def replay(record):
+    """Return the response stored in record"""
+    data = orjson.loads(zlib.decompress(record.response))
+    response = Response(data, status=record.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view_method):
+    """Make a view method honour the Idempotency-Key header. Successful
+    responses are stored with the writes of the request, in the same
+    transaction, and replayed to retries"""
+
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > IdempotencyKey._meta.get_field('key').max_length:
+            raise ValidationError({HEADER: ['The key is too long.']})
+
+        scope = get_scope(request)
+        record = claim(scope, key, get_fingerprint(request))
+        if record is not None:
+            return replay(record)
+
+        try:
+            with transaction.atomic():
+                response = view_method(self, request, *args, **kwargs)
+                if status.is_success(response.status_code):
+                    content = ORJSONRenderer().render(response.data)
+                    IdempotencyKey.objects.filter(
+                        scope=scope, key=key,
+                    ).update(
+                        status_code=response.status_code,
+                        response=zlib.compress(content),
+                    )
+                    return response
+        except Exception:
+            IdempotencyKey.objects.filter(scope=scope, key=key).delete()
+            raise
+        # let the client retry a failed request with the same key
+        IdempotencyKey.objects.filter(scope=scope, key=key).delete()
+        return response
+
+    return wrapper
+
+
+def purge_expired_keys():
+    """Delete the keys older than settings.IDEMPOTENCY_KEY_TTL, return how
+    many were deleted"""
+    cutoff = timezone.now() - settings.IDEMPOTENCY_KEY_TTL
+    deleted, _ = IdempotencyKey.objects.filter(created__lt=cutoff).delete()
+    return deleted
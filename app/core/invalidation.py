@@ -0,0 +1,318 @@
+"""
+Cross process invalidation of in-process caches.
+
+Writes to recipes, tags, ingredients and users publish the keys they make
+stale once their transaction commits. Every process listening on the bus
+drops the entries of its LocalCaches under those keys. The bus goes
+through Postgres LISTEN/NOTIFY, reaching every node, or through unix
+datagram sockets in INVALIDATION_SOCKET_DIR, reaching the processes of
+one node where LISTEN is not available (e.g. behind a transaction pooler).
+"""
+import os
+import select
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import orjson
+import psycopg2
+import psycopg2.extensions
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, connections
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from core.commits import CommitBatch
+from core.metrics import metrics
+from core.models import Ingredient, Recipe, Tag
+
+CHANNEL = 'cache_invalidation'
+# keys per message, keeping NOTIFY payloads below their 8000 bytes limit
+CHUNK_SIZE = 100
+
+
+def object_key(model, pk):
+    """Return the key of a single object"""
+    return f'{model._meta.model_name}:{pk}'
+
+
+def user_key(model, user_id):
+    """Return the key of the objects of model owned by a user"""
+    return f'{model._meta.model_name}:user:{user_id}'
+
+
+class PostgresTransport:
+    """Messages sent with NOTIFY to the processes of every node"""
+
+    def publish(self, message):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, message])
+
+    def listen(self, deliver, lost):
+        """Call deliver with every message, and lost whenever messages
+        may have been missed, until the process exits"""
+        while True:
+            try:
+                conn = psycopg2.connect(
+                    **connections['default'].get_connection_params()
+                )
+            except psycopg2.Error:
+                time.sleep(settings.INVALIDATION_RECONNECT)
+                continue
+            try:
+                conn.set_isolation_level(
+                    psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT,
+                )
+                with conn.cursor() as cursor:
+                    cursor.execute(f'LISTEN {CHANNEL}')
+                # messages sent before we listened were missed
+                lost()
+                while True:
+                    select.select([conn], [], [])
+                    conn.poll()
+                    while conn.notifies:
+                        deliver(conn.notifies.pop(0).payload)
+            except psycopg2.Error:
+                time.sleep(settings.INVALIDATION_RECONNECT)
+            finally:
+                conn.close()
+
+
+class SocketTransport:
+    """Messages sent as datagrams to the socket every process of the node
+    binds in INVALIDATION_SOCKET_DIR"""
+
+    def __init__(self):
+        self.directory = settings.INVALIDATION_SOCKET_DIR
+
+    def publish(self, message):
+        sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sender.setblocking(False)
+        try:
+            # no process listening yet when the directory doesn't exist
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            names = []
+        try:
+            for name in names:
+                path = os.path.join(self.directory, name)
+                try:
+                    sender.sendto(message.encode(), path)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # the process is gone, clean up after it
+                    try:
+                        os.unlink(path)
+                    except FileNotFoundError:
+                        pass
+                except BlockingIOError:
+                    metrics.increment('invalidation.dropped')
+        finally:
+            sender.close()
+
+    def listen(self, deliver, lost):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'{os.getpid()}.sock')
+        if os.path.exists(path):
+            os.unlink(path)
+        receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        receiver.bind(path)
+        lost()
+        while True:
+            deliver(receiver.recv(65536).decode())
+
+
+class LocalCache:
+    """Memoization in this process, entries are dropped when the
+    invalidation bus delivers their key. The least recently used entries
+    are dropped once their sizes add up to more than maxsize, sizeof
+    giving the size of a value, 1 by default"""
+
+    def __init__(self, maxsize=1024, sizeof=None):
+        self.maxsize = maxsize
+        self.sizeof = sizeof or (lambda value: 1)
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.size = 0
+        # bumped by every invalidation, values computed across one are
+        # not stored as they may be stale already
+        self.generation = 0
+        bus.register(self)
+
+    def get_or_set(self, key, compute):
+        """Return the value stored under key, computing and storing it
+        when missing"""
+        # caches are usually created on import, before the fork of the
+        # workers, so every worker starts listening on first use
+        bus.start()
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+            generation = self.generation
+        value = compute()
+        size = self.sizeof(value)
+        with self.lock:
+            if generation == self.generation:
+                self._pop(key)
+                self.entries[key] = value
+                self.sizes[key] = size
+                self.size += size
+                # a value larger than maxsize doesn't stay either
+                while self.size > self.maxsize:
+                    self._pop(next(iter(self.entries)))
+        return value
+
+    def _pop(self, key):
+        if key in self.entries:
+            del self.entries[key]
+            self.size -= self.sizes.pop(key)
+
+    def invalidate(self, keys):
+        with self.lock:
+            self.generation += 1
+            for key in keys:
+                self._pop(key)
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+            self.sizes.clear()
+            self.size = 0
+
+
+class InvalidationBus:
+    """Publishes stale keys to every process and applies the ones
+    received to the LocalCaches of this one"""
+
+    def __init__(self):
+        self.caches = []
+        self.lock = threading.Lock()
+        self.pid = None
+        # set once this process listens on the bus
+        self.listening = threading.Event()
+        # keys of the current transaction to send once it commits
+        self.pending = CommitBatch(lambda keys: self.send(sorted(keys)))
+
+    def get_transport(self):
+        kind = settings.INVALIDATION_BUS
+        if kind == 'postgres':
+            return PostgresTransport()
+        if kind == 'socket':
+            return SocketTransport()
+        raise ValueError(f'Unknown INVALIDATION_BUS "{kind}"')
+
+    def register(self, cache):
+        with self.lock:
+            self.caches.append(cache)
+
+    def start(self):
+        """Listen on the bus from a thread of this process, once per
+        process as threads don't survive the fork of a worker"""
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.listening.clear()
+            # tells our own messages apart, pids repeat across nodes
+            self.origin = uuid.uuid4().hex
+        threading.Thread(
+            target=self.get_transport().listen,
+            args=(self._deliver, self._lost),
+            daemon=True,
+        ).start()
+
+    def publish(self, keys):
+        """Publish keys once the current transaction commits"""
+        self.pending.add(keys)
+
+    def send(self, keys):
+        # this process must not serve the stale entries until its own
+        # message comes back
+        self._invalidate(keys)
+        transport = self.get_transport()
+        for start in range(0, len(keys), CHUNK_SIZE):
+            transport.publish(orjson.dumps({
+                'keys': keys[start:start + CHUNK_SIZE],
+                'sent': time.time(),
+                'origin': getattr(self, 'origin', None),
+            }).decode())
+            metrics.increment('invalidation.published')
+
+    def _deliver(self, payload):
+        message = orjson.loads(payload)
+        metrics.increment('invalidation.received')
+        metrics.observe(
+            'invalidation.lag_ms', (time.time() - message['sent']) * 1000,
+        )
+        if message['origin'] != self.origin:
+            self._invalidate(message['keys'])
+
+    def _lost(self):
+        # anything cached may have missed its invalidation
+        metrics.increment('invalidation.resets')
+        for cache in list(self.caches):
+            cache.clear()
+        self.listening.set()
+
+    def _invalidate(self, keys):
+        for cache in list(self.caches):
+            cache.invalidate(keys)
+
+
+bus = InvalidationBus()
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def user_object_changed(sender, instance, **kwargs):
+    keys = [
+        object_key(sender, instance.pk),
+        user_key(sender, instance.user_id),
+    ]
+    if sender is not Recipe:
+        # recipes embed their tags and ingredients
+        keys.append(user_key(Recipe, instance.user_id))
+    bus.publish(keys)
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def user_changed(sender, instance, **kwargs):
+    bus.publish([object_key(sender, instance.pk)])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_relinked(sender, instance, action, reverse, model, pk_set,
+                    **kwargs):
+    if action == 'pre_clear':
+        # the links are gone after the clear, find the linked objects now
+        if reverse:
+            linked = instance.recipe_set
+        else:
+            linked = getattr(
+                instance, 'tags' if model is Tag else 'ingredients',
+            )
+        pk_set = linked.values_list('pk', flat=True)
+    elif action not in ('post_add', 'post_remove'):
+        return
+    recipe, related = (model, type(instance)) if reverse else (
+        type(instance), model,
+    )
+    # every side of the link changes, related ones in their recipe_count
+    keys = {
+        user_key(recipe, instance.user_id),
+        user_key(related, instance.user_id),
+        object_key(type(instance), instance.pk),
+    }
+    keys.update(object_key(model, pk) for pk in pk_set)
+    bus.publish(sorted(keys))
@@ -0,0 +1,262 @@
+"""
+Background jobs queued in Postgres.
+
+Functions decorated with @task are queued as Job rows within the
+transaction enqueueing them, so the job of a rolled back write never
+runs. The run_jobs workers claim the due jobs with SELECT ... FOR UPDATE
+SKIP LOCKED, the highest priority first, so any number of workers share
+the queues without a broker. JOB_QUEUES limits how many jobs of a queue
+run at once across all workers. A failing job is retried with exponential
+backoff until it ran out of attempts, and a job running for longer than
+JOB_TIMEOUT is taken for the job of a crashed worker and queued again.
+"""
+import functools
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from core.metrics import metrics
+from core.models import Job
+
+# first key of the advisory locks serializing the claims of a queue with
+# a concurrency limit, the second one is the hash of the queue name
+LOCK_NAMESPACE = 0x6a6f6273
+
+# registered tasks by name
+tasks = {}
+
+
+class Task:
+    """Function that can run as a background job"""
+
+    def __init__(self, func, name, queue, priority, max_attempts):
+        functools.update_wrapper(self, func)
+        self.func = func
+        self.name = name
+        self.queue = queue
+        self.priority = priority
+        self.max_attempts = max_attempts
+
+    def __call__(self, **kwargs):
+        return self.func(**kwargs)
+
+    def enqueue(self, priority=None, delay=None, **kwargs):
+        """Queue a run of the function with kwargs, which must be JSON
+        serializable. Workers see the job once the current transaction
+        commits"""
+        return Job.objects.create(
+            name=self.name,
+            kwargs=kwargs,
+            queue=self.queue,
+            priority=self.priority if priority is None else priority,
+            run_at=timezone.now() + (delay or timedelta()),
+            max_attempts=self.max_attempts,
+        )
+
+
+def task(name=None, queue='default', priority=0, max_attempts=None):
+    """Register the decorated function as a task the workers can run"""
+    def decorator(func):
+        registered = Task(
+            func,
+            name or f'{func.__module__}.{func.__name__}',
+            queue,
+            priority,
+            max_attempts or settings.JOB_MAX_ATTEMPTS,
+        )
+        tasks[registered.name] = registered
+        return registered
+    return decorator
+
+
+def _retry_delay(attempts):
+    """Return the delay before retrying a job that failed attempts times"""
+    delay = min(
+        settings.JOB_RETRY_DELAY * 2 ** (attempts - 1),
+        settings.JOB_RETRY_MAX_DELAY,
+    )
+    # spread the retries of jobs that failed together
+    return timedelta(seconds=random.uniform(delay / 2, delay))
+
+
+def claim(worker, queues):
+    """Mark the next due job of queues as run by worker and return it,
+    None when no job is due"""
+    now = timezone.now()
+    for queue in queues:
+        limit = settings.JOB_QUEUES.get(queue)
+        with transaction.atomic():
+            if limit is not None:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        'SELECT pg_advisory_xact_lock(%s, hashtext(%s))',
+                        [LOCK_NAMESPACE, queue],
+                    )
+                running = Job.objects.filter(
+                    queue=queue, status=Job.RUNNING,
+                ).count()
+                if running >= limit:
+                    continue
+            job = Job.objects.select_for_update(skip_locked=True).filter(
+                queue=queue, status=Job.QUEUED, run_at__lte=now,
+            ).order_by('-priority', 'run_at', 'pk').first()
+            if job is None:
+                continue
+            job.status = Job.RUNNING
+            job.locked_by = worker
+            job.locked_at = now
+            job.attempts += 1
+            job.save(update_fields=[
+                'status', 'locked_by', 'locked_at', 'attempts',
+            ])
+            return job
+    return None
+
+
+def _finish(job, **fields):
+    """Record the outcome of job unless it was taken from its worker in
+    the meantime"""
+    return Job.objects.filter(
+        pk=job.pk, status=Job.RUNNING, locked_by=job.locked_by,
+    ).update(locked_by='', locked_at=None, **fields)
+
+
+def run(job):
+    """Run the claimed job and record its outcome"""
+    labels = {'queue': job.queue, 'task': job.name}
+    metrics.observe(
+        'jobs.wait_ms',
+        (job.locked_at - job.run_at).total_seconds() * 1000,
+        **labels,
+    )
+    started = time.monotonic()
+    try:
+        if job.name not in tasks:
+            raise LookupError(f'No task is registered as "{job.name}"')
+        tasks[job.name].func(**job.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            _finish(
+                job,
+                status=Job.QUEUED,
+                run_at=timezone.now() + _retry_delay(job.attempts),
+                last_error=error,
+            )
+            metrics.increment('jobs.retried', **labels)
+        else:
+            _finish(
+                job,
+                status=Job.FAILED,
+                finished=timezone.now(),
+                last_error=error,
+            )
+            metrics.increment('jobs.failed', **labels)
+    else:
+        _finish(job, status=Job.DONE, finished=timezone.now())
+        metrics.increment('jobs.done', **labels)
+    finally:
+        metrics.observe(
+            'jobs.duration_ms', (time.monotonic() - started) * 1000, **labels,
+        )
+
+
+def requeue_stale():
+    """Queue the jobs of crashed workers again, or fail the ones out of
+    attempts, return how many were found"""
+    now = timezone.now()
+    stale = Job.objects.filter(
+        status=Job.RUNNING, locked_at__lt=now - settings.JOB_TIMEOUT,
+    )
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED,
+        locked_by='',
+        locked_at=None,
+        finished=now,
+        last_error='Timed out',
+    )
+    requeued = stale.update(
+        status=Job.QUEUED,
+        locked_by='',
+        locked_at=None,
+        run_at=now,
+        last_error='Timed out',
+    )
+    metrics.increment('jobs.timed_out', failed + requeued)
+    return failed + requeued
+
+
+def delete_finished():
+    """Delete a batch of the jobs finished for longer than JOB_RETENTION,
+    return how many were deleted"""
+    ids = list(Job.objects.filter(
+        status__in=[Job.DONE, Job.FAILED],
+        finished__lt=timezone.now() - settings.JOB_RETENTION,
+    ).values_list('pk', flat=True)[:1000])
+    deleted, _ = Job.objects.filter(pk__in=ids).delete()
+    return deleted
+
+
+def record_queue_metrics():
+    """Set the gauges of the number of jobs per queue and status and of
+    how late the most overdue job of each queue is"""
+    counts = {
+        (queue, status): 0
+        for queue in settings.JOB_QUEUES for status, _ in Job.STATUS_CHOICES
+    }
+    for row in Job.objects.values('queue', 'status').annotate(
+        count=Count('pk'),
+    ).order_by():
+        counts[row['queue'], row['status']] = row['count']
+    for (queue, status), count in counts.items():
+        metrics.set('jobs.count', count, queue=queue, status=status)
+    now = timezone.now()
+    for row in Job.objects.filter(
+        status=Job.QUEUED, run_at__lte=now,
+    ).values('queue').annotate(oldest=Min('run_at')).order_by():
+        metrics.set(
+            'jobs.lag_ms',
+            (now - row['oldest']).total_seconds() * 1000,
+            queue=row['queue'],
+        )
+
+
+def work(queues=None, burst=False, max_jobs=None, stop=None):
+    """Run the jobs of queues, every queue of JOB_QUEUES by default, until
+    stop (an Event) is set, or with burst until no job is due. Return how
+    many jobs ran"""
+    # the tasks are registered by the tasks modules of the apps
+    autodiscover_modules('tasks')
+    worker = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+    queues = queues or list(settings.JOB_QUEUES)
+    stop = stop or threading.Event()
+    ran = 0
+    while not stop.is_set() and (max_jobs is None or ran < max_jobs):
+        # like between requests, drop a broken or expired connection,
+        # unless the caller holds a transaction open on it (tests)
+        if not connection.in_atomic_block:
+            close_old_connections()
+        job = claim(worker, queues)
+        if job is not None:
+            run(job)
+            ran += 1
+            continue
+        # housekeeping while idle
+        requeue_stale()
+        delete_finished()
+        record_queue_metrics()
+        if burst:
+            break
+        stop.wait(settings.JOB_POLL_INTERVAL)
+    return ran
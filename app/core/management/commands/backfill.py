@@ -0,0 +1,85 @@
+"""
+Django command to run backfills of large tables
+"""
+import signal
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import backfill, tasks
+from core.models import BackfillProgress
+
+
+class Command(BaseCommand):
+    """Django command to run backfills, or list them with their progress"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'names',
+            nargs='*',
+            help='Backfills to run, lists every backfill when left out',
+        )
+        parser.add_argument(
+            '--background',
+            action='store_true',
+            help='Queue the backfills as background jobs',
+        )
+        parser.add_argument(
+            '--max-batches',
+            type=int,
+            help='Stop each backfill after this many batches',
+        )
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Start the backfills over from the first row',
+        )
+
+    def _describe(self, name, progress):
+        if progress is None:
+            return f'{name}: not started'
+        if progress.finished:
+            return f'{name}: done, {progress.rows} rows'
+        described = f'{name}: {progress.rows} rows'
+        if progress.total:
+            percent = min(100 * progress.rows // progress.total, 99)
+            described += f' of ~{progress.total} ({percent}%)'
+        return f'{described}, last id {progress.last_pk}'
+
+    def handle(self, *args, **options):
+        registered = backfill.discover()
+        if not options['names']:
+            checkpoints = BackfillProgress.objects.in_bulk(
+                list(registered), field_name='name',
+            )
+            for name in sorted(registered):
+                self.stdout.write(
+                    self._describe(name, checkpoints.get(name)),
+                )
+            return
+        missing = set(options['names']) - set(registered)
+        if missing:
+            raise CommandError(f'Unknown backfills: {", ".join(missing)}')
+
+        stop = threading.Event()
+        # finish the running batch before exiting
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: stop.set())
+        for name in options['names']:
+            if options['reset']:
+                backfill.reset(name)
+            if options['background']:
+                tasks.run_backfill.enqueue(name=name)
+                self.stdout.write(f'{name}: queued')
+                continue
+            backfill.run(
+                name,
+                max_batches=options['max_batches'],
+                stop=stop,
+                report=lambda progress: self.stdout.write(
+                    self._describe(progress.name, progress),
+                ),
+            )
+            if stop.is_set():
+                break
+        self.stdout.write(self.style.SUCCESS('Backfills ran'))
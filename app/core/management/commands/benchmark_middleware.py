@@ -0,0 +1,50 @@
+"""
+Django command to benchmark the middleware overhead of API requests
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from core.management.commands.benchmark_renderers import best_time
+
+# answered by DRF with a 401 before touching the database, so the time
+# is spent in the middleware and the framework
+PATH = '/api/recipe/tags/'
+
+
+class Command(BaseCommand):
+    """Django command to compare API requests through the full browser
+    middleware stack and through the lean API stack"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        count = options['requests']
+        client = Client()
+        # a logged in browser also sends its session and CSRF cookies
+        client.cookies['sessionid'] = 'benchmark'
+        client.cookies['csrftoken'] = 'benchmark'
+
+        def send_requests():
+            for _ in range(count):
+                client.get(PATH)
+
+        self.stdout.write(
+            f'Sending {count} requests to {PATH}, best of {options["repeat"]}'
+        )
+        stacks = [
+            ('full stack', ()),
+            ('api stack', settings.API_PATH_PREFIXES),
+        ]
+        for name, prefixes in stacks:
+            # the test client sends requests to the testserver host
+            with override_settings(
+                API_PATH_PREFIXES=prefixes,
+                ALLOWED_HOSTS=['testserver'],
+            ):
+                elapsed = best_time(send_requests, options['repeat'])
+            self.stdout.write(
+                f'{name:>16}: {elapsed * 1000 / count:8.1f} us per request'
+            )
@@ -0,0 +1,87 @@
+"""
+Django command to benchmark the JSON renderers on recipe list payloads
+"""
+import gzip
+import time
+from collections import OrderedDict
+from decimal import Decimal
+
+import brotli
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from core.renderers import ORJSONRenderer
+
+
+def sample_recipe_list(count, tag_count=20, ingredient_count=40):
+    """Return a list shaped like RecipeSerializer output for count
+    recipes sharing a small pool of tags and ingredients"""
+    tags = [
+        OrderedDict([('id', i), ('name', f'Tag {i}')])
+        for i in range(1, tag_count + 1)
+    ]
+    ingredients = [
+        OrderedDict([('id', i), ('name', f'Ingredient {i}')])
+        for i in range(1, ingredient_count + 1)
+    ]
+    recipes = []
+    for i in range(1, count + 1):
+        recipes.append(OrderedDict([
+            ('id', i),
+            ('title', f'Sample recipe {i}'),
+            ('time_minutes', 10 + i % 50),
+            # keep raw decimals so the renderers' decimal handling is timed
+            ('price', Decimal(f'{i % 100}.{i % 100:02d}')),
+            ('link', f'https://example.com/recipes/{i}.pdf'),
+            ('tags', [tags[(i + j) % tag_count] for j in range(3)]),
+            ('ingredients', [
+                ingredients[(i + j) % ingredient_count] for j in range(6)
+            ]),
+        ]))
+    return recipes
+
+
+def best_time(func, repeat):
+    """Return the fastest of repeat runs of func in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+class Command(BaseCommand):
+    """Django command to compare render time and bytes on the wire"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        data = sample_recipe_list(options['recipes'])
+        repeat = options['repeat']
+        self.stdout.write(f'Rendering {len(data)} recipes, best of {repeat}')
+
+        for renderer in [JSONRenderer(), ORJSONRenderer()]:
+            elapsed = best_time(lambda: renderer.render(data), repeat)
+            self.stdout.write(
+                f'{type(renderer).__name__:>16}: {elapsed:8.2f} ms'
+            )
+
+        body = ORJSONRenderer().render(data)
+        quality = settings.COMPRESSION_BROTLI_QUALITY
+        encodings = [
+            ('identity', lambda: body),
+            ('gzip', lambda: gzip.compress(body, compresslevel=6)),
+            (f'br q={quality}', lambda: brotli.compress(
+                body, quality=quality,
+            )),
+        ]
+        for name, encode in encodings:
+            elapsed = best_time(encode, repeat)
+            self.stdout.write(
+                f'{name:>16}: {len(encode()):8d} bytes '
+                f'{elapsed:8.2f} ms to encode'
+            )
@@ -0,0 +1,93 @@
+"""
+Django command to benchmark the recipe serializers against their readers
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.management.commands.benchmark_renderers import best_time
+from core.models import Ingredient, Recipe, Tag
+from recipe import readers, serializers
+
+
+class Rollback(Exception):
+    """Raised to roll the sample data back"""
+
+
+def create_sample_recipes(count, tag_count=20, ingredient_count=40):
+    """Create count recipes sharing a small pool of tags and ingredients"""
+    user = get_user_model().objects.create_user(
+        'benchmark@example.com', 'benchmark',
+    )
+    tags = Tag.objects.bulk_create([
+        Tag(user=user, name=f'Tag {i}') for i in range(tag_count)
+    ])
+    ingredients = Ingredient.objects.bulk_create([
+        Ingredient(user=user, name=f'Ingredient {i}')
+        for i in range(ingredient_count)
+    ])
+    recipes = Recipe.objects.bulk_create([
+        Recipe(
+            user=user,
+            title=f'Sample recipe {i}',
+            time_minutes=10 + i % 50,
+            price=Decimal(f'{i % 100}.{i % 100:02d}'),
+            link=f'https://example.com/recipes/{i}.pdf',
+        )
+        for i in range(count)
+    ])
+    Recipe.tags.through.objects.bulk_create([
+        Recipe.tags.through(
+            recipe_id=recipe.id, tag_id=tags[(i + j) % tag_count].id,
+        )
+        for i, recipe in enumerate(recipes) for j in range(3)
+    ])
+    Recipe.ingredients.through.objects.bulk_create([
+        Recipe.ingredients.through(
+            recipe_id=recipe.id,
+            ingredient_id=ingredients[(i + j) % ingredient_count].id,
+        )
+        for i, recipe in enumerate(recipes) for j in range(6)
+    ])
+
+
+class Command(BaseCommand):
+    """Django command to compare the time to represent recipes and tags
+    with the serializers and with the compiled readers"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        try:
+            with transaction.atomic():
+                create_sample_recipes(options['recipes'])
+                self.run(repeat)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, repeat):
+        recipes = Recipe.objects.order_by('-id')
+        tags = Tag.objects.order_by('-name')
+        self.stdout.write(
+            f'Representing {recipes.count()} recipes, best of {repeat}'
+        )
+        cases = [
+            ('RecipeSerializer', lambda: serializers.RecipeSerializer(
+                recipes.prefetch_related('tags', 'ingredients'),
+                many=True, context={},
+            ).data),
+            ('recipe_reader', lambda: readers.recipe_reader.read(recipes)),
+            ('TagSerializer', lambda: serializers.TagSerializer(
+                tags, many=True,
+            ).data),
+            ('tag_reader', lambda: readers.tag_reader.read(tags)),
+        ]
+        for name, represent in cases:
+            elapsed = best_time(represent, repeat)
+            self.stdout.write(f'{name:>16}: {elapsed:8.2f} ms')
@@ -0,0 +1,188 @@
+"""
+Django command to flag migrations likely to block writes for long
+"""
+import re
+
+from django.contrib.postgres.operations import (
+    AddIndexConcurrently,
+    RemoveIndexConcurrently,
+)
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, migrations
+from django.db.migrations.executor import MigrationExecutor
+
+from core.operations import AddConstraintNotValid
+
+# statements of RunSQL operations locking or rewriting existing rows
+RISKY_SQL = [
+    (
+        re.compile(r'\bCREATE\s+(UNIQUE\s+)?INDEX\s+(?!CONCURRENTLY)', re.I),
+        'builds an index blocking writes, use CREATE INDEX CONCURRENTLY',
+    ),
+    (
+        re.compile(r'\bADD\s+CONSTRAINT\b(?![^;]*\bNOT\s+VALID\b)', re.I),
+        'checks every row blocking writes, add the constraint NOT VALID',
+    ),
+    (
+        re.compile(r'\bALTER\s+COLUMN\b[^;]*\bTYPE\b', re.I),
+        'can rewrite the table blocking reads and writes',
+    ),
+    (
+        # statements, not ON UPDATE or FOR UPDATE clauses
+        re.compile(r'(?:^|;)\s*(UPDATE|DELETE\s+FROM)\b', re.I),
+        'changes rows on deploy, use a backfill',
+    ),
+]
+
+# statements of an AlterField that only change the catalog
+CATALOG_ONLY_SQL = re.compile(
+    r'^ALTER\s+TABLE\s+\S+\s+ALTER\s+COLUMN\s+\S+\s+'
+    r'(DROP\s+NOT\s+NULL|DROP\s+DEFAULT|SET\s+DEFAULT\b)',
+    re.I,
+)
+
+
+def _statements(sql):
+    """Return the SQL strings of a RunSQL sql argument"""
+    if isinstance(sql, str):
+        return [sql]
+    return [
+        statement[0] if isinstance(statement, (list, tuple)) else statement
+        for statement in sql
+    ]
+
+
+def _alter_sql(operation, app_label, from_state, to_state, connection):
+    """Return the statements operation would run"""
+    with connection.schema_editor(collect_sql=True, atomic=False) as editor:
+        operation.database_forwards(app_label, editor, from_state, to_state)
+    return editor.collected_sql
+
+
+def check_operation(operation, app_label, created, atomic, from_state=None,
+                    to_state=None, connection=None):
+    """Return why operation would block writes on an existing table, None
+    when it wouldn't. created holds the (app_label, model_name) of the
+    tables created by the migrations before. The project states around
+    the operation tell the AlterFields changing the table from the ones
+    only changing Django's view of it"""
+    model_name = getattr(operation, 'model_name', None) or getattr(
+        operation, 'name', None,
+    )
+    if isinstance(model_name, str) and (
+        app_label, model_name.lower()
+    ) in created:
+        # nobody writes to a table the same deploy creates
+        return None
+    if isinstance(operation, (AddIndexConcurrently, RemoveIndexConcurrently)):
+        if atomic:
+            return 'runs in a transaction, set atomic = False'
+        return None
+    if isinstance(operation, migrations.AddIndex):
+        return 'builds the index blocking writes, use AddIndexConcurrently'
+    if isinstance(operation, AddConstraintNotValid):
+        return None
+    if isinstance(operation, migrations.AddConstraint):
+        return (
+            'checks every row blocking writes, use AddConstraintNotValid '
+            'and ValidateConstraint'
+        )
+    if isinstance(operation, (
+        migrations.AlterUniqueTogether, migrations.AlterIndexTogether,
+    )):
+        return 'builds an index blocking writes, use AddIndexConcurrently'
+    if isinstance(operation, migrations.AddField):
+        field = operation.field
+        if field.many_to_many:
+            # the links go in a table of their own
+            return None
+        if field.is_relation and field.db_constraint:
+            return (
+                'checks every row against the foreign key blocking writes'
+            )
+        if field.unique or field.db_index:
+            return 'builds an index blocking writes, use AddIndexConcurrently'
+        return None
+    if isinstance(operation, migrations.AlterField):
+        if from_state is not None:
+            statements = _alter_sql(
+                operation, app_label, from_state, to_state, connection,
+            )
+            if all(CATALOG_ONLY_SQL.match(sql) for sql in statements):
+                return None
+        return 'can rewrite the table or check every row blocking writes'
+    if isinstance(operation, migrations.RunPython):
+        return 'changes rows on deploy, use a backfill'
+    if isinstance(operation, migrations.RunSQL):
+        for statement in _statements(operation.sql):
+            for pattern, reason in RISKY_SQL:
+                if pattern.search(statement):
+                    return reason
+    return None
+
+
+class Command(BaseCommand):
+    """Django command to flag the operations of the unapplied migrations
+    taking locks that block writes, failing when there is any"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'app_labels',
+            nargs='*',
+            help='Apps to check, defaults to every app',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Check the applied migrations as well',
+        )
+        parser.add_argument(
+            '--ignore',
+            action='append',
+            default=[],
+            help='Migration reviewed already, as app_label.migration_name',
+        )
+        parser.add_argument(
+            '--database',
+            default=DEFAULT_DB_ALIAS,
+            help='Database to check the migrations against',
+        )
+
+    def handle(self, *args, **options):
+        executor = MigrationExecutor(connections[options['database']])
+        plan = executor.migration_plan(
+            executor.loader.graph.leaf_nodes(),
+            clean_start=options['all'],
+        )
+        created = set()
+        flagged = 0
+        for migration, backwards in plan:
+            label = f'{migration.app_label}.{migration.name}'
+            checked = (
+                not options['app_labels']
+                or migration.app_label in options['app_labels']
+            ) and label not in options['ignore']
+            state = executor.loader.project_state(
+                (migration.app_label, migration.name), at_end=False,
+            )
+            for operation in migration.operations:
+                new_state = state.clone()
+                operation.state_forwards(migration.app_label, new_state)
+                reason = check_operation(
+                    operation, migration.app_label, created,
+                    migration.atomic, state, new_state, executor.connection,
+                )
+                state = new_state
+                if isinstance(operation, migrations.CreateModel):
+                    created.add((migration.app_label, operation.name_lower))
+                if checked and reason:
+                    flagged += 1
+                    self.stdout.write(
+                        f'{label}: {operation.describe()}: {reason}'
+                    )
+        if flagged:
+            raise CommandError(
+                f'{flagged} operations can block writes, review them and '
+                f'pass --ignore for the ones that are safe'
+            )
+        self.stdout.write(self.style.SUCCESS('No blocking migrations'))
@@ -0,0 +1,35 @@
+"""
+Django command to precompute the OpenAPI schema
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.schema import build_schema_file, code_version
+
+
+class Command(BaseCommand):
+    """Django command to write the OpenAPI schema for the current code
+    version, regenerating it only when the version changed"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file',
+            default=None,
+            help='Path to write the schema to (default SCHEMA_CACHE_FILE)',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Regenerate even if the stored version is current',
+        )
+
+    def handle(self, *args, **options):
+        path = options['file'] or settings.SCHEMA_CACHE_FILE
+        version = code_version()
+        _, generated = build_schema_file(path, version, options['force'])
+        if generated:
+            self.stdout.write(self.style.SUCCESS(
+                f'Schema for version {version} written to {path}'
+            ))
+        else:
+            self.stdout.write(f'Schema for version {version} is up to date')
@@ -0,0 +1,117 @@
+"""
+Django command to overload a simulated worker pool with and without
+admission control
+"""
+import queue
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from core.middleware import AdmissionControlMiddleware
+
+# requests sent in turn, one per priority
+PATHS = [
+    ('critical', '/api/recipe/recipes/'),
+    ('normal', '/api/recipe/tags/'),
+    ('low', '/api/schema/'),
+]
+
+
+def percentile(values, fraction):
+    """Return the value below which fraction of the values fall"""
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[int(fraction * (len(values) - 1))]
+
+
+class Command(BaseCommand):
+    """Django command to send requests faster than the workers can serve
+    them and report the latency of the requests served, per priority"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--rate', type=int, default=400,
+                            help='requests sent per second')
+        parser.add_argument('--service-ms', type=int, default=20,
+                            help='time a worker spends on each request')
+
+    def handle(self, *args, **options):
+        capacity = options['workers'] * 1000 / options['service_ms']
+        self.stdout.write(
+            f'Sending {options["requests"]} requests at {options["rate"]}/s '
+            f'to {options["workers"]} workers serving {capacity:.0f}/s'
+        )
+        for name, admission in [
+            ('without admission control', False),
+            ('with admission control', True),
+        ]:
+            self.stdout.write(name)
+            results = self.run(admission, options)
+            for priority, _ in PATHS:
+                served = [
+                    latency for status, latency in results[priority]
+                    if status == 200
+                ]
+                shed = len(results[priority]) - len(served)
+                self.stdout.write(
+                    f'{priority:>10}: {len(served):5d} served '
+                    f'{shed:5d} shed '
+                    f'p50 {percentile(served, 0.5):8.1f} ms '
+                    f'p99 {percentile(served, 0.99):8.1f} ms'
+                )
+
+    def run(self, admission, options):
+        """Return the status and latency in milliseconds of each request
+        per priority"""
+        service_time = options['service_ms'] / 1000
+
+        def view(request):
+            time.sleep(service_time)
+            return HttpResponse()
+
+        handler = AdmissionControlMiddleware(view) if admission else view
+        pending = queue.Queue()
+        results = {priority: [] for priority, _ in PATHS}
+
+        def worker():
+            while True:
+                item = pending.get()
+                if item is None:
+                    return
+                priority, request, sent = item
+                response = handler(request)
+                results[priority].append(
+                    (response.status_code, (time.time() - sent) * 1000)
+                )
+
+        workers = [
+            threading.Thread(target=worker)
+            for _ in range(options['workers'])
+        ]
+        for thread in workers:
+            thread.start()
+
+        factory = RequestFactory()
+        interval = 1 / options['rate']
+        start = time.time()
+        for i in range(options['requests']):
+            # keep to the schedule however long the previous put took
+            delay = start + i * interval - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            priority, path = PATHS[i % len(PATHS)]
+            sent = time.time()
+            # what nginx adds when it accepts the request
+            request = factory.get(path, HTTP_X_REQUEST_START=f't={sent}')
+            pending.put((priority, request, sent))
+
+        for _ in workers:
+            pending.put(None)
+        for thread in workers:
+            thread.join()
+        return results
@@ -0,0 +1,17 @@
+"""
+Django command to purge the data of deleted accounts and libraries
+"""
+from django.core.management.base import BaseCommand
+
+from core.purge import purge_deleted_users
+
+
+class Command(BaseCommand):
+    """Django command to delete the data of the deleted accounts in small
+    batches"""
+
+    def handle(self, *args, **options):
+        purged = purge_deleted_users()
+        self.stdout.write(
+            self.style.SUCCESS(f'Purged {purged} deleted accounts')
+        )
@@ -0,0 +1,16 @@
+"""
+Django command to delete expired idempotency keys
+"""
+from django.core.management.base import BaseCommand
+
+from core.idempotency import purge_expired_keys
+
+
+class Command(BaseCommand):
+    """Django command to delete the idempotency keys past their TTL"""
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_keys()
+        self.stdout.write(
+            self.style.SUCCESS(f'Deleted {deleted} expired idempotency keys')
+        )
@@ -0,0 +1,17 @@
+"""
+Django command to repair drifted tag and ingredient recipe counts
+"""
+from django.core.management.base import BaseCommand
+
+from core.counts import COUNTED_RELATIONS, reconcile_recipe_counts
+
+
+class Command(BaseCommand):
+    """Django command to recount the recipes of tags and ingredients"""
+
+    def handle(self, *args, **options):
+        for model in COUNTED_RELATIONS:
+            fixed = reconcile_recipe_counts(model)
+            name = model._meta.verbose_name_plural
+            self.stdout.write(f'Fixed recipe_count of {fixed} {name}')
+        self.stdout.write(self.style.SUCCESS('Recipe counts reconciled'))
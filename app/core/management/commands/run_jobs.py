@@ -0,0 +1,44 @@
+"""
+Django command to run background jobs
+"""
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from core.jobs import work
+
+
+class Command(BaseCommand):
+    """Django command to run the queued background jobs until stopped"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--queue',
+            action='append',
+            dest='queues',
+            help='Queue to serve, in order, defaults to every queue',
+        )
+        parser.add_argument(
+            '--burst',
+            action='store_true',
+            help='Exit once no job is due',
+        )
+        parser.add_argument(
+            '--max-jobs',
+            type=int,
+            help='Exit after running this many jobs',
+        )
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        # finish the running job before exiting
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: stop.set())
+        ran = work(
+            queues=options['queues'],
+            burst=options['burst'],
+            max_jobs=options['max_jobs'],
+            stop=stop,
+        )
+        self.stdout.write(self.style.SUCCESS(f'Ran {ran} jobs'))
@@ -0,0 +1,113 @@
+"""
+In process metrics for the API.
+
+Every process logs the values it recorded to the core.metrics logger
+every METRICS_LOG_SECONDS, as one line of JSON, for the log pipeline to
+collect and add up across the processes.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+def _format_key(key):
+    """Return name{label=value,...} for a key"""
+    name, labels = key
+    if not labels:
+        return name
+    return f'{name}{{{",".join(f"{k}={v}" for k, v in labels)}}}'
+
+
+class Metrics:
+    """Thread safe registry of counters, gauges and summaries, keyed by
+    name and labels"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reporter_pid = None
+        self.reset()
+
+    def _start_reporter(self):
+        """Log the values from a thread, once per process as threads
+        don't survive the fork of a worker. Called holding the lock"""
+        if self._reporter_pid == os.getpid():
+            return
+        self._reporter_pid = os.getpid()
+        if settings.METRICS_LOG_SECONDS:
+            threading.Thread(target=self._report_forever, daemon=True).start()
+
+    def _report_forever(self):
+        while True:
+            time.sleep(settings.METRICS_LOG_SECONDS)
+            self.report()
+
+    def snapshot(self):
+        """Return the recorded values keyed by name{labels}, summaries
+        as count, sum and max"""
+        with self._lock:
+            return {
+                _format_key(key): value
+                for values in (self.counters, self.gauges, self.summaries)
+                for key, value in values.items()
+            }
+
+    def report(self):
+        """Log the recorded values"""
+        values = self.snapshot()
+        if values:
+            logger.info('metrics pid=%s %s', os.getpid(), json.dumps(
+                values, sort_keys=True, default=str,
+            ))
+
+    def reset(self):
+        """Drop every recorded value"""
+        with self._lock:
+            self.counters = {}
+            self.gauges = {}
+            self.summaries = {}
+
+    def increment(self, name, amount=1, **labels):
+        """Add amount to a counter"""
+        key = _key(name, labels)
+        with self._lock:
+            self._start_reporter()
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        """Set a gauge to value"""
+        with self._lock:
+            self._start_reporter()
+            self.gauges[_key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        """Add an observation to a summary of count, sum and max"""
+        key = _key(name, labels)
+        with self._lock:
+            self._start_reporter()
+            count, total, maximum = self.summaries.get(key, (0, 0, value))
+            self.summaries[key] = (
+                count + 1, total + value, max(maximum, value),
+            )
+
+    def get(self, name, **labels):
+        """Return the counter, gauge or summary recorded for name and
+        labels, None when nothing was recorded"""
+        key = _key(name, labels)
+        with self._lock:
+            for values in (self.counters, self.gauges, self.summaries):
+                if key in values:
+                    return values[key]
+        return None
+
+
+metrics = Metrics()
@@ -0,0 +1,422 @@
+"""
+Middleware for the API
+"""
+import hashlib
+import re
+import threading
+import time
+import uuid
+from urllib.parse import urlencode
+
+import brotli
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.handlers.exception import convert_exception_to_response
+from django.db import connection
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.module_loading import import_string
+from django.utils.text import compress_sequence, compress_string
+from rest_framework.authtoken.models import Token
+
+from core.metrics import metrics
+from core.models import Ingredient, Recipe, Tag, Tombstone, User
+
+
+def accepted_encodings(header):
+    """Return the content codings in an Accept-Encoding header that the
+    client did not refuse with q=0"""
+    encodings = set()
+    for item in header.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            encodings.add(coding)
+    return encodings
+
+
+def compress_brotli_sequence(sequence, quality):
+    """Brotli compress an iterable of bytes, flushing after each chunk so
+    streamed responses stay streamed"""
+    compressor = brotli.Compressor(quality=quality)
+    for item in sequence:
+        data = compressor.process(item) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """Compress API responses with brotli or gzip, whichever the client
+    prefers, once they are larger than COMPRESSION_MIN_SIZE bytes"""
+
+    def process_response(self, request, response):
+        if not request.path_info.startswith(
+            settings.COMPRESSION_PATH_PREFIXES
+        ):
+            return response
+        # it's not worth attempting to compress small or already
+        # encoded responses
+        if response.has_header('Content-Encoding'):
+            return response
+        if not response.streaming and (
+            len(response.content) < settings.COMPRESSION_MIN_SIZE
+        ):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encodings = accepted_encodings(
+            request.META.get('HTTP_ACCEPT_ENCODING', '')
+        )
+        if 'br' in encodings:
+            encoding = 'br'
+        elif 'gzip' in encodings:
+            encoding = 'gzip'
+        else:
+            return response
+
+        quality = settings.COMPRESSION_BROTLI_QUALITY
+        if response.streaming:
+            if encoding == 'br':
+                response.streaming_content = compress_brotli_sequence(
+                    response.streaming_content, quality,
+                )
+            else:
+                response.streaming_content = compress_sequence(
+                    response.streaming_content,
+                )
+            # the length of the compressed stream is not known up front
+            del response['Content-Length']
+        else:
+            if encoding == 'br':
+                compressed = brotli.compress(
+                    response.content, quality=quality,
+                )
+            else:
+                compressed = compress_string(response.content)
+            # return the original response if compressing makes it bigger
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(response.content))
+
+        # a strong ETag describes the uncompressed bytes, so weaken it
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+
+        return response
+
+
+class BrowserMiddleware:
+    """Run the middleware in settings.BROWSER_MIDDLEWARE (sessions, CSRF,
+    auth, messages) for every request except the token authenticated API
+    under settings.API_PATH_PREFIXES, which skips it entirely"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # build the inner stack the way django's handler builds MIDDLEWARE
+        self.view_middleware = []
+        self.template_response_middleware = []
+        self.exception_middleware = []
+        handler = convert_exception_to_response(get_response)
+        for middleware_path in reversed(settings.BROWSER_MIDDLEWARE):
+            try:
+                middleware = import_string(middleware_path)(handler)
+            except MiddlewareNotUsed:
+                continue
+            if hasattr(middleware, 'process_view'):
+                self.view_middleware.insert(0, middleware.process_view)
+            if hasattr(middleware, 'process_template_response'):
+                self.template_response_middleware.append(
+                    middleware.process_template_response,
+                )
+            if hasattr(middleware, 'process_exception'):
+                self.exception_middleware.append(
+                    middleware.process_exception,
+                )
+            handler = convert_exception_to_response(middleware)
+        self.browser_handler = handler
+
+    def is_api(self, request):
+        return request.path_info.startswith(settings.API_PATH_PREFIXES)
+
+    def __call__(self, request):
+        if self.is_api(request):
+            return self.get_response(request)
+        return self.browser_handler(request)
+
+    # the handler only calls the hooks of the middleware in MIDDLEWARE, so
+    # pass them on to the inner stack, e.g. CSRF checks are done in
+    # process_view
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if self.is_api(request):
+            return None
+        for process_view in self.view_middleware:
+            response = process_view(request, view_func, view_args,
+                                    view_kwargs)
+            if response:
+                return response
+        return None
+
+    def process_template_response(self, request, response):
+        if self.is_api(request):
+            return response
+        for process_template_response in self.template_response_middleware:
+            response = process_template_response(request, response)
+        return response
+
+    def process_exception(self, request, exception):
+        if self.is_api(request):
+            return None
+        for process_exception in self.exception_middleware:
+            response = process_exception(request, exception)
+            if response:
+                return response
+        return None
+
+
+def queue_wait_ms(request):
+    """Return how long the request waited between nginx and this worker,
+    from the X-Request-Start: t=<seconds> header nginx adds, None when the
+    request did not come through nginx"""
+    header = request.META.get('HTTP_X_REQUEST_START', '')
+    if header.startswith('t='):
+        header = header[2:]
+    try:
+        started = float(header)
+    except ValueError:
+        return None
+    return max((time.time() - started) * 1000, 0)
+
+
+class AdmissionControlMiddleware:
+    """Answer 503 with Retry-After instead of doing the work when the
+    worker is overloaded. Each request gets the priority of the first
+    matching rule in settings.ADMISSION_PRIORITIES, and is shed once its
+    queue wait or the requests in flight go over the limits in
+    settings.ADMISSION_LIMITS for that priority, so low priority work is
+    shed well before critical work"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.priorities = [
+            (method, re.compile(pattern), priority)
+            for method, pattern, priority in settings.ADMISSION_PRIORITIES
+        ]
+
+    def get_priority(self, request):
+        for method, pattern, priority in self.priorities:
+            if method in (None, request.method) and pattern.search(
+                request.path_info
+            ):
+                return priority
+        return 'normal'
+
+    def __call__(self, request):
+        priority = self.get_priority(request)
+        limits = settings.ADMISSION_LIMITS[priority]
+        wait = queue_wait_ms(request)
+        if wait is not None:
+            metrics.observe('admission.queue_wait_ms', wait, priority=priority)
+
+        with self.lock:
+            admitted = self.in_flight < limits['in_flight'] and (
+                wait is None or wait <= limits['queue_wait_ms']
+            )
+            if admitted:
+                self.in_flight += 1
+                metrics.set('admission.in_flight', self.in_flight)
+        if not admitted:
+            metrics.increment('admission.shed', priority=priority)
+            response = JsonResponse(
+                {'detail': 'The server is busy, try again later.'},
+                status=503,
+            )
+            response['Retry-After'] = str(limits['retry_after'])
+            return response
+
+        try:
+            return self.get_response(request)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+def freeze_response(response):
+    """Return the status, headers and body of a response as plain data
+    other requests can be answered with"""
+    return (response.status_code, list(response.items()), response.content)
+
+
+def thaw_response(frozen):
+    """Return a new response from frozen response data"""
+    status, headers, content = frozen
+    response = HttpResponse(content, status=status)
+    for header, value in headers:
+        response[header] = value
+    return response
+
+
+class Flight:
+    """A response being computed for the requests waiting on it"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+class SingleFlightMiddleware:
+    """Compute the response to identical concurrent GETs once. The first
+    request computes it while the others wait and are answered with a
+    copy, across the threads of a worker and, when settings
+    .SINGLE_FLIGHT_CACHE names a cache the workers share, across workers.
+
+    Requests are identical when they carry the same token, so they are
+    answered for the same user, and ask for the same URL, query
+    parameters in any order, and media type. The key also holds the
+    user's last committed change, so a request sent after a write never
+    waits for a response computed before it."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.paths = [
+            re.compile(pattern) for pattern in settings.SINGLE_FLIGHT_PATHS
+        ]
+
+    def get_version(self, token):
+        """Return the last change to the library of the user of token,
+        None when there is no such token"""
+        last_changes = ', '.join(
+            f'(SELECT max(change_seq) FROM {model._meta.db_table} '
+            f'WHERE user_id = token.user_id)'
+            for model in (Recipe, Tag, Ingredient, Tombstone)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT GREATEST({last_changes}), '
+                f'library_user.library_deleted_at '
+                f'FROM {Token._meta.db_table} token '
+                f'JOIN {User._meta.db_table} library_user '
+                f'ON library_user.id = token.user_id WHERE token.key = %s',
+                [token],
+            )
+            row = cursor.fetchone()
+        return None if row is None else f'{row[0]}:{row[1]}'
+
+    def get_key(self, request):
+        """Return the key requests share a response by, None when the
+        request has to compute its own response"""
+        keyword, _, token = request.META.get(
+            'HTTP_AUTHORIZATION', '',
+        ).partition(' ')
+        if request.method != 'GET' or keyword != 'Token' or not token:
+            return None
+        if not any(path.search(request.path_info) for path in self.paths):
+            return None
+        version = self.get_version(token)
+        if version is None:
+            return None
+        query = urlencode(sorted(request.GET.lists()), doseq=True)
+        parts = [
+            token,
+            version,
+            request.scheme,
+            request.get_host(),
+            request.path_info,
+            query,
+            request.META.get('HTTP_ACCEPT', ''),
+        ]
+        return hashlib.sha256('\n'.join(parts).encode()).hexdigest()
+
+    def __call__(self, request):
+        key = self.get_key(request)
+        if key is None:
+            return self.get_response(request)
+
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+
+        if not leader:
+            if flight.done.wait(settings.SINGLE_FLIGHT_TIMEOUT) and (
+                flight.result is not None
+            ):
+                metrics.increment('single_flight.coalesced', shared='thread')
+                return thaw_response(flight.result)
+            return self.get_response(request)
+
+        try:
+            response = self.get_shared_response(key, request)
+            # a stream can only be read once, the followers run their own
+            if not response.streaming:
+                flight.result = freeze_response(response)
+            return response
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+
+    def get_shared_response(self, key, request):
+        """Return the response of the identical request another worker is
+        computing, or compute it and share it with the other workers"""
+        if settings.SINGLE_FLIGHT_CACHE is None:
+            return self.get_response(request)
+        cache = caches[settings.SINGLE_FLIGHT_CACHE]
+        timeout = settings.SINGLE_FLIGHT_TIMEOUT
+        lock_key = f'single-flight:{key}'
+        flight_id = uuid.uuid4().hex
+
+        if cache.add(lock_key, flight_id, timeout):
+            try:
+                response = self.get_response(request)
+                if not response.streaming:
+                    cache.set(
+                        f'{lock_key}:{flight_id}',
+                        freeze_response(response),
+                        timeout,
+                    )
+                return response
+            finally:
+                cache.delete(lock_key)
+
+        # only wait for the flight already running, so the response is
+        # never older than the request
+        leader_id = cache.get(lock_key)
+        result_key = f'{lock_key}:{leader_id}'
+        deadline = time.monotonic() + timeout
+        while leader_id is not None:
+            frozen = cache.get(result_key)
+            if frozen is None and (
+                cache.get(lock_key) != leader_id
+                or time.monotonic() > deadline
+            ):
+                # the result is stored before the lock is released
+                frozen = cache.get(result_key)
+                if frozen is None:
+                    break
+            if frozen is not None:
+                metrics.increment('single_flight.coalesced', shared='cache')
+                return thaw_response(frozen)
+            time.sleep(settings.SINGLE_FLIGHT_POLL_INTERVAL)
+        return self.get_response(request)
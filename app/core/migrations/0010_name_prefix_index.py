@@ -0,0 +1,27 @@
+# Generated by Django 3.2.25 on 2026-10-19 11:17
+
+from django.db import migrations
+
+
+def prefix_index(table):
+    """Index the names of each user for case insensitive prefix searches,
+    matching the UPPER(name::text) LIKE UPPER('...%') of __istartswith"""
+    return migrations.RunSQL(
+        f'CREATE INDEX CONCURRENTLY {table}_name_prefix_idx ON {table} '
+        '(user_id, UPPER(name::text) text_pattern_ops)',
+        f'DROP INDEX CONCURRENTLY {table}_name_prefix_idx',
+    )
+
+
+class Migration(migrations.Migration):
+    # the indexes are built concurrently, outside of a transaction
+    atomic = False
+
+    dependencies = [
+        ('core', '0009_change_seq'),
+    ]
+
+    operations = [
+        prefix_index('core_tag'),
+        prefix_index('core_ingredient'),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.25 on 2026-10-19 11:27
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # the index is built concurrently, outside of a transaction
+    atomic = False
+
+    dependencies = [
+        ('core', '0010_name_prefix_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        AddIndexConcurrently(
+            model_name='user',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', False)), fields=['deleted_at'], name='core_user_deleted_at_idx'),
+        ),
+    ]
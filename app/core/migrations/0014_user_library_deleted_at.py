@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-19 11:46
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # the index is built concurrently, outside of a transaction
+    atomic = False
+
+    dependencies = [
+        ('core', '0013_backfillprogress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='library_deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='library_floor',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        AddIndexConcurrently(
+            model_name='user',
+            index=models.Index(condition=models.Q(('library_deleted_at__isnull', False)), fields=['library_deleted_at'], name='core_user_library_deleted_idx'),
+        ),
+    ]
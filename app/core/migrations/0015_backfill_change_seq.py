@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 14:02
+
+from django.db import migrations
+
+import core.operations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_user_library_deleted_at'),
+    ]
+
+    operations = [
+        core.operations.Backfill('core.backfills.recipe_change_seqs'),
+        core.operations.Backfill('core.backfills.tag_change_seqs'),
+        core.operations.Backfill('core.backfills.ingredient_change_seqs'),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-19 14:20
+
+from django.db import migrations
+
+import core.operations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_backfill_change_seq'),
+    ]
+
+    operations = [
+        core.operations.Backfill('core.backfills.tag_recipe_counts'),
+        core.operations.Backfill('core.backfills.ingredient_recipe_counts'),
+    ]
@@ -52,6 +52,13 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # set when the account was deleted, core.purge deletes its data
+    deleted_at = models.DateTimeField(null=True, blank=True)
+    # set when the library was deleted until core.purge deleted it, the
+    # recipes, tags and ingredients up to the ids in library_floor (by
+    # model name) are left out of the library, see LibraryQuerySet
+    library_deleted_at = models.DateTimeField(null=True, blank=True)
+    library_floor = models.JSONField(default=dict, blank=True)
 
     # assign the user manager to the custom user class
     objects = UserManager()
@@ -60,6 +67,34 @@ class User(AbstractBaseUser, PermissionsMixin):
     #  email field
     USERNAME_FIELD = 'email'
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['deleted_at'],
+                name='core_user_deleted_at_idx',
+                condition=models.Q(deleted_at__isnull=False),
+            ),
+            models.Index(
+                fields=['library_deleted_at'],
+                name='core_user_library_deleted_idx',
+                condition=models.Q(library_deleted_at__isnull=False),
+            ),
+        ]
+
+
+class LibraryQuerySet(models.QuerySet):
+    """Recipes, tags or ingredients"""
+
+    def owned_by(self, user):
+        """Filter the objects of user, leaving out the ones of its deleted
+        libraries still to be purged"""
+        queryset = self.filter(user=user)
+        floor = user.library_floor.get(self.model._meta.model_name)
+        if floor:
+            queryset = queryset.filter(pk__gt=floor)
+        return queryset
+
+
 class Recipe(models.Model):
     """Recipt object"""
     user = models.ForeignKey(
@@ -77,6 +112,14 @@ class Recipe(models.Model):
 
     ingredients = models.ManyToManyField('Ingredient')
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    # position in the user's change feed, assigned by core.changes; null
+    # for the rows created before the feed until their backfill ran
+    change_seq = models.BigIntegerField(null=True)
+
+    objects = LibraryQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'change_seq'])]
 
     def __str__(self) -> str:
         return self.title
@@ -89,6 +132,16 @@ class Tag(models.Model):
         #  if the user deleted the tag associated with the user will also be deleted
         on_delete=models.CASCADE,
     )
+    # number of recipes using the tag, kept up to date by core.counts
+    recipe_count = models.PositiveIntegerField(default=0)
+    # position in the user's change feed, assigned by core.changes; null
+    # for the rows created before the feed until their backfill ran
+    change_seq = models.BigIntegerField(null=True)
+
+    objects = LibraryQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'change_seq'])]
 
     def __str__(self):
         return self.name
@@ -100,6 +153,150 @@ class Ingredient(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
+    # number of recipes using the ingredient, kept up to date by core.counts
+    recipe_count = models.PositiveIntegerField(default=0)
+    # position in the user's change feed, assigned by core.changes; null
+    # for the rows created before the feed until their backfill ran
+    change_seq = models.BigIntegerField(null=True)
+
+    objects = LibraryQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'change_seq'])]
+
+    def __str__(self):
+        return self.name
+
+
+class RecipeSnapshot(models.Model):
+    """Read model holding the rendered list representation of a recipe,
+    maintained by recipe.snapshots"""
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='snapshot',
+    )
+    list_json = models.TextField()
+
+
+class IdempotencyKey(models.Model):
+    """Response to a request sent with an Idempotency-Key header, replayed
+    when the client retries the request, see core.idempotency"""
+    # who sent the request to which endpoint
+    scope = models.CharField(max_length=255)
+    key = models.CharField(max_length=255)
+    # hash of the request, a key can't be reused for another request
+    fingerprint = models.CharField(max_length=64)
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+    # when the request last started, a stale claim can be taken over
+    claimed = models.DateTimeField()
+    # empty until the request succeeded
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.BinaryField(null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['scope', 'key'],
+                name='unique_idempotency_key',
+            ),
+        ]
+
+
+class Tombstone(models.Model):
+    """Record of a deleted recipe, tag or ingredient, so clients syncing
+    with recipe.sync learn about the delete"""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        # deleting a user writes the tombstones of their recipes after
+        # the cascade collected the user's tombstones
+        db_constraint=False,
+        related_name='+',
+    )
+    # model_name of the deleted object
+    kind = models.CharField(max_length=32)
+    object_id = models.BigIntegerField()
+    change_seq = models.BigIntegerField()
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'change_seq'])]
+
+
+class Job(models.Model):
+    """Function to run in the background by the run_jobs workers, see
+    core.jobs"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    # name the function was registered under and its keyword arguments
+    name = models.CharField(max_length=255)
+    kwargs = models.JSONField(default=dict)
+    queue = models.CharField(max_length=64, default='default')
+    # jobs with a higher priority run first
+    priority = models.SmallIntegerField(default=0)
+    status = models.CharField(
+        max_length=16, choices=STATUS_CHOICES, default=QUEUED,
+    )
+    # the job doesn't run before, retries are pushed back
+    run_at = models.DateTimeField()
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField()
+    # the worker running the job and when it started
+    locked_by = models.CharField(max_length=255, blank=True)
+    locked_at = models.DateTimeField(null=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    finished = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            # the jobs a worker picks from, in the order it picks them
+            models.Index(
+                fields=['queue', '-priority', 'run_at'],
+                name='core_job_queued_idx',
+                condition=models.Q(status='queued'),
+            ),
+            models.Index(
+                fields=['locked_at'],
+                name='core_job_running_idx',
+                condition=models.Q(status='running'),
+            ),
+            models.Index(
+                fields=['finished'],
+                name='core_job_finished_idx',
+                condition=models.Q(status__in=['done', 'failed']),
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.status})'
+
+
+class BackfillProgress(models.Model):
+    """Checkpoint of a backfill, see core.backfill"""
+    # name the backfill was registered under
+    name = models.CharField(max_length=255, unique=True)
+    # the rows up to this primary key are done
+    last_pk = models.BigIntegerField(default=0)
+    rows = models.BigIntegerField(default=0)
+    # estimated number of rows of the table when the backfill started
+    total = models.BigIntegerField(null=True)
+    started = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+    finished = models.DateTimeField(null=True)
+
+    class Meta:
+        verbose_name_plural = 'backfill progress'
 
     def __str__(self):
         return self.name
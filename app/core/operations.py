@@ -0,0 +1,144 @@
+"""
+Migration operations changing large tables without blocking writes.
+
+- AddIndexConcurrently builds an index while the table stays writable.
+  It can't run in a transaction, so its migration sets atomic = False.
+- A column is added nullable with AddField, which only touches the
+  catalog, and filled by a backfill the Backfill operation queues, see
+  core.backfill.
+- AddConstraintNotValid adds a check constraint holding for the new rows
+  only, and ValidateConstraint, in a later migration, checks the existing
+  rows without blocking writes.
+
+The check_migrations command flags the operations these replace.
+"""
+from django.contrib.postgres.operations import (  # noqa: F401
+    AddIndexConcurrently,
+    RemoveIndexConcurrently,
+)
+from django.db import migrations
+from django.db.models import CheckConstraint
+from django.utils import timezone
+
+from core import backfill, tasks
+
+
+class AddConstraintNotValid(migrations.AddConstraint):
+    """Add a check constraint without checking the existing rows"""
+
+    def __init__(self, model_name, constraint):
+        if not isinstance(constraint, CheckConstraint):
+            raise TypeError(
+                'AddConstraintNotValid only supports CheckConstraint.'
+            )
+        super().__init__(model_name, constraint)
+
+    def describe(self):
+        return (
+            f'Create not valid constraint {self.constraint.name} on model '
+            f'{self.model_name}'
+        )
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            sql = self.constraint.create_sql(model, schema_editor)
+            # the SQL is interpolated already
+            schema_editor.execute(f'{sql} NOT VALID', params=None)
+
+    @property
+    def migration_name_fragment(self):
+        return f'{self.model_name_lower}_{self.constraint.name.lower()}'
+
+
+class ValidateConstraint(migrations.operations.base.Operation):
+    """Check the existing rows against a constraint added with
+    AddConstraintNotValid, taking a lock that leaves the table writable"""
+
+    def __init__(self, model_name, name):
+        self.model_name = model_name
+        self.name = name
+
+    def deconstruct(self):
+        return (
+            self.__class__.__name__,
+            [],
+            {'model_name': self.model_name, 'name': self.name},
+        )
+
+    def describe(self):
+        return f'Validate constraint {self.name} on model {self.model_name}'
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            quote = schema_editor.quote_name
+            schema_editor.execute(
+                f'ALTER TABLE {quote(model._meta.db_table)} '
+                f'VALIDATE CONSTRAINT {quote(self.name)}'
+            )
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        pass
+
+    @property
+    def migration_name_fragment(self):
+        return f'{self.model_name.lower()}_validate_{self.name.lower()}'
+
+
+class Backfill(migrations.operations.base.Operation):
+    """Queue the backfill called name as a background job, so the
+    migration doesn't wait for it. Nothing is queued while the table of
+    the backfill is empty, as on a new database. The migration depends
+    on the core migration creating Job"""
+
+    reduces_to_sql = False
+    elidable = True
+
+    def __init__(self, name):
+        self.name = name
+
+    def deconstruct(self):
+        return (self.__class__.__name__, [], {'name': self.name})
+
+    def describe(self):
+        return f'Queue backfill {self.name}'
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        # the models of the migration state, not the current ones
+        Job = from_state.apps.get_model('core', 'Job')
+        model = from_state.apps.get_model(
+            backfill.discover()[self.name].model._meta.label,
+        )
+        alias = schema_editor.connection.alias
+        if not self.allow_migrate_model(alias, Job) or not (
+            model._default_manager.using(alias).exists()
+        ):
+            return
+        task = tasks.run_backfill
+        Job.objects.using(alias).create(
+            name=task.name,
+            kwargs={'name': self.name},
+            queue=task.queue,
+            priority=task.priority,
+            run_at=timezone.now(),
+            max_attempts=task.max_attempts,
+        )
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        pass
+
+    @property
+    def migration_name_fragment(self):
+        return f'backfill_{self.name.rsplit(".", 1)[-1]}'
@@ -0,0 +1,213 @@
+"""
+Deletion of accounts and recipe libraries in the background.
+
+Deleting an account deactivates it right away and releases its email.
+Deleting a library only records the last recipe, tag and ingredient ids
+of the tables in the user's library_floor, which the LibraryQuerySet of
+the reads leaves out, so the library is out of sight at once whatever its
+size. A purge_deleted_users job then deletes the data of the deleted
+accounts and libraries PURGE_BATCH_SIZE rows at a time, each batch
+committed on its own and without loading the rows, leaving the tombstones
+of the deleted library objects in the change feed, and the uploaded
+images of the deleted recipes once their batch committed.
+"""
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from core import events, tasks
+from core.changes import LOCK_NAMESPACE
+from core.invalidation import bus, user_key
+from core.models import Ingredient, Recipe, RecipeSnapshot, Tag, Tombstone
+
+# first key of the advisory locks taken while purging an account, the
+# second one is the user id
+PURGE_LOCK_NAMESPACE = 0x70757267
+
+# through tables of the recipe links of tags and ingredients
+LINKS = {
+    Tag: Recipe.tags.through,
+    Ingredient: Recipe.ingredients.through,
+}
+
+
+def _released_email():
+    """Return an address no one can sign up with, freeing the real one"""
+    return f'{uuid.uuid4().hex}@deleted.invalid'
+
+
+def _mark_deleted(user):
+    user.email = _released_email()
+    user.is_active = False
+    user.deleted_at = timezone.now()
+    user.set_unusable_password()
+
+
+@transaction.atomic
+def delete_account(user):
+    """Hide the account of user and schedule the purge of its data"""
+    _mark_deleted(user)
+    user.save()
+    Token.objects.filter(user=user).delete()
+    tasks.purge_deleted_users.enqueue()
+
+
+def _lock_feed(user_id):
+    # tombstones of one user take their change_seq under its lock, see
+    # core.changes
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT pg_advisory_xact_lock(%s, mod(%s, 2147483647)::integer)',
+            [LOCK_NAMESPACE, user_id],
+        )
+
+
+@transaction.atomic
+def delete_library(user):
+    """Hide the recipes, tags and ingredients of user and schedule their
+    purge"""
+    # every write to the objects of user takes the lock, so the ones
+    # written before commit before the floor is taken; an object created
+    # while the library is deleted may go with it
+    _lock_feed(user.pk)
+    floor = dict(user.library_floor)
+    for model in [Recipe, Tag, Ingredient]:
+        # the largest id of the table is read from the end of its index
+        last = model.objects.aggregate(last=Max('pk'))['last']
+        if last:
+            floor[model._meta.model_name] = last
+    user.library_floor = floor
+    user.library_deleted_at = timezone.now()
+    get_user_model().objects.filter(pk=user.pk).update(
+        library_floor=user.library_floor,
+        library_deleted_at=user.library_deleted_at,
+    )
+    bus.publish([
+        user_key(model, user.pk) for model in [Recipe, Tag, Ingredient]
+    ])
+    tasks.purge_deleted_users.enqueue()
+
+
+def _delete_rows(model, ids):
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE id = ANY(%s)', [ids])
+
+
+def _delete_files(names):
+    for name in names:
+        default_storage.delete(name)
+
+
+def _bury(model, user_id, ids):
+    """Leave the tombstones of the deleted objects of model in the change
+    feed of user_id and publish their deletes"""
+    kind = model._meta.model_name
+    _lock_feed(user_id)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {Tombstone._meta.db_table} '
+            f'(user_id, kind, object_id, change_seq) '
+            f"SELECT %s, %s, id, nextval('core_change_seq') "
+            f'FROM unnest(%s::bigint[]) id',
+            [user_id, kind, ids],
+        )
+    events.publish_many(user_id, kind, ids, 'deleted')
+
+
+def _purge_batch(model, user_id, floor=None):
+    """Delete a batch of the objects of model owned by user_id, or of its
+    deleted library when the ids of the library end at floor, with the
+    rows depending on them, return how many were deleted"""
+    with transaction.atomic():
+        objects = model.objects.filter(user_id=user_id)
+        if floor is not None:
+            objects = objects.filter(pk__lte=floor)
+        ids = list(objects.order_by('pk').values_list('pk', flat=True)[
+            :settings.PURGE_BATCH_SIZE
+        ])
+        if not ids:
+            return 0
+        if model is Recipe:
+            images = list(Recipe.objects.filter(pk__in=ids).exclude(
+                image='',
+            ).exclude(image=None).values_list('image', flat=True))
+            transaction.on_commit(lambda: _delete_files(images))
+            RecipeSnapshot.objects.filter(recipe_id__in=ids).delete()
+            for through in LINKS.values():
+                through.objects.filter(recipe_id__in=ids).delete()
+        else:
+            LINKS[model].objects.filter(**{
+                f'{model._meta.model_name}_id__in': ids,
+            }).delete()
+        _delete_rows(model, ids)
+        if floor is not None:
+            _bury(model, user_id, ids)
+    return len(ids)
+
+
+def purge_user(user):
+    """Delete the data of the deleted account user, then the account"""
+    for model in [Recipe, Tag, Ingredient]:
+        while _purge_batch(model, user.pk):
+            pass
+    while True:
+        ids = list(Tombstone.objects.filter(user=user).values_list(
+            'pk', flat=True,
+        )[:settings.PURGE_BATCH_SIZE])
+        if not ids:
+            break
+        Tombstone.objects.filter(pk__in=ids).delete()
+    # little is left for the cascade: tokens, permissions, admin entries
+    user.delete()
+
+
+def purge_library(user):
+    """Delete the objects of the deleted library of user"""
+    for model in [Recipe, Tag, Ingredient]:
+        floor = user.library_floor.get(model._meta.model_name)
+        if floor:
+            while _purge_batch(model, user.pk, floor):
+                pass
+    # unless the library was deleted again in the meantime
+    get_user_model().objects.filter(
+        pk=user.pk, library_deleted_at=user.library_deleted_at,
+    ).update(library_deleted_at=None)
+
+
+def purge_deleted_users():
+    """Purge every deleted account and library no other process is
+    purging, return how many were purged"""
+    users = get_user_model().objects.filter(
+        Q(deleted_at__isnull=False) | Q(library_deleted_at__isnull=False),
+    ).order_by('pk').values_list('pk', flat=True)
+    purged = 0
+    for user_id in users:
+        lock = [PURGE_LOCK_NAMESPACE, user_id % 2147483647]
+        with connection.cursor() as cursor:
+            # held across the batches, unlike a row lock
+            cursor.execute('SELECT pg_try_advisory_lock(%s, %s)', lock)
+            if not cursor.fetchone()[0]:
+                continue
+        try:
+            # read under the lock, another process may have purged it
+            user = get_user_model().objects.filter(pk=user_id).first()
+            if user is None:
+                continue
+            if user.deleted_at:
+                purge_user(user)
+            elif user.library_deleted_at:
+                purge_library(user)
+            else:
+                continue
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(%s, %s)', lock)
+        purged += 1
+    return purged
@@ -0,0 +1,94 @@
+"""
+Renderers for the API
+"""
+from collections.abc import Sequence
+from decimal import Decimal
+
+import orjson
+from django.utils.functional import cached_property
+from rest_framework import renderers
+from rest_framework.utils import encoders
+
+_drf_encoder = encoders.JSONEncoder()
+
+
+class PrerenderedJSONList(Sequence):
+    """List whose items are already rendered JSON documents. The renderer
+    splices them into the output as is, they are only decoded when the
+    list is inspected (e.g. response.data in tests)"""
+
+    def __init__(self, items):
+        self.items = items
+
+    @property
+    def content(self):
+        return ('[' + ','.join(self.items) + ']').encode()
+
+    @cached_property
+    def decoded(self):
+        return orjson.loads(self.content)
+
+    def __getitem__(self, index):
+        return self.decoded[index]
+
+    def __len__(self):
+        return len(self.items)
+
+    def __eq__(self, other):
+        if isinstance(other, PrerenderedJSONList):
+            return self.items == other.items
+        return self.decoded == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f'<{type(self).__name__} of {len(self)} items>'
+
+
+def _default(obj):
+    """Encode the types orjson leaves to us the way DRF's encoder does,
+    except decimals which keep their exact digits as strings"""
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, PrerenderedJSONList):
+        return orjson.Fragment(obj.content)
+    return _drf_encoder.default(obj)
+
+
+class ORJSONRenderer(renderers.BaseRenderer):
+    """Drop-in replacement for DRF's JSONRenderer backed by orjson"""
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+    # datetimes go through DRF's encoder so the output format is unchanged
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def get_indent(self, accepted_media_type, renderer_context):
+        if accepted_media_type:
+            base_media_type, params = renderers.parse_header(
+                accepted_media_type.encode('ascii')
+            )
+            try:
+                return max(min(int(params['indent']), 8), 0)
+            except (KeyError, ValueError, TypeError):
+                pass
+        return renderer_context.get('indent', None)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """Render data into JSON bytes"""
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        options = self.options
+        if self.get_indent(accepted_media_type, renderer_context):
+            # orjson only supports two space indentation
+            options |= orjson.OPT_INDENT_2
+
+        ret = orjson.dumps(data, default=_default, option=options)
+        # match DRF and escape the line separators that are valid JSON
+        # but invalid javascript
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028')
+            ret = ret.replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
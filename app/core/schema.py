@@ -0,0 +1,151 @@
+"""
+Precomputed OpenAPI schema served from memory
+"""
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+import drf_spectacular
+import rest_framework
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from drf_spectacular.settings import spectacular_settings
+from drf_spectacular.utils import extend_schema
+from drf_spectacular.views import SCHEMA_KWARGS, SpectacularAPIView
+
+from core.middleware import accepted_encodings
+
+
+def code_version():
+    """Return the version string the cached schema is tied to.
+    Deploys set CODE_VERSION (e.g. the git sha); otherwise hash the
+    python sources and the schema library versions"""
+    if settings.CODE_VERSION:
+        return settings.CODE_VERSION
+    digest = hashlib.sha256()
+    digest.update(drf_spectacular.__version__.encode())
+    digest.update(rest_framework.VERSION.encode())
+    base_dir = Path(settings.BASE_DIR)
+    for path in sorted(base_dir.rglob('*.py')):
+        digest.update(str(path.relative_to(base_dir)).encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def generate_schema():
+    """Introspect every view and return the schema as a dict"""
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS()
+    return generator.get_schema(request=None, public=True)
+
+
+def write_schema_file(path, version, schema):
+    """Atomically write the schema with its version so that workers
+    reading the file never see it half written"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump({'version': version, 'schema': schema}, f)
+    os.replace(tmp_path, path)
+
+
+def read_schema_file(path, version):
+    """Return the schema stored in path if it matches version"""
+    try:
+        with open(path) as f:
+            stored = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if stored.get('version') != version:
+        return None
+    return stored.get('schema')
+
+
+def build_schema_file(path, version, force=False):
+    """Make sure path holds the schema for version, return
+    (schema, generated)"""
+    schema = None if force else read_schema_file(path, version)
+    if schema is not None:
+        return schema, False
+    schema = generate_schema()
+    write_schema_file(path, version, schema)
+    return schema, True
+
+
+class SchemaCache:
+    """Schema rendered once per format and kept in memory together with
+    its gzip encoding and ETag"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self._schema = None
+        self._rendered = {}
+
+    def get_schema(self):
+        if self._schema is None:
+            with self._lock:
+                if self._schema is None:
+                    self._schema = self._load()
+        return self._schema
+
+    def _load(self):
+        version = code_version()
+        path = settings.SCHEMA_CACHE_FILE
+        try:
+            schema, _ = build_schema_file(path, version)
+        except OSError:
+            # read-only filesystem, still serve the schema from memory
+            schema = generate_schema()
+        return schema
+
+    def get_rendered(self, renderer):
+        """Return (body, gzipped_body, etag) for the renderer"""
+        key = type(renderer)
+        rendered = self._rendered.get(key)
+        if rendered is None:
+            body = renderer.render(self.get_schema(), renderer_context={})
+            etag = '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+            rendered = (body, gzip.compress(body, mtime=0), etag)
+            self._rendered[key] = rendered
+        return rendered
+
+
+schema_cache = SchemaCache()
+
+
+class CachedSpectacularAPIView(SpectacularAPIView):
+    """Serve the precomputed schema instead of introspecting the views
+    on every request"""
+
+    @extend_schema(**SCHEMA_KWARGS)
+    def get(self, request, *args, **kwargs):
+        body, gzipped, etag = schema_cache.get_rendered(
+            request.accepted_renderer
+        )
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponseNotModified()
+        else:
+            renderer = request.accepted_renderer
+            content_type = renderer.media_type
+            if renderer.charset:
+                content_type += '; charset=%s' % renderer.charset
+            encodings = accepted_encodings(
+                request.META.get('HTTP_ACCEPT_ENCODING', '')
+            )
+            if 'gzip' in encodings:
+                response = HttpResponse(gzipped, content_type=content_type)
+                response['Content-Encoding'] = 'gzip'
+            else:
+                response = HttpResponse(body, content_type=content_type)
+        response['ETag'] = etag
+        patch_vary_headers(response, ['Accept-Encoding'])
+        return response
@@ -0,0 +1,29 @@
+"""
+Background jobs of the core app, see core.jobs
+"""
+from django.conf import settings
+
+from core import backfill, counts, purge
+from core.jobs import task
+
+
+@task(queue='maintenance')
+def purge_deleted_users():
+    """Delete the data of the deleted accounts and libraries"""
+    purge.purge_deleted_users()
+
+
+@task(queue='maintenance')
+def reconcile_recipe_counts():
+    """Repair drifted tag and ingredient recipe counts"""
+    for model in counts.COUNTED_RELATIONS:
+        counts.reconcile_recipe_counts(model)
+
+
+@task(queue='maintenance')
+def run_backfill(name):
+    """Run the backfill called name for BACKFILL_JOB_SECONDS, then queue
+    the rest of it, leaving the queue to the other jobs in between"""
+    progress = backfill.run(name, seconds=settings.BACKFILL_JOB_SECONDS)
+    if not progress.finished:
+        run_backfill.enqueue(name=name)
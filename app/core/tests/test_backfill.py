@@ -0,0 +1,108 @@
+"""
+Tests for the backfills of large tables
+"""
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from core import backfill
+from core.jobs import work
+from core.models import BackfillProgress, Tag
+from core.tasks import run_backfill
+
+filled = []
+
+
+@backfill.backfill(Tag, name='tests.tags', batch_size=2)
+def fill_tags(ids):
+    filled.append(ids)
+
+
+@override_settings(BACKFILL_PAUSE_RATIO=0)
+class BackfillTests(TestCase):
+    """Test running backfills"""
+
+    def setUp(self):
+        filled.clear()
+        user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.tags = [
+            Tag.objects.create(user=user, name=f'Tag {i}') for i in range(5)
+        ]
+        self.ids = [tag.id for tag in self.tags]
+
+    def test_resume(self):
+        """Test a stopped backfill resumes after its last batch"""
+        progress = backfill.run('tests.tags', max_batches=2)
+
+        self.assertEqual(filled, [self.ids[:2], self.ids[2:4]])
+        self.assertEqual(progress.rows, 4)
+        self.assertEqual(progress.last_pk, self.ids[3])
+        self.assertIsNone(progress.finished)
+
+        progress = backfill.run('tests.tags')
+
+        self.assertEqual(filled[2:], [self.ids[4:]])
+        self.assertEqual(progress.rows, 5)
+        self.assertIsNotNone(progress.finished)
+        backfill.run('tests.tags')
+        self.assertEqual(len(filled), 3)
+
+    def test_reset(self):
+        """Test a reset backfill starts over"""
+        backfill.run('tests.tags')
+        backfill.reset('tests.tags')
+
+        backfill.run('tests.tags', max_batches=1)
+
+        self.assertEqual(filled[-1], self.ids[:2])
+
+    @override_settings(BACKFILL_MAX_ACTIVE=-1)
+    def test_busy(self):
+        """Test a backfill waits while the database is busy"""
+        self.assertTrue(backfill.busy())
+
+    @override_settings(BACKFILL_JOB_SECONDS=0)
+    def test_job(self):
+        """Test a backfill job queues the rest of the backfill"""
+        run_backfill.enqueue(name='tests.tags')
+
+        self.assertEqual(work(burst=True), 4)
+
+        self.assertEqual(sum(filled, []), self.ids)
+        progress = BackfillProgress.objects.get(name='tests.tags')
+        self.assertIsNotNone(progress.finished)
+
+    def test_recipe_counts(self):
+        """Test the recipe count backfill repairs drifted counts"""
+        Tag.objects.filter(id=self.ids[0]).update(recipe_count=3)
+
+        backfill.run('core.backfills.tag_recipe_counts')
+
+        self.assertEqual(Tag.objects.get(id=self.ids[0]).recipe_count, 0)
+
+    def test_change_seqs(self):
+        """Test the rows created before the change feed are numbered"""
+        Tag.objects.filter(id__in=self.ids[:2]).update(change_seq=None)
+        change_seq = Tag.objects.get(id=self.ids[4]).change_seq
+
+        backfill.run('core.backfills.tag_change_seqs')
+
+        numbered = Tag.objects.in_bulk(self.ids)
+        for pk in self.ids[:2]:
+            self.assertGreater(numbered[pk].change_seq, change_seq)
+        self.assertEqual(numbered[self.ids[4]].change_seq, change_seq)
+
+    def test_command(self):
+        """Test the command runs backfills and lists their progress"""
+        out = StringIO()
+        call_command('backfill', 'tests.tags', max_batches=1, stdout=out)
+        call_command('backfill', stdout=out)
+
+        self.assertIn('tests.tags: 2 rows', out.getvalue())
+        self.assertIn('core.backfills.ingredient_recipe_counts: not started',
+                      out.getvalue())
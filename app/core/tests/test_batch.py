@@ -0,0 +1,136 @@
+"""
+Tests for the batch endpoint
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag
+
+BATCH_URL = reverse('api-batch')
+LAUNCH_REQUESTS = [
+    {'path': '/api/user/me/'},
+    {'path': '/api/recipe/recipes/'},
+    {'path': '/api/recipe/tags/'},
+    {'path': '/api/recipe/ingredients/'},
+]
+
+
+class BatchMixin:
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        Recipe.objects.create(
+            user=self.user,
+            title='Curry',
+            time_minutes=10,
+            price=Decimal('5.00'),
+        )
+        Tag.objects.create(user=self.user, name='Vegan')
+
+    def batch(self, requests, **payload):
+        return self.client.post(
+            BATCH_URL, {'requests': requests, **payload}, format='json',
+        )
+
+    def assertMatchesDirectCalls(self, res):
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        responses = res.json()['responses']
+        self.assertEqual(len(responses), len(LAUNCH_REQUESTS))
+        for item, response in zip(LAUNCH_REQUESTS, responses):
+            direct = self.client.get(item['path'])
+            self.assertEqual(response['status'], direct.status_code)
+            self.assertEqual(response['body'], direct.json())
+
+
+class PublicBatchApiTests(TestCase):
+    """Test unauthenticated API requests"""
+
+    def test_auth_required(self):
+        """Test auth is required for a batch"""
+        res = APIClient().post(
+            BATCH_URL, {'requests': LAUNCH_REQUESTS}, format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateBatchApiTests(BatchMixin, TestCase):
+    """Test authenticated API requests"""
+
+    def test_batch(self):
+        """Test the responses are those of the requests made one by one"""
+        res = self.batch(LAUNCH_REQUESTS)
+
+        self.assertMatchesDirectCalls(res)
+
+    def test_token_looked_up_once(self):
+        """Test the sub-requests don't authenticate again"""
+        with CaptureQueriesContext(connection) as queries:
+            self.batch(LAUNCH_REQUESTS)
+
+        lookups = [
+            query for query in queries.captured_queries
+            if Token._meta.db_table in query['sql']
+        ]
+        self.assertEqual(len(lookups), 1)
+
+    def test_write_then_read(self):
+        """Test requests run in order, reads see earlier writes"""
+        res = self.batch([
+            {
+                'method': 'POST',
+                'path': '/api/recipe/recipes/',
+                'body': {'title': 'Soup', 'time_minutes': 5, 'price': '2.00'},
+            },
+            {'path': '/api/recipe/recipes/?fields=title'},
+        ])
+
+        created, listed = res.json()['responses']
+        self.assertEqual(created['status'], status.HTTP_201_CREATED)
+        self.assertEqual(
+            listed['body'], [{'title': 'Soup'}, {'title': 'Curry'}],
+        )
+
+    def test_errors(self):
+        """Test unknown and nested paths answer errors of their own"""
+        res = self.batch([
+            {'path': '/api/unknown/'},
+            {'method': 'POST', 'path': '/api/batch/', 'body': {}},
+            {'path': '/api/recipe/recipes/0/'},
+        ])
+
+        self.assertEqual(
+            [response['status'] for response in res.json()['responses']],
+            [404, 400, 404],
+        )
+
+    def test_invalid_batch(self):
+        """Test requests outside the API are refused"""
+        res = self.batch([{'path': '/admin/'}])
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ParallelBatchApiTests(BatchMixin, TransactionTestCase):
+    """Test running the reads of a batch concurrently"""
+
+    def test_parallel(self):
+        """Test concurrent reads return the responses in order"""
+        res = self.batch(LAUNCH_REQUESTS, parallel=True)
+
+        self.assertMatchesDirectCalls(res)
@@ -0,0 +1,124 @@
+"""
+Tests for the query budgets
+"""
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db import OperationalError, connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.budgets import is_query_canceled, query_budget
+from core.metrics import Metrics, metrics
+from core.models import Tag
+from recipe.views import TagViewSet
+
+TAGS_URL = reverse('recipe:tag-list')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def statement_timeout():
+    with connection.cursor() as cursor:
+        cursor.execute('SHOW statement_timeout')
+        return cursor.fetchone()[0]
+
+
+class MetricsTests(SimpleTestCase):
+    """Test the metrics registry"""
+
+    def test_record(self):
+        """Test counters, gauges and summaries are kept per label"""
+        registry = Metrics()
+
+        registry.increment('requests', view='a')
+        registry.increment('requests', view='a')
+        registry.set('budget', 100, view='a')
+        registry.observe('elapsed', 3, view='a')
+        registry.observe('elapsed', 5, view='a')
+
+        self.assertEqual(registry.get('requests', view='a'), 2)
+        self.assertIsNone(registry.get('requests', view='b'))
+        self.assertEqual(registry.get('budget', view='a'), 100)
+        self.assertEqual(registry.get('elapsed', view='a'), (2, 8, 5))
+
+
+class QueryBudgetTests(TestCase):
+    """Test limiting the time spent on queries"""
+
+    def setUp(self):
+        metrics.reset()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_statement_timeout(self):
+        """Test postgres cancels statements past the budget and the
+        timeout is reset afterwards"""
+        default = statement_timeout()
+
+        with self.assertRaises(OperationalError) as error:
+            with query_budget(50), transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT pg_sleep(1)')
+
+        self.assertTrue(is_query_canceled(error.exception))
+        self.assertEqual(statement_timeout(), default)
+
+    def test_view_records_budget(self):
+        """Test the budget and time taken are recorded per view"""
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            metrics.get('query_budget.budget_ms', view='TagViewSet'), 2000,
+        )
+        count, _, _ = metrics.get(
+            'query_budget.elapsed_ms', view='TagViewSet',
+        )
+        self.assertEqual(count, 1)
+
+    @patch.object(TagViewSet, 'query_budget_ms', 0)
+    def test_spent_budget(self):
+        """Test no query runs once the budget is spent"""
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(
+            metrics.get('query_budget.exceeded', view='TagViewSet'), 1,
+        )
+
+    @patch.object(TagViewSet, 'query_budget_ms', 50)
+    def test_slow_query(self):
+        """Test a cancelled statement answers 503"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        slow = Tag.objects.extra(where=["pg_sleep(1)::text = ''"])
+
+        with patch.object(TagViewSet, 'queryset', slow):
+            res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(
+            metrics.get('query_budget.exceeded', view='TagViewSet'), 1,
+        )
+
+    @override_settings(MAX_FILTER_IDS=3)
+    def test_filter_ids_capped(self):
+        """Test filtering by too many ids returns an error"""
+        res = self.client.get(RECIPES_URL, {'tags': '1,2,3,4'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('tags', res.data)
+
+    def test_filter_invalid_id(self):
+        """Test filtering by an id that is not a number returns an
+        error"""
+        res = self.client.get(RECIPES_URL, {'ingredients': '1,x'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('ingredients', res.data)
@@ -3,6 +3,7 @@ Test Custom Django management commands
 """
 
 #  patch is to mock the behaviour of the db
+from io import StringIO
 from unittest.mock import patch
 
 # operationalerror is the common error that occurs when db is
@@ -16,7 +17,9 @@ from django.core.management import call_command
 from django.db.utils import OperationalError
 
 # for unit test, test the case where the db is not available
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, TestCase
+
+from core.models import Recipe
 
 
 # patch is used for mocking the behaviour of db, for all different
@@ -60,3 +63,50 @@ class CommandTests(SimpleTestCase):
         self.assertEqual(patched_check.call_count, 7)
         # checking the wait_for_db calling check multiple times
         patched_check.assert_called_with(databases=['default'])
+
+
+class BenchmarkCommandTests(SimpleTestCase):
+    """Test the benchmark commands"""
+
+    def test_benchmark_renderers(self):
+        """Test the renderer benchmark reports times and sizes"""
+        out = StringIO()
+
+        call_command('benchmark_renderers', recipes=10, repeat=1, stdout=out)
+
+        self.assertIn('ORJSONRenderer', out.getvalue())
+        self.assertIn('gzip', out.getvalue())
+
+    def test_benchmark_middleware(self):
+        """Test the middleware benchmark reports both stacks"""
+        out = StringIO()
+
+        call_command('benchmark_middleware', requests=2, repeat=1, stdout=out)
+
+        self.assertIn('full stack', out.getvalue())
+        self.assertIn('api stack', out.getvalue())
+
+    def test_overload_test(self):
+        """Test the overload test reports latency per priority"""
+        out = StringIO()
+
+        call_command(
+            'overload_test', workers=2, requests=6, rate=1000, service_ms=1,
+            stdout=out,
+        )
+
+        self.assertIn('with admission control', out.getvalue())
+        self.assertIn('p99', out.getvalue())
+
+
+class BenchmarkSerializersCommandTests(TestCase):
+    """Test the serializer benchmark, which needs the database"""
+
+    def test_benchmark_serializers(self):
+        """Test the serializer benchmark reports times and rolls back"""
+        out = StringIO()
+
+        call_command('benchmark_serializers', recipes=5, repeat=1, stdout=out)
+
+        self.assertIn('recipe_reader', out.getvalue())
+        self.assertFalse(Recipe.objects.exists())
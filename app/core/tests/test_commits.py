@@ -0,0 +1,38 @@
+"""
+Tests for the work done once a transaction commits
+"""
+from django.db import transaction
+from django.test import TestCase
+
+from core.commits import CommitBatch
+
+
+class CommitBatchTests(TestCase):
+    """Test flushing the items of a transaction once"""
+
+    def setUp(self):
+        self.flushed = []
+        self.batch = CommitBatch(self.flushed.append)
+
+    def test_flushed_once_on_commit(self):
+        """Test the items of a transaction are flushed together"""
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.batch.add([1, 2])
+            self.batch.add([2, 3])
+            self.assertEqual(self.flushed, [])
+
+        self.assertEqual(len(callbacks), 2)
+        self.assertEqual(self.flushed, [{1, 2, 3}])
+
+    def test_rolled_back_savepoint(self):
+        """Test items added in a rolled back savepoint are not lost"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.batch.add([1])
+            try:
+                with transaction.atomic():
+                    self.batch.add([2])
+                    raise ValueError
+            except ValueError:
+                pass
+
+        self.assertEqual(self.flushed, [{1, 2}])
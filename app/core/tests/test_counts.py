@@ -0,0 +1,106 @@
+"""
+Tests for the denormalized recipe counts
+"""
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from core.models import Ingredient, Recipe, Tag
+
+
+def create_recipe(user, title='Sample recipe'):
+    """Create and return a sample recipe"""
+    return Recipe.objects.create(
+        user=user,
+        title=title,
+        time_minutes=10,
+        price=Decimal('5.00'),
+    )
+
+
+class RecipeCountTests(TestCase):
+    """Test tags and ingredients count the recipes using them"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.ingredient = Ingredient.objects.create(
+            user=self.user,
+            name='Tofu',
+        )
+
+    def assertCount(self, obj, expected):
+        obj.refresh_from_db()
+        self.assertEqual(obj.recipe_count, expected)
+
+    def test_add_and_remove(self):
+        """Test adding and removing links updates the counts"""
+        r1 = create_recipe(self.user)
+        r2 = create_recipe(self.user)
+
+        r1.tags.add(self.tag)
+        r2.tags.add(self.tag)
+        r1.tags.add(self.tag)
+        r2.ingredients.add(self.ingredient)
+        self.assertCount(self.tag, 2)
+        self.assertCount(self.ingredient, 1)
+
+        r1.tags.remove(self.tag)
+        r1.tags.remove(self.tag)
+        self.assertCount(self.tag, 1)
+
+    def test_clear(self):
+        """Test clearing a recipe's tags releases them"""
+        other = Tag.objects.create(user=self.user, name='Dinner')
+        recipe = create_recipe(self.user)
+        recipe.tags.add(self.tag, other)
+
+        recipe.tags.clear()
+
+        self.assertCount(self.tag, 0)
+        self.assertCount(other, 0)
+
+    def test_reverse_relation(self):
+        """Test links made from the tag side are counted"""
+        r1 = create_recipe(self.user)
+        r2 = create_recipe(self.user)
+
+        self.tag.recipe_set.add(r1, r2)
+        self.assertCount(self.tag, 2)
+
+        self.tag.recipe_set.remove(r1)
+        self.assertCount(self.tag, 1)
+
+        self.tag.recipe_set.clear()
+        self.assertCount(self.tag, 0)
+
+    def test_delete_recipe(self):
+        """Test deleting a recipe releases its tags and ingredients"""
+        recipe = create_recipe(self.user)
+        recipe.tags.add(self.tag)
+        recipe.ingredients.add(self.ingredient)
+
+        recipe.delete()
+
+        self.assertCount(self.tag, 0)
+        self.assertCount(self.ingredient, 0)
+
+    def test_reconcile_command(self):
+        """Test the reconcile command repairs drifted counts"""
+        recipe = create_recipe(self.user)
+        recipe.tags.add(self.tag)
+        Tag.objects.filter(id=self.tag.id).update(recipe_count=7)
+        Ingredient.objects.filter(id=self.ingredient.id).update(recipe_count=3)
+        out = StringIO()
+
+        call_command('reconcile_recipe_counts', stdout=out)
+
+        self.assertCount(self.tag, 1)
+        self.assertCount(self.ingredient, 0)
+        self.assertIn('Fixed recipe_count of 1 tags', out.getvalue())
@@ -0,0 +1,148 @@
+"""
+Tests for the change events and their stream
+"""
+import asyncio
+import select
+from decimal import Decimal
+
+import orjson
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TransactionTestCase
+from rest_framework.authtoken.models import Token
+
+from core.event_stream import RESYNC, event_stream, format_event, hub
+from core.events import CHANNEL
+from core.models import Recipe, Tag
+
+
+def create_recipe(user):
+    """Create a recipe and close the connection of the calling thread"""
+    try:
+        return Recipe.objects.create(
+            user=user,
+            title='Sample recipe',
+            time_minutes=10,
+            price=Decimal('5.00'),
+        )
+    finally:
+        connection.close()
+
+
+class Stream:
+    """Client of the event stream"""
+
+    def __init__(self, token):
+        self.scope = {
+            'type': 'http',
+            'method': 'GET',
+            'path': '/api/recipe/events/',
+            'headers': [(b'authorization', f'Token {token}'.encode())],
+        }
+        self.messages = asyncio.Queue()
+        self.closed = asyncio.Event()
+
+    async def receive(self):
+        await self.closed.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        await self.messages.put(message)
+
+    def start(self):
+        return asyncio.ensure_future(
+            event_stream(self.scope, self.receive, self.send)
+        )
+
+    async def next_message(self):
+        return await asyncio.wait_for(self.messages.get(), timeout=5)
+
+
+class EventTests(TransactionTestCase):
+    """Test writes are streamed to the clients of their user"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.token = Token.objects.create(user=self.user)
+
+    def test_publish_on_commit(self):
+        """Test a write notifies the channel"""
+        listener = connection.copy()
+        listener.connect()
+        listener.connection.autocommit = True
+        try:
+            with listener.connection.cursor() as cursor:
+                cursor.execute(f'LISTEN {CHANNEL}')
+            tag = Tag.objects.create(user=self.user, name='Vegan')
+
+            select.select([listener.connection], [], [], 5)
+            listener.connection.poll()
+            events = [
+                orjson.loads(notify.payload)
+                for notify in listener.connection.notifies
+            ]
+        finally:
+            listener.close()
+
+        self.assertEqual(events, [{
+            'user': self.user.id,
+            'type': 'tag',
+            'id': tag.id,
+            'action': 'created',
+        }])
+
+    def test_stream(self):
+        """Test a stream receives the events of its user"""
+        async def scenario():
+            stream = Stream(self.token.key)
+            task = stream.start()
+            start = await stream.next_message()
+            await stream.next_message()
+
+            recipe = await asyncio.get_running_loop().run_in_executor(
+                None, create_recipe, self.user,
+            )
+            event = await stream.next_message()
+
+            stream.closed.set()
+            await task
+            return start, event, recipe
+
+        start, event, recipe = asyncio.run(scenario())
+
+        self.assertEqual(start['status'], 200)
+        self.assertIn(
+            (b'content-type', b'text/event-stream'), start['headers'],
+        )
+        self.assertEqual(event['body'], format_event({
+            'type': 'recipe', 'id': recipe.id, 'action': 'created',
+        }))
+        self.assertEqual(hub.streams, {})
+        self.assertIsNone(hub.connection)
+
+    def test_stream_requires_token(self):
+        """Test a stream without valid token is refused"""
+        async def scenario():
+            stream = Stream('invalid')
+            await stream.start()
+            return await stream.next_message()
+
+        start = asyncio.run(scenario())
+
+        self.assertEqual(start['status'], 401)
+
+    def test_slow_stream_resyncs(self):
+        """Test a stream that fell behind is told to resync"""
+        async def scenario():
+            queue = hub.subscribe(self.user.id)
+            try:
+                for i in range(queue.maxsize + 1):
+                    hub._put(queue, {'type': 'recipe', 'id': i})
+                return [queue.get_nowait() for _ in range(queue.qsize())]
+            finally:
+                hub.unsubscribe(self.user.id, queue)
+
+        self.assertEqual(asyncio.run(scenario()), [RESYNC])
@@ -0,0 +1,164 @@
+"""
+Tests for the Idempotency-Key support
+"""
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import IdempotencyKey, Recipe
+
+RECIPES_URL = reverse('recipe:recipe-list')
+CREATE_USER_URL = reverse('user:create')
+
+PAYLOAD = {
+    'title': 'Sample recipe',
+    'time_minutes': 30,
+    'price': '5.99',
+}
+
+
+class IdempotencyTests(TestCase):
+    """Test retrying requests with an Idempotency-Key"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def post_recipe(self, payload, key='key-1'):
+        return self.client.post(
+            RECIPES_URL, payload, format='json', HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_retry_replays_response(self):
+        """Test a retry gets the first response without a second recipe"""
+        first = self.post_recipe(PAYLOAD)
+        retry = self.post_recipe(PAYLOAD)
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Recipe.objects.count(), 1)
+
+    def test_without_key(self):
+        """Test requests without a key are not deduplicated"""
+        self.client.post(RECIPES_URL, PAYLOAD, format='json')
+        self.client.post(RECIPES_URL, PAYLOAD, format='json')
+
+        self.assertEqual(Recipe.objects.count(), 2)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_key_reused(self):
+        """Test a key sent with a different body is refused"""
+        self.post_recipe(PAYLOAD)
+        res = self.post_recipe({**PAYLOAD, 'title': 'Other recipe'})
+
+        self.assertEqual(
+            res.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+        self.assertEqual(Recipe.objects.count(), 1)
+
+    def test_in_progress(self):
+        """Test a retry while the first attempt runs is refused"""
+        scope = f'user:{self.user.pk}:POST:{RECIPES_URL}'
+        self.post_recipe(PAYLOAD)
+        IdempotencyKey.objects.filter(scope=scope).update(
+            status_code=None, response=None,
+        )
+
+        res = self.post_recipe(PAYLOAD)
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+
+    def test_stale_claim_taken_over(self):
+        """Test a retry takes over the claim of an attempt that died"""
+        self.post_recipe(PAYLOAD, key='key-0')
+        fingerprint = IdempotencyKey.objects.get().fingerprint
+        IdempotencyKey.objects.create(
+            scope=f'user:{self.user.pk}:POST:{RECIPES_URL}',
+            key='key-1',
+            fingerprint=fingerprint,
+            claimed=timezone.now() - timedelta(hours=1),
+        )
+
+        res = self.post_recipe(PAYLOAD)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('Idempotent-Replayed', res)
+        self.assertIsNotNone(
+            IdempotencyKey.objects.get(key='key-1').status_code,
+        )
+
+    def test_failed_request_releases_key(self):
+        """Test a failed request can be retried with the same key"""
+        res = self.post_recipe({'title': 'No time or price'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        res = self.post_recipe({'title': 'No time or price'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertNotIn('Idempotent-Replayed', res)
+
+    def test_keys_scoped_per_user(self):
+        """Test two users can send the same key"""
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            'testpass123',
+        )
+        self.post_recipe(PAYLOAD)
+        self.client.force_authenticate(other)
+
+        res = self.post_recipe(PAYLOAD)
+
+        self.assertNotIn('Idempotent-Replayed', res)
+        self.assertEqual(Recipe.objects.filter(user=other).count(), 1)
+
+    def test_sign_up_retry(self):
+        """Test a retried sign up does not fail on the existing user"""
+        self.client.force_authenticate(None)
+        payload = {
+            'email': 'new@example.com',
+            'password': 'testpass123',
+            'name': 'New',
+        }
+
+        first = self.client.post(
+            CREATE_USER_URL, payload, HTTP_IDEMPOTENCY_KEY='signup',
+        )
+        retry = self.client.post(
+            CREATE_USER_URL, payload, HTTP_IDEMPOTENCY_KEY='signup',
+        )
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+
+    def test_purge(self):
+        """Test the command deletes only the expired keys"""
+        self.post_recipe(PAYLOAD, key='old')
+        self.post_recipe(PAYLOAD, key='new')
+        IdempotencyKey.objects.filter(key='old').update(
+            created=timezone.now() - timedelta(days=2),
+        )
+        out = StringIO()
+
+        call_command('purge_idempotency_keys', stdout=out)
+
+        self.assertIn('Deleted 1 expired', out.getvalue())
+        self.assertEqual(
+            list(IdempotencyKey.objects.values_list('key', flat=True)),
+            ['new'],
+        )
@@ -0,0 +1,173 @@
+"""
+Tests for the cache invalidation bus
+"""
+import multiprocessing
+import tempfile
+import time
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+
+from core.invalidation import LocalCache, bus, object_key, user_key
+from core.metrics import metrics
+from core.models import Recipe, Tag
+
+WORKERS = 3
+
+
+def worker(key, ready, results):
+    """Cache a value under key, then report whether and how fast its
+    invalidation arrived"""
+    cache = LocalCache()
+    bus.start()
+    bus.listening.wait(10)
+    cache.get_or_set(key, lambda: 'cached')
+    ready.put(True)
+    deadline = time.time() + 10
+    while key in cache.entries and time.time() < deadline:
+        time.sleep(0.01)
+    results.put((
+        key not in cache.entries,
+        metrics.get('invalidation.lag_ms'),
+    ))
+
+
+@patch.object(bus, 'start', lambda: None)
+class LocalCacheTests(SimpleTestCase):
+    """Test the in-process cache"""
+
+    def test_invalidate(self):
+        """Test entries are computed once until invalidated"""
+        cache = LocalCache()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(cache.get_or_set('tag:1', compute), 1)
+        self.assertEqual(cache.get_or_set('tag:1', compute), 1)
+        cache.invalidate(['tag:1'])
+        self.assertEqual(cache.get_or_set('tag:1', compute), 2)
+
+    def test_evicted_by_size(self):
+        """Test the least recently used entries are dropped once the
+        sizes add up to more than maxsize"""
+        cache = LocalCache(maxsize=5, sizeof=len)
+
+        cache.get_or_set('tag:1', lambda: 'abc')
+        cache.get_or_set('tag:2', lambda: 'de')
+        cache.get_or_set('tag:1', lambda: 'abc')
+        cache.get_or_set('tag:3', lambda: 'f')
+
+        self.assertEqual(list(cache.entries), ['tag:1', 'tag:3'])
+        self.assertEqual(cache.size, 4)
+        cache.get_or_set('tag:4', lambda: 'ghijkl')
+        self.assertEqual(list(cache.entries), [])
+        self.assertEqual(cache.size, 0)
+
+    def test_stale_value_not_stored(self):
+        """Test a value computed while an invalidation arrived is not
+        stored"""
+        cache = LocalCache()
+
+        def compute():
+            cache.invalidate(['tag:1'])
+            return 'stale'
+
+        cache.get_or_set('tag:1', compute)
+
+        self.assertNotIn('tag:1', cache.entries)
+
+
+class PublishTests(TestCase):
+    """Test writes publish the keys they make stale"""
+
+    def test_published_once_on_commit(self):
+        """Test the keys of a transaction are published together once it
+        commits"""
+        with patch.object(bus, 'send') as send:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.user = get_user_model().objects.create_user(
+                    'user@example.com',
+                    'testpass123',
+                )
+                recipe = Recipe.objects.create(
+                    user=self.user, title='Curry', time_minutes=10,
+                    price='5.00',
+                )
+                tag = Tag.objects.create(user=self.user, name='Vegan')
+                recipe.tags.add(tag)
+                self.assertFalse(send.called)
+
+        send.assert_called_once()
+        keys = send.call_args[0][0]
+        for key in [
+            object_key(get_user_model(), self.user.id),
+            object_key(Recipe, recipe.id),
+            object_key(Tag, tag.id),
+            user_key(Recipe, self.user.id),
+            user_key(Tag, self.user.id),
+        ]:
+            self.assertIn(key, keys)
+
+
+class WorkerProcessTests(TransactionTestCase):
+    """Test invalidations reach several worker processes"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+
+    def assertWorkersInvalidated(self):
+        key = user_key(Tag, self.user.id)
+        context = multiprocessing.get_context('fork')
+        ready = context.Queue()
+        results = context.Queue()
+        # forked workers must not share the connection of this process
+        connections.close_all()
+        processes = [
+            context.Process(target=worker, args=(key, ready, results))
+            for _ in range(WORKERS)
+        ]
+        for process in processes:
+            process.start()
+        try:
+            for _ in processes:
+                ready.get(timeout=10)
+            Tag.objects.create(user=self.user, name='Vegan')
+
+            received = [results.get(timeout=15) for _ in processes]
+        finally:
+            for process in processes:
+                process.join(timeout=5)
+                process.terminate()
+
+        for invalidated, lag in received:
+            self.assertTrue(invalidated)
+            count, _, maximum = lag
+            self.assertGreaterEqual(count, 1)
+            self.assertLess(maximum, 5000)
+
+    def test_postgres(self):
+        """Test invalidations sent through LISTEN/NOTIFY"""
+        with override_settings(INVALIDATION_BUS='postgres'):
+            self.assertWorkersInvalidated()
+
+    def test_socket(self):
+        """Test invalidations sent through unix sockets"""
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(
+                INVALIDATION_BUS='socket',
+                INVALIDATION_SOCKET_DIR=directory,
+            ):
+                self.assertWorkersInvalidated()
@@ -0,0 +1,145 @@
+"""
+Tests for the background job queue
+"""
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from core.jobs import claim, requeue_stale, task, work
+from core.metrics import metrics
+from core.models import Job
+
+calls = []
+
+
+@task(name='tests.record')
+def record(value):
+    calls.append(value)
+
+
+@task(name='tests.fail', max_attempts=2)
+def fail():
+    raise ValueError('Broken')
+
+
+class JobTests(TestCase):
+    """Test running the queued jobs"""
+
+    def setUp(self):
+        calls.clear()
+        metrics.reset()
+
+    def test_run(self):
+        """Test a queued job runs once with its arguments"""
+        job = record.enqueue(value='a')
+
+        self.assertEqual(work(burst=True), 1)
+
+        job.refresh_from_db()
+        self.assertEqual(calls, ['a'])
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNotNone(job.finished)
+        self.assertEqual(
+            metrics.get('jobs.done', queue='default', task='tests.record'), 1,
+        )
+        self.assertEqual(work(burst=True), 0)
+
+    def test_priority(self):
+        """Test jobs with a higher priority run first, then the oldest"""
+        record.enqueue(value='low', priority=-1)
+        record.enqueue(value='first')
+        record.enqueue(value='second')
+        record.enqueue(value='high', priority=5)
+
+        work(burst=True)
+
+        self.assertEqual(calls, ['high', 'first', 'second', 'low'])
+
+    def test_delay(self):
+        """Test a job does not run before its time"""
+        record.enqueue(value='later', delay=timedelta(minutes=5))
+
+        self.assertEqual(work(burst=True), 0)
+        self.assertEqual(calls, [])
+
+    def test_retry_with_backoff(self):
+        """Test a failing job is retried later until out of attempts"""
+        job = fail.enqueue()
+
+        work(burst=True)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn('ValueError: Broken', job.last_error)
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        work(burst=True)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(
+            metrics.get('jobs.failed', queue='default', task='tests.fail'), 1,
+        )
+
+    @override_settings(JOB_QUEUES={'default': 1})
+    def test_concurrency_limit(self):
+        """Test no more jobs of a queue run at once than its limit"""
+        first = record.enqueue(value='a')
+        record.enqueue(value='b')
+
+        self.assertEqual(claim('worker-1', ['default']).pk, first.pk)
+        self.assertIsNone(claim('worker-2', ['default']))
+
+    def test_requeue_stale(self):
+        """Test the jobs of crashed workers run again"""
+        job = record.enqueue(value='a')
+        claim('crashed', ['default'])
+        Job.objects.filter(pk=job.pk).update(
+            locked_at=timezone.now() - timedelta(hours=1),
+        )
+
+        self.assertEqual(requeue_stale(), 1)
+        work(burst=True)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(calls, ['a'])
+
+    def test_command(self):
+        """Test the command runs the due jobs"""
+        record.enqueue(value='a')
+        out = StringIO()
+
+        call_command('run_jobs', '--burst', stdout=out)
+
+        self.assertEqual(calls, ['a'])
+        self.assertIn('Ran 1 jobs', out.getvalue())
+
+
+class ClaimTests(TransactionTestCase):
+    """Test workers share the queue"""
+
+    def test_skip_locked(self):
+        """Test a job locked by another worker is skipped"""
+        first = record.enqueue(value='a')
+        second = record.enqueue(value='b')
+        other = connection.copy()
+        try:
+            with other.cursor() as cursor:
+                cursor.execute('BEGIN')
+                cursor.execute(
+                    'SELECT id FROM core_job WHERE id = %s FOR UPDATE',
+                    [first.pk],
+                )
+                self.assertEqual(claim('worker', ['default']).pk, second.pk)
+                cursor.execute('ROLLBACK')
+        finally:
+            other.close()
@@ -0,0 +1,39 @@
+"""
+Tests for the in process metrics
+"""
+import json
+
+from django.test import SimpleTestCase
+
+from core.metrics import Metrics
+
+
+class MetricsTests(SimpleTestCase):
+    """Test recording and reporting metrics"""
+
+    def test_snapshot(self):
+        """Test the values are keyed by name and labels"""
+        metrics = Metrics()
+
+        metrics.increment('jobs.done', queue='default')
+        metrics.increment('jobs.done', queue='default')
+        metrics.set('admission.in_flight', 3)
+        metrics.observe('backfill.batch_ms', 4, backfill='tags')
+        metrics.observe('backfill.batch_ms', 2, backfill='tags')
+
+        self.assertEqual(metrics.snapshot(), {
+            'jobs.done{queue=default}': 2,
+            'admission.in_flight': 3,
+            'backfill.batch_ms{backfill=tags}': (2, 6, 4),
+        })
+
+    def test_report(self):
+        """Test the values are logged as JSON"""
+        metrics = Metrics()
+        metrics.increment('invalidation.dropped')
+
+        with self.assertLogs('core.metrics', 'INFO') as logs:
+            metrics.report()
+
+        values = json.loads(logs.records[0].getMessage().split(' ', 2)[2])
+        self.assertEqual(values, {'invalidation.dropped': 1})
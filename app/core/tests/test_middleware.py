@@ -0,0 +1,411 @@
+"""
+Tests for the API middleware
+"""
+import gzip
+import threading
+import time
+from unittest.mock import patch
+
+import brotli
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import (
+    Client,
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+)
+from rest_framework.authtoken.models import Token
+
+from core.metrics import metrics
+from core.middleware import (
+    AdmissionControlMiddleware,
+    BrowserMiddleware,
+    CompressionMiddleware,
+    SingleFlightMiddleware,
+    accepted_encodings,
+    queue_wait_ms,
+)
+from core.models import Tag
+
+BODY = b'{"id": 1, "title": "Sample recipe"}' * 100
+
+
+@override_settings(COMPRESSION_MIN_SIZE=200)
+class CompressionMiddlewareTests(SimpleTestCase):
+    """Test compressing API responses"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def get_response(self, response, path='/api/recipe/recipes/', **extra):
+        request = self.factory.get(path, **extra)
+        middleware = CompressionMiddleware(lambda request: response)
+        return middleware(request)
+
+    def test_accepted_encodings(self):
+        """Test parsing Accept-Encoding with quality values"""
+        self.assertEqual(
+            accepted_encodings('gzip, deflate;q=0.5, br;q=0'),
+            {'gzip', 'deflate'},
+        )
+
+    def test_brotli_preferred(self):
+        """Test brotli is used when the client accepts it"""
+        res = self.get_response(
+            HttpResponse(BODY),
+            HTTP_ACCEPT_ENCODING='gzip, deflate, br',
+        )
+
+        self.assertEqual(res['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(res.content), BODY)
+        self.assertEqual(res['Content-Length'], str(len(res.content)))
+        self.assertIn('Accept-Encoding', res['Vary'])
+
+    def test_gzip(self):
+        """Test gzip is used when brotli is not accepted"""
+        res = self.get_response(
+            HttpResponse(BODY),
+            HTTP_ACCEPT_ENCODING='gzip',
+        )
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(res.content), BODY)
+
+    def test_small_response_not_compressed(self):
+        """Test responses below the size threshold are sent as is"""
+        res = self.get_response(
+            HttpResponse(b'{"id": 1}'),
+            HTTP_ACCEPT_ENCODING='br',
+        )
+
+        self.assertFalse(res.has_header('Content-Encoding'))
+        self.assertEqual(res.content, b'{"id": 1}')
+
+    def test_identity_only(self):
+        """Test nothing is compressed without an accepted encoding"""
+        res = self.get_response(HttpResponse(BODY))
+
+        self.assertFalse(res.has_header('Content-Encoding'))
+        self.assertEqual(res.content, BODY)
+
+    def test_non_api_path_not_compressed(self):
+        """Test only API paths are compressed"""
+        res = self.get_response(
+            HttpResponse(BODY),
+            path='/admin/',
+            HTTP_ACCEPT_ENCODING='br',
+        )
+
+        self.assertFalse(res.has_header('Content-Encoding'))
+
+    def test_encoded_response_untouched(self):
+        """Test already encoded responses are not compressed twice"""
+        response = HttpResponse(gzip.compress(BODY))
+        response['Content-Encoding'] = 'gzip'
+
+        res = self.get_response(response, HTTP_ACCEPT_ENCODING='br')
+
+        self.assertEqual(gzip.decompress(res.content), BODY)
+
+    def test_etag_weakened(self):
+        """Test a strong ETag is made weak on compression"""
+        response = HttpResponse(BODY)
+        response['ETag'] = '"abc"'
+
+        res = self.get_response(response, HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(res['ETag'], 'W/"abc"')
+
+    def test_streaming_brotli(self):
+        """Test streamed responses are compressed chunk by chunk"""
+        chunks = [BODY[:100], BODY[100:]]
+
+        res = self.get_response(
+            StreamingHttpResponse(iter(chunks)),
+            HTTP_ACCEPT_ENCODING='br',
+        )
+
+        self.assertEqual(res['Content-Encoding'], 'br')
+        content = b''.join(res.streaming_content)
+        self.assertEqual(brotli.decompress(content), BODY)
+
+
+def view(request):
+    return HttpResponse()
+
+
+class BrowserMiddlewareTests(TestCase):
+    """Test the browser middleware only runs outside the API"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = BrowserMiddleware(view)
+
+    def test_api_request_skips_browser_middleware(self):
+        """Test API requests get no session or user from middleware"""
+        request = self.factory.get('/api/recipe/recipes/')
+
+        res = self.middleware(request)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertFalse(hasattr(request, 'session'))
+        self.assertFalse(hasattr(request, 'user'))
+        self.assertNotIn('Vary', res)
+
+    def test_admin_request_runs_browser_middleware(self):
+        """Test other requests get the session and user"""
+        request = self.factory.get('/admin/')
+
+        self.middleware(request)
+
+        self.assertTrue(hasattr(request, 'session'))
+        self.assertFalse(request.user.is_authenticated)
+
+    def test_csrf_checked_outside_api(self):
+        """Test the CSRF check still runs for the admin, but not the API"""
+        api_request = self.factory.post('/api/recipe/recipes/')
+        admin_request = self.factory.post('/admin/login/')
+
+        self.assertIsNone(
+            self.middleware.process_view(api_request, view, (), {})
+        )
+        res = self.middleware.process_view(admin_request, view, (), {})
+        self.assertEqual(res.status_code, 403)
+
+    def test_admin_login_form(self):
+        """Test the admin login page works through the middleware"""
+        client = Client(enforce_csrf_checks=True)
+
+        res = client.get('/admin/login/')
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('csrftoken', res.cookies)
+
+        res = client.post('/admin/login/', {'username': 'x'})
+        self.assertEqual(res.status_code, 403)
+
+
+class AdmissionControlMiddlewareTests(SimpleTestCase):
+    """Test shedding requests when the worker is overloaded"""
+
+    def setUp(self):
+        metrics.reset()
+        self.factory = RequestFactory()
+        self.middleware = AdmissionControlMiddleware(view)
+
+    def get_response(self, path, waited_ms=None, method='get'):
+        extra = {}
+        if waited_ms is not None:
+            started = time.time() - waited_ms / 1000
+            extra['HTTP_X_REQUEST_START'] = f't={started:.3f}'
+        request = getattr(self.factory, method)(path, **extra)
+        return self.middleware(request)
+
+    def test_queue_wait(self):
+        """Test reading the queue wait from the nginx header"""
+        request = self.factory.get(
+            '/', HTTP_X_REQUEST_START=f't={time.time() - 2:.3f}',
+        )
+
+        self.assertAlmostEqual(queue_wait_ms(request), 2000, delta=100)
+        self.assertIsNone(queue_wait_ms(self.factory.get('/')))
+
+    def test_low_priority_shed_first(self):
+        """Test a queue wait sheds low priority requests but not critical
+        ones"""
+        res = self.get_response('/api/schema/', waited_ms=1000)
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res['Retry-After'], '30')
+        self.assertEqual(metrics.get('admission.shed', priority='low'), 1)
+
+        res = self.get_response('/api/user/token/', 1000, method='post')
+        self.assertEqual(res.status_code, 200)
+        res = self.get_response('/api/recipe/recipes/', waited_ms=1000)
+        self.assertEqual(res.status_code, 200)
+
+    def test_normal_priority_shed(self):
+        """Test requests matching no rule are shed after a long wait"""
+        res = self.get_response('/api/recipe/tags/', waited_ms=1000)
+        self.assertEqual(res.status_code, 200)
+
+        res = self.get_response('/api/recipe/tags/', waited_ms=3000)
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res['Retry-After'], '5')
+
+    def test_in_flight_limit(self):
+        """Test requests are shed when too many are in flight"""
+        self.middleware.in_flight = 1
+
+        res = self.get_response('/api/recipe/recipes/1/upload-image/',
+                                method='post')
+        self.assertEqual(res.status_code, 503)
+        res = self.get_response('/api/recipe/tags/')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.middleware.in_flight, 1)
+
+    def test_in_flight_limits_fit_threads(self):
+        """Test every thread of a worker is free for critical requests
+        and normal ones leave one of them"""
+        self.middleware.in_flight = settings.WORKER_THREADS - 1
+
+        res = self.get_response('/api/recipe/tags/')
+        self.assertEqual(res.status_code, 503)
+        res = self.get_response('/api/recipe/recipes/')
+        self.assertEqual(res.status_code, 200)
+
+    def test_without_nginx(self):
+        """Test requests without the header are only limited in flight"""
+        res = self.get_response('/api/schema/')
+
+        self.assertEqual(res.status_code, 200)
+
+
+class SingleFlightMiddlewareTests(SimpleTestCase):
+    """Test coalescing identical concurrent GETs"""
+
+    def setUp(self):
+        metrics.reset()
+        # every user's library at the same version, without a database
+        versions = patch.object(
+            SingleFlightMiddleware, 'get_version', return_value='1:None',
+        )
+        versions.start()
+        self.addCleanup(versions.stop)
+        self.factory = RequestFactory()
+        self.calls = []
+        self.release = threading.Event()
+
+    def slow_view(self, request):
+        self.calls.append(request.get_full_path())
+        # hold the first request until every request has arrived
+        self.release.wait(5)
+        return HttpResponse(f'{len(self.calls)}', content_type='text/plain')
+
+    def send_concurrently(self, middlewares, requests):
+        """Send the requests at once, return their responses"""
+        responses = [None] * len(requests)
+
+        def send(i):
+            middleware = middlewares[i % len(middlewares)]
+            responses[i] = middleware(requests[i])
+
+        threads = [
+            threading.Thread(target=send, args=(i,))
+            for i in range(len(requests))
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.2)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        return responses
+
+    def get(self, path, token='abc'):
+        return self.factory.get(path, HTTP_AUTHORIZATION=f'Token {token}')
+
+    def test_identical_requests_coalesced(self):
+        """Test identical requests, query parameters in any order, share
+        one response"""
+        middleware = SingleFlightMiddleware(self.slow_view)
+
+        responses = self.send_concurrently([middleware], [
+            self.get('/api/recipe/recipes/?tags=1&ingredients=2'),
+            self.get('/api/recipe/recipes/?ingredients=2&tags=1'),
+            self.get('/api/recipe/recipes/?tags=1&ingredients=2'),
+        ])
+
+        self.assertEqual(len(self.calls), 1)
+        for res in responses:
+            self.assertEqual(res.content, b'1')
+            self.assertEqual(res['Content-Type'], 'text/plain')
+        self.assertEqual(
+            metrics.get('single_flight.coalesced', shared='thread'), 2,
+        )
+
+    def test_different_users_not_coalesced(self):
+        """Test requests of other users or other URLs run on their own"""
+        middleware = SingleFlightMiddleware(self.slow_view)
+
+        self.send_concurrently([middleware], [
+            self.get('/api/recipe/recipes/'),
+            self.get('/api/recipe/recipes/', token='other'),
+            self.get('/api/recipe/recipes/?tags=1'),
+            self.factory.get('/api/recipe/recipes/'),
+        ])
+
+        self.assertEqual(len(self.calls), 4)
+
+    def test_other_versions_not_coalesced(self):
+        """Test a request sent after a write does not wait for a response
+        computed before it"""
+        middleware = SingleFlightMiddleware(self.slow_view)
+
+        with patch.object(middleware, 'get_version', side_effect=[
+            '1:None', '2:None',
+        ]):
+            self.send_concurrently([middleware], [
+                self.get('/api/recipe/recipes/'),
+                self.get('/api/recipe/recipes/'),
+            ])
+
+        self.assertEqual(len(self.calls), 2)
+
+    def test_streaming_not_shared(self):
+        """Test a streamed response is not shared"""
+        def view(request):
+            self.calls.append(request.path)
+            self.release.wait(5)
+            return StreamingHttpResponse([b'[]'])
+        middleware = SingleFlightMiddleware(view)
+
+        self.send_concurrently([middleware], [
+            self.get('/api/recipe/recipes/'),
+            self.get('/api/recipe/recipes/'),
+        ])
+
+        self.assertEqual(len(self.calls), 2)
+
+    @override_settings(SINGLE_FLIGHT_CACHE='default')
+    def test_coalesced_across_workers(self):
+        """Test workers sharing a cache share responses"""
+        workers = [
+            SingleFlightMiddleware(self.slow_view),
+            SingleFlightMiddleware(self.slow_view),
+        ]
+
+        responses = self.send_concurrently(workers, [
+            self.get('/api/recipe/tags/'),
+            self.get('/api/recipe/tags/'),
+        ])
+
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual([res.content for res in responses], [b'1', b'1'])
+        self.assertEqual(
+            metrics.get('single_flight.coalesced', shared='cache'), 1,
+        )
+
+
+class SingleFlightVersionTests(TestCase):
+    """Test the version of a user's library coalesced requests share"""
+
+    def test_version_follows_writes(self):
+        """Test the version changes with every write to the library"""
+        user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        token = Token.objects.create(user=user)
+        middleware = SingleFlightMiddleware(lambda request: HttpResponse())
+
+        versions = [middleware.get_version(token.key)]
+        tag = Tag.objects.create(user=user, name='Vegan')
+        versions.append(middleware.get_version(token.key))
+        tag.delete()
+        versions.append(middleware.get_version(token.key))
+
+        self.assertEqual(len(set(versions)), 3)
+        self.assertIsNone(middleware.get_version('unknown'))
@@ -0,0 +1,169 @@
+"""
+Tests for the migration operations changing large tables online
+"""
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db import (
+    IntegrityError,
+    connection,
+    migrations,
+    models,
+    transaction,
+)
+from django.db.migrations.loader import MigrationLoader
+from django.test import TestCase
+
+from core.management.commands.check_migrations import check_operation
+from core.models import Job, Tag
+from core.operations import (
+    AddConstraintNotValid,
+    AddIndexConcurrently,
+    Backfill,
+    ValidateConstraint,
+)
+
+CONSTRAINT = models.CheckConstraint(
+    check=models.Q(recipe_count__lt=5), name='tag_few_recipes',
+)
+
+
+class OperationTests(TestCase):
+    """Test the online migration operations"""
+
+    def setUp(self):
+        self.state = MigrationLoader(connection).project_state()
+
+    def apply(self, operation):
+        """Apply operation to the test database"""
+        new_state = self.state.clone()
+        operation.state_forwards('core', new_state)
+        # no ALTER TABLE while the foreign keys of the test's rows are
+        # still to be checked
+        with connection.cursor() as cursor:
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        with connection.schema_editor() as editor:
+            operation.database_forwards('core', editor, self.state, new_state)
+        self.state = new_state
+
+    def test_constraint_not_valid(self):
+        """Test a constraint is checked for the new rows, then the existing
+        ones once validated"""
+        user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        Tag.objects.create(user=user, name='Vegan', recipe_count=7)
+
+        self.apply(AddConstraintNotValid('tag', CONSTRAINT))
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Tag.objects.create(user=user, name='Sweet', recipe_count=9)
+        with self.assertRaises(IntegrityError):
+            self.apply(ValidateConstraint('tag', 'tag_few_recipes'))
+
+    def test_backfill(self):
+        """Test a migration queues its backfill as a job"""
+        self.apply(Backfill('core.backfills.tag_recipe_counts'))
+        self.assertFalse(Job.objects.exists())
+        user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        Tag.objects.create(user=user, name='Vegan')
+
+        self.apply(Backfill('core.backfills.tag_recipe_counts'))
+
+        job = Job.objects.get()
+        self.assertEqual(job.name, 'core.tasks.run_backfill')
+        self.assertEqual(
+            job.kwargs, {'name': 'core.backfills.tag_recipe_counts'},
+        )
+
+
+class CheckMigrationsTests(TestCase):
+    """Test flagging migrations blocking writes"""
+
+    def test_check_operation(self):
+        """Test the operations blocking writes are told from the online
+        ones"""
+        index = models.Index(fields=['name'], name='core_tag_name_idx')
+        field = models.CharField(max_length=255, null=True)
+        flagged = [
+            migrations.AddIndex('tag', index),
+            migrations.AddConstraint('tag', CONSTRAINT),
+            migrations.AddField(
+                'tag', 'other', models.ForeignKey(
+                    'core.Tag', null=True, on_delete=models.CASCADE,
+                ),
+            ),
+            migrations.RunSQL('CREATE INDEX tag_idx ON core_tag (name)'),
+            migrations.RunSQL('UPDATE core_tag SET name = UPPER(name)'),
+        ]
+        online = [
+            AddIndexConcurrently('tag', index),
+            AddConstraintNotValid('tag', CONSTRAINT),
+            ValidateConstraint('tag', 'tag_few_recipes'),
+            migrations.AddField('tag', 'note', field),
+            migrations.RunSQL(
+                'CREATE INDEX CONCURRENTLY tag_idx ON core_tag (name)',
+            ),
+            migrations.RunSQL('SELECT id FROM core_tag FOR UPDATE'),
+            migrations.AddField(
+                'tag', 'related', models.ManyToManyField('core.Tag'),
+            ),
+        ]
+
+        for operation in flagged:
+            self.assertIsNotNone(
+                check_operation(operation, 'core', set(), False),
+            )
+        for operation in online:
+            self.assertIsNone(
+                check_operation(operation, 'core', set(), False),
+            )
+        self.assertIsNotNone(check_operation(online[0], 'core', set(), True))
+        self.assertIsNone(
+            check_operation(flagged[0], 'core', {('core', 'tag')}, True),
+        )
+
+    def test_check_alter_field(self):
+        """Test an AlterField is flagged when it changes the table"""
+        state = MigrationLoader(connection).project_state()
+
+        def check(field):
+            operation = migrations.AlterField('tag', 'name', field)
+            new_state = state.clone()
+            operation.state_forwards('core', new_state)
+            return check_operation(
+                operation, 'core', set(), True, state, new_state, connection,
+            )
+
+        self.assertIsNone(check(models.CharField(
+            max_length=255, verbose_name='label',
+        )))
+        self.assertIsNone(check(models.CharField(max_length=255, null=True)))
+        self.assertIsNotNone(check(models.CharField(max_length=100)))
+
+    def test_command(self):
+        """Test the command fails on blocking migrations not ignored"""
+        out = StringIO()
+        call_command('check_migrations', stdout=out)
+        self.assertIn('No blocking migrations', out.getvalue())
+        call_command('check_migrations', 'core', all=True, stdout=out)
+
+        with patch(
+            'core.management.commands.check_migrations.check_operation',
+            return_value='blocks writes',
+        ):
+            with self.assertRaises(CommandError):
+                call_command('check_migrations', 'core', all=True, stdout=out)
+            self.assertIn('core.0006_recipe_count', out.getvalue())
+
+            call_command('check_migrations', 'core', all=True, ignore=[
+                f'{app_label}.{name}' for app_label, name in MigrationLoader(
+                    connection,
+                ).disk_migrations if app_label == 'core'
+            ], stdout=out)
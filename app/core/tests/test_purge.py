@@ -0,0 +1,170 @@
+"""
+Tests for purging deleted accounts and libraries
+"""
+import os
+import tempfile
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.jobs import work
+from core.models import (
+    Ingredient,
+    Job,
+    Recipe,
+    RecipeSnapshot,
+    Tag,
+    Tombstone,
+)
+from core.purge import delete_account, purge_deleted_users
+
+LIBRARY_URL = reverse('recipe:library')
+RECIPES_URL = reverse('recipe:recipe-list')
+SYNC_URL = reverse('recipe:sync')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+def create_recipe(user, title='Sample recipe'):
+    """Create and return a sample recipe"""
+    return Recipe.objects.create(
+        user=user,
+        title=title,
+        time_minutes=10,
+        price=Decimal('5.00'),
+    )
+
+
+@override_settings(PURGE_BATCH_SIZE=2)
+class PurgeTests(TestCase):
+    """Test deleted data is hidden at once and purged in batches"""
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.other_user = get_user_model().objects.create_user(
+            'other@example.com',
+            'testpass123',
+        )
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+        self.recipes = []
+        for i in range(3):
+            recipe = create_recipe(self.user)
+            recipe.tags.add(tag)
+            recipe.ingredients.add(ingredient)
+            recipe.image.save(f'{i}.jpg', ContentFile(b'image'))
+            self.recipes.append(recipe)
+        self.kept = create_recipe(self.other_user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def purge(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return purge_deleted_users()
+
+    def assertPurged(self):
+        self.assertEqual(list(Recipe.objects.all()), [self.kept])
+        self.assertFalse(Tag.objects.exists())
+        self.assertFalse(Ingredient.objects.exists())
+        self.assertFalse(RecipeSnapshot.objects.exclude(
+            recipe=self.kept,
+        ).exists())
+        for recipe in self.recipes:
+            self.assertFalse(os.path.exists(recipe.image.path))
+
+    def test_delete_account(self):
+        """Test the data of a deleted account is purged with it"""
+        Token.objects.create(user=self.user)
+        self.client.get(RECIPES_URL)
+
+        delete_account(self.user)
+
+        self.assertFalse(Token.objects.filter(user=self.user).exists())
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(self.purge(), 1)
+        self.assertPurged()
+        self.assertFalse(
+            get_user_model().objects.filter(id=self.user.id).exists()
+        )
+        self.assertEqual(self.purge(), 0)
+
+    def test_delete_library(self):
+        """Test a deleted library is hidden at once and purged later,
+        leaving what was created since"""
+        res = self.client.delete(LIBRARY_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.client.get(RECIPES_URL).json(), [])
+        self.assertEqual(self.client.get(TAGS_URL).json(), [])
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 3)
+        res = self.client.post(RECIPES_URL, {
+            'title': 'New recipe',
+            'time_minutes': 10,
+            'price': '5.00',
+            'tags': [{'name': 'Vegan'}],
+        }, format='json')
+        new_recipe = Recipe.objects.get(id=res.data['id'])
+
+        self.assertEqual(self.purge(), 1)
+        self.assertEqual(
+            list(Recipe.objects.filter(user=self.user)), [new_recipe],
+        )
+        self.assertEqual(
+            list(Tag.objects.filter(user=self.user)),
+            list(new_recipe.tags.all()),
+        )
+        self.assertFalse(Ingredient.objects.exists())
+        for recipe in self.recipes:
+            self.assertFalse(os.path.exists(recipe.image.path))
+        deleted = self.client.get(SYNC_URL).json()['deleted']
+        self.assertEqual(
+            sorted(deleted['recipes']),
+            [recipe.id for recipe in self.recipes],
+        )
+        self.assertEqual(len(deleted['tags']), 1)
+        self.assertEqual(len(deleted['ingredients']), 1)
+        self.assertEqual(
+            Tombstone.objects.filter(user=self.user).count(), 5,
+        )
+        user = get_user_model().objects.get(id=self.user.id)
+        self.assertTrue(user.is_active)
+        self.assertIsNone(user.library_deleted_at)
+        self.assertEqual(self.purge(), 0)
+
+    def test_command(self):
+        """Test the command purges the deleted accounts"""
+        delete_account(self.user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('purge_deleted_users', stdout=StringIO())
+
+        self.assertPurged()
+
+    def test_purge_job(self):
+        """Test a deletion queues the job purging it"""
+        delete_account(self.user)
+
+        self.assertEqual(
+            list(Job.objects.values_list('name', flat=True)),
+            ['core.tasks.purge_deleted_users'],
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            work(burst=True)
+
+        self.assertPurged()
@@ -0,0 +1,73 @@
+"""
+Tests for the API renderers
+"""
+import json
+from collections import OrderedDict
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+from django.utils.translation import gettext_lazy
+
+from rest_framework.renderers import JSONRenderer
+
+from core.renderers import ORJSONRenderer
+
+
+class ORJSONRendererTests(SimpleTestCase):
+    """Test the orjson backed renderer"""
+
+    def setUp(self):
+        self.renderer = ORJSONRenderer()
+
+    def test_matches_drf_renderer(self):
+        """Test serializer output renders like DRF's JSONRenderer"""
+        data = [OrderedDict([
+            ('id', 1),
+            ('title', 'Crème brûlée'),
+            ('price', '5.25'),
+            ('tags', [OrderedDict([('id', 2), ('name', 'Dessert')])]),
+        ])]
+
+        res = self.renderer.render(data)
+
+        self.assertEqual(res, JSONRenderer().render(data))
+
+    def test_decimal_keeps_digits(self):
+        """Test decimals are rendered as exact strings"""
+        res = self.renderer.render({'price': Decimal('5.10')})
+
+        self.assertEqual(json.loads(res), {'price': '5.10'})
+
+    def test_non_string_keys(self):
+        """Test integer keys render as strings like the json module"""
+        res = self.renderer.render({1: 'a'})
+
+        self.assertEqual(json.loads(res), {'1': 'a'})
+
+    def test_drf_encoder_types(self):
+        """Test lazy strings and datetimes are encoded like DRF does"""
+        moment = datetime(2023, 9, 20, 10, 11, 12, 123456, tzinfo=timezone.utc)
+        data = {'msg': gettext_lazy('Not found.'), 'at': moment}
+
+        res = self.renderer.render(data)
+
+        self.assertEqual(res, JSONRenderer().render(data))
+
+    def test_line_separators_escaped(self):
+        """Test U+2028 and U+2029 are escaped"""
+        res = self.renderer.render({'name': 'a b c'})
+
+        self.assertIn(b'\\u2028', res)
+        self.assertIn(b'\\u2029', res)
+        self.assertEqual(json.loads(res), {'name': 'a b c'})
+
+    def test_indent(self):
+        """Test an indent in the accepted media type pretty prints"""
+        res = self.renderer.render({'id': 1}, 'application/json; indent=4')
+
+        self.assertEqual(res, b'{\n  "id": 1\n}')
+
+    def test_none_renders_empty(self):
+        """Test no data renders an empty body"""
+        self.assertEqual(self.renderer.render(None), b'')
@@ -0,0 +1,106 @@
+"""
+Tests for the precomputed OpenAPI schema
+"""
+import gzip
+from io import StringIO
+import json
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+
+from core import schema
+
+SCHEMA_URL = reverse('api-schema')
+
+
+class SchemaCacheTests(SimpleTestCase):
+    """Test serving the schema from the precomputed file"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.schema_file = os.path.join(self.tmp_dir.name, 'openapi.json')
+        self.settings_override = override_settings(
+            SCHEMA_CACHE_FILE=self.schema_file,
+            CODE_VERSION='v1',
+        )
+        self.settings_override.enable()
+        schema.schema_cache.clear()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        schema.schema_cache.clear()
+        self.tmp_dir.cleanup()
+
+    def test_schema_written_on_first_request(self):
+        """Test the schema file is generated when missing"""
+        res = self.client.get(SCHEMA_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        with open(self.schema_file) as f:
+            stored = json.load(f)
+        self.assertEqual(stored['version'], 'v1')
+        self.assertIn('/api/recipe/recipes/', stored['schema']['paths'])
+
+    def test_schema_generated_once(self):
+        """Test repeated requests do not introspect the views again"""
+        with patch(
+            'core.schema.generate_schema',
+            wraps=schema.generate_schema,
+        ) as patched_generate:
+            self.client.get(SCHEMA_URL)
+            self.client.get(SCHEMA_URL)
+            self.client.get(SCHEMA_URL, {'format': 'json'})
+
+        patched_generate.assert_called_once()
+
+    def test_schema_file_reused_for_same_version(self):
+        """Test a schema file for the current version is not rebuilt"""
+        call_command('generate_schema', stdout=StringIO())
+
+        with patch('core.schema.generate_schema') as patched_generate:
+            res = self.client.get(SCHEMA_URL, {'format': 'json'})
+
+        patched_generate.assert_not_called()
+        self.assertIn('/api/recipe/recipes/', res.json()['paths'])
+
+    def test_schema_regenerated_for_new_version(self):
+        """Test the schema file is rebuilt when the code version changes"""
+        call_command('generate_schema', stdout=StringIO())
+
+        with override_settings(CODE_VERSION='v2'):
+            call_command('generate_schema', stdout=StringIO())
+
+        with open(self.schema_file) as f:
+            self.assertEqual(json.load(f)['version'], 'v2')
+
+    def test_etag_not_modified(self):
+        """Test a matching If-None-Match returns 304"""
+        res = self.client.get(SCHEMA_URL)
+        etag = res['ETag']
+
+        res = self.client.get(SCHEMA_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res.content, b'')
+
+    def test_gzip_encoding(self):
+        """Test the schema is gzipped when the client accepts it"""
+        plain = self.client.get(SCHEMA_URL)
+
+        res = self.client.get(SCHEMA_URL, HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(res.content), plain.content)
+        self.assertIn('Accept-Encoding', res['Vary'])
+
+    def test_gzip_refused(self):
+        """Test the schema isn't gzipped when the client refuses it"""
+        res = self.client.get(SCHEMA_URL, HTTP_ACCEPT_ENCODING='gzip;q=0')
+
+        self.assertFalse(res.has_header('Content-Encoding'))
@@ -0,0 +1,160 @@
+"""
+Tests for the token bucket throttling
+"""
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.throttling import (
+    FileBucketStore,
+    MemoryBucketStore,
+    get_bucket_store,
+    parse_rate,
+    refill,
+)
+
+TOKEN_URL = reverse('user:token')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+class BucketStoreTests(SimpleTestCase):
+    """Test the bucket stores"""
+
+    def test_parse_rate(self):
+        """Test a rate gives the capacity and tokens per second"""
+        self.assertEqual(parse_rate('120/min'), (120, 2))
+
+    def test_bucket_empties_and_refills(self):
+        """Test a bucket allows capacity requests then refills"""
+        store = MemoryBucketStore()
+
+        self.assertEqual(store.take('key', 2, 1, 100), (True, 0))
+        self.assertEqual(store.take('key', 2, 1, 100), (True, 0))
+        self.assertEqual(store.take('key', 2, 1, 100), (False, 1))
+        self.assertEqual(store.take('other', 2, 1, 100), (True, 0))
+        self.assertEqual(store.take('key', 2, 1, 101), (True, 0))
+
+    def test_file_store_shared(self):
+        """Test stores opened on the same file share their buckets, as
+        the workers of a node do"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'buckets')
+            worker_1 = FileBucketStore(path, slots=16)
+            worker_2 = FileBucketStore(path, slots=16)
+
+            self.assertTrue(worker_1.take('key', 2, 1, 100)[0])
+            self.assertTrue(worker_2.take('key', 2, 1, 100)[0])
+            allowed, wait = worker_1.take('key', 2, 1, 100.5)
+
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 0.5)
+
+    def test_file_store_threads(self):
+        """Test the threads of a process don't lose each other's takes"""
+        def slow_refill(*args):
+            # widen the window between reading and writing the slot
+            time.sleep(0.001)
+            return refill(*args)
+
+        with tempfile.TemporaryDirectory() as directory, patch(
+            'core.throttling.refill', slow_refill,
+        ):
+            store = FileBucketStore(os.path.join(directory, 'buckets'))
+            with ThreadPoolExecutor(8) as executor:
+                taken = list(executor.map(
+                    lambda i: store.take('key', 100, 0.001, 100)[0],
+                    range(200),
+                ))
+
+        self.assertEqual(taken.count(True), 100)
+
+    def test_file_store_unavailable(self):
+        """Test buckets are kept in memory when the file can't be opened"""
+        store = FileBucketStore('/nonexistent/buckets', slots=16)
+
+        with self.assertLogs('core.throttling', 'WARNING'):
+            self.assertEqual(store.take('key', 1, 1, 100), (True, 0))
+        self.assertEqual(store.take('key', 1, 1, 100), (False, 1))
+
+
+@override_settings(THROTTLE_STORE='memory')
+class ThrottleTests(TestCase):
+    """Test throttling API requests"""
+
+    def setUp(self):
+        get_bucket_store().clear()
+        self.client = APIClient()
+
+    def tearDown(self):
+        get_bucket_store().clear()
+
+    @override_settings(REST_FRAMEWORK={
+        'DEFAULT_THROTTLE_CLASSES': [
+            'core.throttling.ScopedTokenBucketThrottle',
+        ],
+        'DEFAULT_THROTTLE_RATES': {'auth': '2/min', 'reads': '100/min'},
+    })
+    def test_auth_throttled(self):
+        """Test login attempts are limited per address"""
+        payload = {'email': 'user@example.com', 'password': 'wrong'}
+
+        for _ in range(2):
+            res = self.client.post(TOKEN_URL, payload)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        res = self.client.post(TOKEN_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(res['Retry-After'], '30')
+
+    @override_settings(REST_FRAMEWORK={
+        'DEFAULT_THROTTLE_CLASSES': [
+            'core.throttling.ScopedTokenBucketThrottle',
+        ],
+        'DEFAULT_THROTTLE_RATES': {'auth': '2/min'},
+    })
+    def test_auth_throttled_forwarded_for(self):
+        """Test a client can't get new buckets with X-Forwarded-For"""
+        payload = {'email': 'user@example.com', 'password': 'wrong'}
+
+        for i in range(2):
+            res = self.client.post(
+                TOKEN_URL, payload, HTTP_X_FORWARDED_FOR=f'10.0.0.{i}',
+            )
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        res = self.client.post(
+            TOKEN_URL, payload, HTTP_X_FORWARDED_FOR='10.0.0.9',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    @override_settings(REST_FRAMEWORK={
+        'DEFAULT_THROTTLE_CLASSES': [
+            'core.throttling.ScopedTokenBucketThrottle',
+        ],
+        'DEFAULT_THROTTLE_RATES': {'reads': '1/min'},
+    })
+    def test_reads_throttled_per_user(self):
+        """Test each user has their own bucket"""
+        users = [
+            get_user_model().objects.create_user(
+                f'user{i}@example.com', 'testpass123',
+            )
+            for i in range(2)
+        ]
+
+        for user in users:
+            self.client.force_authenticate(user)
+            res = self.client.get(TAGS_URL)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
@@ -0,0 +1,210 @@
+"""
+Token bucket throttling for the API.
+
+Every client gets a bucket per scope holding up to the scope's number of
+requests, refilled at the scope's rate. The buckets live in a store all
+the workers of a node share: a memory mapped file by default, or the
+django cache to share them across nodes.
+"""
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+logger = logging.getLogger(__name__)
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """Return the capacity and refill rate per second of a bucket from a
+    rate such as '100/min'"""
+    num, period = rate.split('/')
+    capacity = int(num)
+    return capacity, capacity / DURATIONS[period[0]]
+
+
+def refill(tokens, updated, capacity, rate, now):
+    """Take a token from a bucket holding tokens at updated, return
+    whether there was one, the tokens left and the seconds until the next
+    token"""
+    tokens = min(capacity, tokens + max(now - updated, 0) * rate)
+    if tokens >= 1:
+        return True, tokens - 1, 0
+    return False, tokens, (1 - tokens) / rate
+
+
+class MemoryBucketStore:
+    """Buckets in the memory of this process, for development and tests"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}
+
+    def take(self, key, capacity, rate, now):
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (capacity, now))
+            allowed, tokens, wait = refill(
+                tokens, updated, capacity, rate, now,
+            )
+            self.buckets[key] = (tokens, now)
+        return allowed, wait
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+class FileBucketStore:
+    """Buckets in a memory mapped file shared by every worker process on
+    the node. Each key hashes to a fixed size slot guarded by a record
+    lock, which only excludes other processes, and by one of
+    lock_stripes thread locks, for the threads of this one. A key landing
+    on the slot of another key starts over with a full bucket. When the
+    file can't be opened the buckets are kept in memory instead"""
+    slot = struct.Struct('<Qdd')
+    lock_stripes = 256
+
+    def __init__(self, path, slots=65536):
+        self.path = path
+        self.slots = slots
+        self.pid = None
+        self.fallback = None
+
+    def _open(self):
+        # record locks belong to a process, so every worker forked from
+        # the master opens the file itself
+        if self.pid == os.getpid():
+            return
+        self.pid = os.getpid()
+        self.fallback = None
+        self.locks = [threading.Lock() for _ in range(self.lock_stripes)]
+        size = self.slots * self.slot.size
+        fd = None
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+        except OSError as exc:
+            if fd is not None:
+                os.close(fd)
+            logger.warning(
+                'Keeping the throttle buckets in memory, %s can not be '
+                'opened: %s', self.path, exc,
+            )
+            self.fallback = MemoryBucketStore()
+            return
+        self.fd = fd
+
+    def take(self, key, capacity, rate, now):
+        self._open()
+        if self.fallback:
+            return self.fallback.take(key, capacity, rate, now)
+        digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+        tag = int.from_bytes(digest, 'little') or 1
+        index = tag % self.slots
+        offset = index * self.slot.size
+        with self.locks[index % self.lock_stripes]:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, self.slot.size, offset)
+            try:
+                stored_tag, tokens, updated = self.slot.unpack_from(
+                    self.map, offset,
+                )
+                if stored_tag != tag:
+                    tokens, updated = capacity, now
+                allowed, tokens, wait = refill(
+                    tokens, updated, capacity, rate, now,
+                )
+                self.slot.pack_into(self.map, offset, tag, tokens, now)
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, self.slot.size, offset)
+        return allowed, wait
+
+    def clear(self):
+        self._open()
+        if self.fallback:
+            return self.fallback.clear()
+        self.map[:] = bytes(len(self.map))
+
+
+class CacheBucketStore:
+    """Buckets in a django cache shared across nodes. Updates are not
+    atomic, so concurrent requests can occasionally both take the last
+    token"""
+
+    def __init__(self, alias):
+        self.cache = caches[alias]
+
+    def take(self, key, capacity, rate, now):
+        key = f'throttle:{key}'
+        tokens, updated = self.cache.get(key, (capacity, now))
+        allowed, tokens, wait = refill(tokens, updated, capacity, rate, now)
+        # a bucket left alone for capacity / rate seconds is full again
+        self.cache.set(key, (tokens, now), timeout=int(capacity / rate) + 1)
+        return allowed, wait
+
+    def clear(self):
+        self.cache.clear()
+
+
+_stores = {}
+
+
+def get_bucket_store():
+    """Return the bucket store picked by settings.THROTTLE_STORE"""
+    kind = settings.THROTTLE_STORE
+    if kind not in _stores:
+        if kind == 'memory':
+            _stores[kind] = MemoryBucketStore()
+        elif kind == 'file':
+            _stores[kind] = FileBucketStore(settings.THROTTLE_FILE)
+        elif kind == 'cache':
+            _stores[kind] = CacheBucketStore(settings.THROTTLE_CACHE)
+        else:
+            raise ValueError(f'Unknown THROTTLE_STORE "{kind}"')
+    return _stores[kind]
+
+
+class ScopedTokenBucketThrottle(BaseThrottle):
+    """Throttle each user, or each address for anonymous requests, per
+    scope with the rates in DEFAULT_THROTTLE_RATES. The scope is the
+    view's throttle_scope, otherwise reads or writes by method"""
+
+    def get_scope(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if scope:
+            return scope
+        return 'reads' if request.method in SAFE_METHODS else 'writes'
+
+    def get_ident(self, request):
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        # not DRF's get_ident, which trusts the X-Forwarded-For header a
+        # client sends; nginx passes the address it got the request from
+        return f'ip:{request.META.get("REMOTE_ADDR")}'
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(request, view)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope)
+        if rate is None:
+            return True
+        capacity, refill_rate = parse_rate(rate)
+        allowed, self.wait_seconds = get_bucket_store().take(
+            f'{scope}:{self.get_ident(request)}',
+            capacity, refill_rate, time.time(),
+        )
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
@@ -0,0 +1,147 @@
+"""
+Name suggestions for tag and ingredient autocomplete.
+
+The names of a user are kept in a trie in the memory of the worker, so
+the users typing get their suggestions without a query. The tries of
+the least recently used users are dropped once they hold more than
+AUTOCOMPLETE_CACHE_NAMES names altogether. Each node of the trie holds the best
+matches below it, so a lookup only walks the typed prefix. The trie
+also finds the names one typo away. Users with more names than
+AUTOCOMPLETE_TRIE_MAX_NAMES are searched by prefix in the database.
+"""
+from django.conf import settings
+
+from core.invalidation import LocalCache, user_key
+
+# ordering of the suggestions, the most used names first
+RANKING = ['-recipe_count', 'name']
+
+_tries = LocalCache(
+    maxsize=settings.AUTOCOMPLETE_CACHE_NAMES,
+    # users searched in the database take an entry only
+    sizeof=lambda trie: trie.size if trie else 1,
+)
+
+
+def _rank(item):
+    return -item[2], item[1]
+
+
+class _Node:
+    __slots__ = ('children', 'top')
+
+    def __init__(self):
+        self.children = {}
+        self.top = []
+
+
+class NameTrie:
+    """Trie of lower cased names, each node keeping the best ranked
+    (id, name, recipe_count) items whose name starts with its prefix.
+    Unused names rank last, so leaving them out of a node's items still
+    leaves its best used ones"""
+
+    def __init__(self, items, size):
+        self.root = _Node()
+        # number of names, memory grows with it
+        self.size = 0
+        for item in items:
+            self.size += 1
+            node = self.root
+            node.top.append(item)
+            for char in item[1].lower():
+                node = node.children.setdefault(char, _Node())
+                node.top.append(item)
+        self._truncate(self.root, size)
+
+    def _truncate(self, node, size):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            node.top.sort(key=_rank)
+            del node.top[size:]
+            stack.extend(node.children.values())
+
+    def _find(self, node, prefix):
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return None
+        return node
+
+    def _fuzzy(self, node, prefix, found):
+        """Add to found the nodes reached by prefix with one typo: a
+        character replaced, missing, extra or swapped with the next"""
+        if not prefix:
+            return
+        first, rest = prefix[0], prefix[1:]
+        for char, child in node.children.items():
+            if char != first:
+                # replaced, or missing from the prefix
+                found.append(self._find(child, rest))
+                found.append(self._find(child, prefix))
+        # extra in the prefix
+        found.append(self._find(node, rest))
+        if rest and rest[0] != first:
+            found.append(self._find(node, rest[0] + first + rest[1:]))
+        child = node.children.get(first)
+        if child is not None:
+            self._fuzzy(child, rest, found)
+
+    def search(self, prefix, limit, fuzzy=False, assigned_only=False):
+        """Return the best ranked items starting with prefix, followed
+        by the ones with a typo in the prefix when fuzzy"""
+        def matches(nodes):
+            items = {
+                item[0]: item for node in nodes if node is not None
+                for item in node.top
+                if item[0] not in seen and (item[2] or not assigned_only)
+            }
+            return sorted(items.values(), key=_rank)
+
+        prefix = prefix.lower()
+        seen = set()
+        results = matches([self._find(self.root, prefix)])[:limit]
+        if fuzzy and len(results) < limit:
+            seen.update(item[0] for item in results)
+            found = []
+            self._fuzzy(self.root, prefix, found)
+            results += matches(found)[:limit - len(results)]
+        return results
+
+
+def _load_trie(model, user):
+    """Return the trie of the names of user, None when they are too many
+    to keep in memory"""
+    items = list(
+        model.objects.owned_by(user).values_list(
+            'id', 'name', 'recipe_count',
+        )[:settings.AUTOCOMPLETE_TRIE_MAX_NAMES + 1]
+    )
+    if len(items) > settings.AUTOCOMPLETE_TRIE_MAX_NAMES:
+        return None
+    return NameTrie(items, settings.AUTOCOMPLETE_MAX_RESULTS)
+
+
+def suggest(model, user, query, limit, assigned_only=False):
+    """Return up to limit tags or ingredients (model) of user whose name
+    starts with query, the most used first"""
+    trie = _tries.get_or_set(
+        user_key(model, user.pk), lambda: _load_trie(model, user),
+    )
+    if trie is None:
+        queryset = model.objects.owned_by(user).filter(
+            name__istartswith=query,
+        )
+        if assigned_only:
+            queryset = queryset.filter(recipe_count__gt=0)
+        items = queryset.order_by(*RANKING).values_list(
+            'id', 'name', 'recipe_count',
+        )[:limit]
+    else:
+        fuzzy = len(query) >= settings.AUTOCOMPLETE_FUZZY_MIN_LENGTH
+        items = trie.search(query, limit, fuzzy, assigned_only)
+    return [
+        {'id': pk, 'name': name, 'recipe_count': recipe_count}
+        for pk, name, recipe_count in items
+    ]
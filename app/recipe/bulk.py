@@ -0,0 +1,128 @@
+"""
+Bulk updates and deletes of recipes, tags and ingredients.
+
+The selected objects are changed BULK_CHUNK_SIZE at a time, each chunk in
+a transaction of its own with one statement per table, so a large
+selection never holds its locks for long. The per object signals are not
+sent, so the recipe counts, change feed, snapshots, events and caches are
+brought up to date here, a chunk at a time.
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Value
+
+from core import counts, events
+from core.changes import NextChangeSeq, touch
+from core.invalidation import bus, object_key, user_key
+from core.models import Recipe, RecipeSnapshot, Tombstone
+from recipe import snapshots
+from recipe.merges import RELATIONS, recipe_through
+
+
+def _chunks(ids):
+    for start in range(0, len(ids), settings.BULK_CHUNK_SIZE):
+        yield ids[start:start + settings.BULK_CHUNK_SIZE]
+
+
+def _lock(model, user, ids):
+    """Lock the objects of user with the ids, return the ids of the ones
+    still there"""
+    return list(model.objects.select_for_update().owned_by(user).filter(
+        pk__in=ids,
+    ).order_by('pk').values_list('pk', flat=True))
+
+
+def _delete(model, user, ids):
+    """Delete the objects, whose dependent rows are gone already, leaving
+    their tombstones in the change feed"""
+    kind = model._meta.model_name
+    Tombstone.objects.bulk_create([
+        Tombstone(
+            user_id=user.pk,
+            kind=kind,
+            object_id=pk,
+            change_seq=NextChangeSeq(Value(user.pk)),
+        )
+        for pk in ids
+    ])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)} '
+            f'WHERE id = ANY(%s)',
+            [ids],
+        )
+    events.publish_many(user.pk, kind, ids, 'deleted')
+
+
+def update_recipes(user, ids, changes):
+    """Set the fields in changes on the recipes of user with the ids,
+    return how many were updated"""
+    updated = 0
+    for chunk in _chunks(ids):
+        with transaction.atomic():
+            chunk = _lock(Recipe, user, chunk)
+            updated += Recipe.objects.filter(pk__in=chunk).update(
+                **changes,
+                change_seq=NextChangeSeq(F('user_id')),
+            )
+            snapshots.invalidate_snapshots(chunk)
+            events.publish_many(user.pk, 'recipe', chunk, 'updated')
+            bus.publish(sorted(
+                {user_key(Recipe, user.pk)}
+                | {object_key(Recipe, pk) for pk in chunk}
+            ))
+    return updated
+
+
+def delete_recipes(user, ids):
+    """Delete the recipes of user with the ids, return how many were
+    deleted"""
+    deleted = 0
+    for chunk in _chunks(ids):
+        with transaction.atomic():
+            chunk = _lock(Recipe, user, chunk)
+            keys = {user_key(Recipe, user.pk)}
+            keys.update(object_key(Recipe, pk) for pk in chunk)
+            for model in RELATIONS:
+                through, recipe_column, column = recipe_through(model)
+                links = through.objects.filter(
+                    **{f'{recipe_column}__in': chunk}
+                )
+                linked = Counter(links.values_list(column, flat=True))
+                links.delete()
+                counts.change_recipe_counts(model, linked, -1)
+                keys.add(user_key(model, user.pk))
+                keys.update(object_key(model, pk) for pk in linked)
+            RecipeSnapshot.objects.filter(recipe_id__in=chunk).delete()
+            _delete(Recipe, user, chunk)
+            bus.publish(sorted(keys))
+            deleted += len(chunk)
+    return deleted
+
+
+def delete_objects(model, user, ids):
+    """Delete the tags or ingredients (model) of user with the ids,
+    return how many were deleted"""
+    deleted = 0
+    through, recipe_column, column = recipe_through(model)
+    for chunk in _chunks(ids):
+        with transaction.atomic():
+            chunk = _lock(model, user, chunk)
+            links = through.objects.filter(**{f'{column}__in': chunk})
+            recipe_ids = list(
+                links.values_list(recipe_column, flat=True).distinct()
+            )
+            links.delete()
+            # recipes embed their tags and ingredients
+            touch(Recipe.objects.filter(pk__in=recipe_ids))
+            snapshots.invalidate_snapshots(recipe_ids)
+            _delete(model, user, chunk)
+            bus.publish(sorted(
+                {user_key(model, user.pk), user_key(Recipe, user.pk)}
+                | {object_key(model, pk) for pk in chunk}
+                | {object_key(Recipe, pk) for pk in recipe_ids}
+            ))
+            deleted += len(chunk)
+    return deleted
@@ -0,0 +1,97 @@
+"""
+Recipe list JSON assembled by Postgres.
+
+The documents have the shape of RecipeSerializer output, nested tags and
+ingredients included, and are streamed to the client without building
+model instances or serializing them in python.
+"""
+from django.conf import settings
+from django.db import connection, models
+from django.db.models.expressions import RawSQL
+
+from core.models import Recipe
+from recipe import serializers
+
+# number of recipes fetched from the server side cursor at a time
+CHUNK_SIZE = 500
+
+
+def is_available():
+    """Return whether recipe lists should be built by the database"""
+    return settings.RECIPE_LIST_DB_JSON and connection.vendor == 'postgresql'
+
+
+def _json_object_sql(serializer, model, alias):
+    """Return SQL building the representation of the model row aliased as
+    alias, with the fields of the serializer in order"""
+    qn = connection.ops.quote_name
+    pairs = []
+    for name in serializer.Meta.fields:
+        field = model._meta.get_field(name)
+        if field.many_to_many:
+            value = _json_list_sql(serializer.fields[name].child, field, alias)
+        else:
+            value = f'{alias}.{qn(field.column)}'
+            if isinstance(field, models.DecimalField):
+                # DRF renders decimals as strings
+                value += '::text'
+        pairs.append(f"'{name}', {value}")
+    return f"json_build_object({', '.join(pairs)})"
+
+
+def _json_list_sql(serializer, field, alias):
+    """Return SQL building the list of objects linked to the row aliased
+    as alias through the many to many field, ordered by id"""
+    qn = connection.ops.quote_name
+    related = field.related_model
+    through = field.remote_field.through
+    related_alias = qn(f'{field.name}_related')
+    link_alias = qn(f'{field.name}_link')
+    item = _json_object_sql(serializer, related, related_alias)
+    return (
+        f'COALESCE((SELECT json_agg({item} ORDER BY {related_alias}.id) '
+        f'FROM {qn(related._meta.db_table)} {related_alias} '
+        f'INNER JOIN {qn(through._meta.db_table)} {link_alias} '
+        f'ON {link_alias}.{qn(field.m2m_reverse_name())} '
+        f'= {related_alias}.id '
+        f'WHERE {link_alias}.{qn(field.m2m_column_name())} = {alias}.id'
+        "), '[]'::json)"
+    )
+
+
+def list_json_queryset(queryset):
+    """Return the list representation of each recipe in queryset as JSON
+    text, in the order of queryset"""
+    serializer = serializers.RecipeSerializer()
+    document = _json_object_sql(
+        serializer, Recipe, connection.ops.quote_name(Recipe._meta.db_table),
+    )
+    # filter on the ids so the joins and DISTINCT of queryset stay out of
+    # the query selecting the documents
+    return Recipe.objects.filter(
+        id__in=queryset.values('id'),
+    ).order_by(*queryset.query.order_by).annotate(
+        list_json=RawSQL(f'{document}::text', []),
+    ).values_list('list_json', flat=True)
+
+
+def stream_list_json(queryset):
+    """Yield the JSON list of the recipes in queryset in chunks"""
+    documents = list_json_queryset(queryset).iterator(chunk_size=CHUNK_SIZE)
+    yield b'['
+    chunk = []
+    separator = ''
+    for document in documents:
+        # match the API renderer, which escapes the line separators that
+        # are valid JSON but invalid javascript
+        if '\u2028' in document or '\u2029' in document:
+            document = document.replace('\u2028', '\\u2028')
+            document = document.replace('\u2029', '\\u2029')
+        chunk.append(separator + document)
+        separator = ','
+        if len(chunk) == CHUNK_SIZE:
+            yield ''.join(chunk).encode()
+            chunk = []
+    if chunk:
+        yield ''.join(chunk).encode()
+    yield b']'
@@ -0,0 +1,157 @@
+"""
+Merging and renaming tags and ingredients.
+
+A merge re-points the recipe links of the merged objects to the one kept
+with a single INSERT ... SELECT, skipping the recipes linked to both, and
+deletes the merged objects with their links. A bulk rename sets every
+name with a single UPDATE, merging the objects renamed to a name already
+taken. Neither goes through the m2m signals, so the recipe counts,
+change feed, snapshots, events and caches are brought up to date here.
+"""
+from django.db import connection, transaction
+from django.db.models import Case, CharField, F, Q, Value, When
+
+from core import counts, events
+from core.changes import NextChangeSeq, touch
+from core.invalidation import bus, object_key, user_key
+from core.models import Ingredient, Recipe, Tag
+from recipe import snapshots
+from recipe.names import clean_name, name_key, same_name
+
+# recipe relation holding the objects of each model
+RELATIONS = {
+    Tag: 'tags',
+    Ingredient: 'ingredients',
+}
+
+
+def recipe_through(model):
+    """Return the through model of the recipe links of model, its recipe
+    column and its model column"""
+    field = Recipe._meta.get_field(RELATIONS[model])
+    return (
+        field.remote_field.through,
+        field.m2m_column_name(),
+        field.m2m_reverse_name(),
+    )
+
+
+def _linked_recipe_ids(model, ids):
+    through, recipe_column, column = recipe_through(model)
+    return list(through.objects.filter(
+        **{f'{column}__in': ids}
+    ).values_list(recipe_column, flat=True).distinct())
+
+
+def _lock(model, user, ids):
+    """Lock the objects of user with the ids, raise model.DoesNotExist
+    when any of them is missing"""
+    locked = model.objects.select_for_update().owned_by(user).filter(
+        pk__in=ids,
+    ).order_by('pk').values_list('pk', flat=True)
+    if len(locked) != len(set(ids)):
+        raise model.DoesNotExist(
+            f'{model._meta.verbose_name} matching query does not exist.'
+        )
+
+
+@transaction.atomic
+def merge(model, user, target_id, source_ids):
+    """Move the recipes of the tags or ingredients (model) of user with
+    source_ids to the one with target_id and delete them"""
+    source_ids = sorted(set(source_ids) - {target_id})
+    _lock(model, user, [target_id, *source_ids])
+    if not source_ids:
+        return
+    recipe_ids = _linked_recipe_ids(model, source_ids)
+    through, recipe_column, column = recipe_through(model)
+    table = connection.ops.quote_name(through._meta.db_table)
+    recipe_column = connection.ops.quote_name(recipe_column)
+    column = connection.ops.quote_name(column)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({recipe_column}, {column}) '
+            f'SELECT DISTINCT {recipe_column}, %s FROM {table} '
+            f'WHERE {column} = ANY(%s) '
+            f'ON CONFLICT ({recipe_column}, {column}) DO NOTHING',
+            [target_id, source_ids],
+        )
+    # the recipes are still linked to the merged objects, so deleting
+    # them moves the recipes in the change feed, drops their snapshots and
+    # publishes the deletes
+    model.objects.filter(pk__in=source_ids).delete()
+    counts.recount_recipe_counts(model, [target_id])
+
+    events.publish(user.pk, model._meta.model_name, target_id, 'updated')
+    events.publish_many(user.pk, 'recipe', recipe_ids, 'updated')
+    bus.publish(sorted(
+        {
+            object_key(model, target_id),
+            user_key(model, user.pk),
+            user_key(Recipe, user.pk),
+        }
+        | {object_key(Recipe, pk) for pk in recipe_ids}
+    ))
+
+
+@transaction.atomic
+def rename(model, user, names):
+    """Rename the tags or ingredients (model) of user, names mapping
+    their ids to their new names. An object renamed to the name of
+    another one is merged into the oldest of them. Return the mapping of
+    the ids to the ids of the objects they ended up as"""
+    names = {pk: clean_name(name) for pk, name in names.items()}
+    _lock(model, user, list(names))
+    # the objects already called one of the new names
+    query = Q(pk__in=names)
+    for name in names.values():
+        query |= same_name(name)
+    objects = model.objects.select_for_update().owned_by(user).filter(
+        query,
+    ).order_by('pk')
+
+    groups = {}
+    for obj in objects:
+        groups.setdefault(
+            name_key(names.get(obj.pk, obj.name)), [],
+        ).append(obj)
+    result = {}
+    renamed = {}
+    for group in groups.values():
+        if not any(obj.pk in names for obj in group):
+            continue
+        target, *sources = group
+        if sources:
+            merge(model, user, target.pk, [obj.pk for obj in sources])
+        if names.get(target.pk, target.name) != target.name:
+            renamed[target.pk] = names[target.pk]
+        for obj in group:
+            if obj.pk in names:
+                result[obj.pk] = target.pk
+    if renamed:
+        _set_names(model, user, renamed)
+    return result
+
+
+def _set_names(model, user, names):
+    """Give the objects their new names in one UPDATE"""
+    model.objects.filter(pk__in=names).update(
+        name=Case(
+            *[When(pk=pk, then=Value(name)) for pk, name in names.items()],
+            output_field=CharField(),
+        ),
+        change_seq=NextChangeSeq(F('user_id')),
+    )
+    # recipes embed the names of their tags and ingredients
+    recipe_ids = _linked_recipe_ids(model, list(names))
+    touch(Recipe.objects.filter(pk__in=recipe_ids))
+    snapshots.invalidate_snapshots(recipe_ids)
+
+    events.publish_many(
+        user.pk, model._meta.model_name, list(names), 'updated',
+    )
+    bus.publish(sorted(
+        {user_key(model, user.pk), user_key(Recipe, user.pk)}
+        | {object_key(model, pk) for pk in names}
+        | {object_key(Recipe, pk) for pk in recipe_ids}
+    ))
@@ -0,0 +1,52 @@
+"""
+Names of tags and ingredients.
+
+With NORMALIZE_NAMES, names differing only in case and spacing are the
+same name. Kept apart from recipe.merges, which depends on the readers,
+so the serializers can use it.
+"""
+from django.conf import settings
+from django.db.models import Q
+
+
+def normalize_name(name):
+    """Return name with its runs of whitespace collapsed to one space"""
+    return ' '.join(name.split())
+
+
+def clean_name(name):
+    """Return name as stored, normalized with NORMALIZE_NAMES"""
+    if settings.NORMALIZE_NAMES:
+        return normalize_name(name)
+    return name
+
+
+def name_key(name):
+    """Return the key names are told apart by, ignoring the case when
+    names are normalized"""
+    if settings.NORMALIZE_NAMES:
+        return normalize_name(name).upper()
+    return name
+
+
+def same_name(name):
+    """Return the filter on the objects called name"""
+    if settings.NORMALIZE_NAMES:
+        return Q(name__iexact=normalize_name(name))
+    return Q(name=name)
+
+
+def get_or_create_named(model, user, name):
+    """Return the tag or ingredient (model) of user called name, creating
+    it when missing. With NORMALIZE_NAMES, "vegan " finds "Vegan"."""
+    name = clean_name(name)
+    if not settings.NORMALIZE_NAMES:
+        return model.objects.owned_by(user).get_or_create(
+            user=user, name=name,
+        )[0]
+    obj = model.objects.owned_by(user).filter(
+        name__iexact=name,
+    ).order_by('pk').first()
+    if obj is None:
+        obj = model.objects.create(user=user, name=name)
+    return obj
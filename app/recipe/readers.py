@@ -0,0 +1,164 @@
+"""
+Read only fast path for the recipe serializers.
+
+A Reader is compiled once from a ModelSerializer's Meta.fields and turns
+.values() rows into the same dicts the serializer would return, without
+building model instances or running DRF's per field machinery.
+"""
+from django.db.models import F
+from rest_framework import serializers as drf_serializers
+from rest_framework.settings import api_settings
+
+from recipe import serializers
+
+
+def _decimal_formatter(field):
+    """Format decimals like DRF's DecimalField, as strings holding
+    exactly decimal_places digits"""
+    def format_decimal(value, context):
+        if value is None:
+            return ''
+        return '{:f}'.format(field.quantize(value))
+    return format_decimal
+
+
+def _file_formatter(field, model_field):
+    """Format stored file names as URLs like DRF's FileField, absolute
+    ones when there is a request to build them from"""
+    storage = model_field.storage
+
+    def format_file(value, context):
+        if not value:
+            return None
+        url = storage.url(value)
+        request = context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+    return format_file
+
+
+def _field_formatter(field):
+    """Fall back on the serializer field for any other field type"""
+    def format_value(value, context):
+        if value is None:
+            return None
+        return field.to_representation(value)
+    return format_value
+
+
+def _identity(value, context):
+    return value
+
+
+class Reader:
+    """Compiled read only version of a ModelSerializer"""
+
+    def __init__(self, serializer_class):
+        self.model = serializer_class.Meta.model
+        self.fields = list(serializer_class.Meta.fields)
+        # source column and formatter of each concrete field
+        self.columns = {}
+        # reader and model field of each nested many to many relation
+        self.relations = {}
+
+        declared = serializer_class().fields
+        for name in self.fields:
+            field = declared[name]
+            model_field = self.model._meta.get_field(field.source)
+            if isinstance(field, drf_serializers.ListSerializer):
+                self.relations[name] = (
+                    Reader(type(field.child)), model_field,
+                )
+            elif isinstance(field, drf_serializers.DecimalField) and getattr(
+                field, 'coerce_to_string',
+                api_settings.COERCE_DECIMAL_TO_STRING,
+            ) and not field.localize:
+                self.columns[name] = (
+                    model_field.name, _decimal_formatter(field),
+                )
+            elif isinstance(field, drf_serializers.FileField):
+                self.columns[name] = (
+                    model_field.name, _file_formatter(field, model_field),
+                )
+            elif isinstance(field, (
+                drf_serializers.IntegerField,
+                drf_serializers.CharField,
+                drf_serializers.BooleanField,
+                drf_serializers.ReadOnlyField,
+            )):
+                # the database already returns these in their JSON type
+                self.columns[name] = (model_field.name, _identity)
+            else:
+                self.columns[name] = (
+                    model_field.name, _field_formatter(field),
+                )
+
+    def read(self, queryset, context=None, fields=None):
+        """Return the representation of every object in queryset, limited
+        to fields when given"""
+        context = context or {}
+        if fields is None:
+            fields = self.fields
+        else:
+            fields = [name for name in self.fields if name in fields]
+        columns = {
+            name: self.columns[name] for name in fields
+            if name in self.columns
+        }
+        sources = dict.fromkeys(['id'] + [
+            source for source, _ in columns.values()
+        ])
+
+        rows = list(queryset.prefetch_related(None).values(*sources))
+        nested = {
+            name: self._read_related(name, [row['id'] for row in rows],
+                                     context)
+            for name in fields if name in self.relations
+        }
+
+        results = []
+        for row in rows:
+            data = {}
+            for name in fields:
+                if name in nested:
+                    data[name] = nested[name].get(row['id'], [])
+                else:
+                    source, formatter = columns[name]
+                    data[name] = formatter(row[source], context)
+            results.append(data)
+        return results
+
+    def _read_related(self, name, ids, context):
+        """Return the representation of the objects of relation name per
+        object id, ordered by id, in one query"""
+        if not ids:
+            return {}
+        reader, model_field = self.relations[name]
+        # the query name on the related model leading back to this one
+        owner = f'{model_field.related_query_name()}__id'
+        related = reader.model.objects.filter(
+            **{f'{owner}__in': ids}
+        ).order_by('id').annotate(
+            _owner_id=F(owner),
+        )
+
+        columns = {
+            field: reader.columns[field] for field in reader.fields
+            if field in reader.columns
+        }
+        sources = [source for source, _ in columns.values()]
+        by_owner = {}
+        for row in related.values('_owner_id', *sources):
+            data = {
+                field: formatter(row[source], context)
+                for field, (source, formatter) in columns.items()
+            }
+            by_owner.setdefault(row['_owner_id'], []).append(data)
+        return by_owner
+
+
+tag_reader = Reader(serializers.TagSerializer)
+ingredient_reader = Reader(serializers.IngredientSerializer)
+recipe_reader = Reader(serializers.RecipeSerializer)
+recipe_detail_reader = Reader(serializers.RecipeDetailSerializer)
@@ -1,6 +1,7 @@
 """
 Serializer for recipe API
 """
+from django.conf import settings
 from rest_framework import serializers
 
 from core.models import (
@@ -8,6 +9,7 @@ from core.models import (
     Tag,
     Ingredient,
 )
+from recipe import names
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -15,22 +17,51 @@ class TagSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Tag
-        fields = ['id', 'name']
-        read_only_fields = ['id']
+        fields = ['id', 'name', 'recipe_count']
+        read_only_fields = ['id', 'recipe_count']
 
 class IngredientSerializer(serializers.ModelSerializer):
     """Serializer for ingredients"""
     class Meta:
         model = Ingredient
+        fields = ['id', 'name', 'recipe_count']
+        read_only_fields = ['id', 'recipe_count']
+
+
+class RecipeTagSerializer(TagSerializer):
+    """Serializer for tags nested in recipes, which leave out the recipe
+    count so a recipe's representation only changes with the recipe"""
+
+    class Meta(TagSerializer.Meta):
         fields = ['id', 'name']
-        read_only_fields = ['id']
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeIngredientSerializer(IngredientSerializer):
+    """Serializer for ingredients nested in recipes"""
+
+    class Meta(IngredientSerializer.Meta):
+        fields = ['id', 'name']
+
+
+class SparseFieldsMixin:
+    """Only serialize the fields listed in context['fields'] when the
+    client asked for a sparse fieldset"""
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selected = self.context.get('fields')
+        if selected is not None:
+            for name in list(fields):
+                if name not in selected:
+                    del fields[name]
+        return fields
+
+
+class RecipeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer for recipes."""
     # many=True means it is a list
-    tags = TagSerializer(many=True, required=False)
-    ingredients = IngredientSerializer(many=True, required=False)
+    tags = RecipeTagSerializer(many=True, required=False)
+    ingredients = RecipeIngredientSerializer(many=True, required=False)
 
 
     class Meta:
@@ -43,10 +74,7 @@ class RecipeSerializer(serializers.ModelSerializer):
         """Handle getting or creating tags as needed"""
         auth_user = self.context['request'].user
         for tag in tags:
-            tag_obj, created = Tag.objects.get_or_create(
-                user=auth_user,
-                **tag,
-            )
+            tag_obj = names.get_or_create_named(Tag, auth_user, tag['name'])
             recipe.tags.add(tag_obj)
 
     # the method should be internal use only, dont expect anyone using this
@@ -60,9 +88,8 @@ class RecipeSerializer(serializers.ModelSerializer):
         auth_user = self.context['request'].user
         # loop through all the ingredients
         for ingredient in ingredients:
-            ingredient_obj, created = Ingredient.objects.get_or_create(
-                user=auth_user,
-                **ingredient,
+            ingredient_obj = names.get_or_create_named(
+                Ingredient, auth_user, ingredient['name'],
             )
             recipe.ingredients.add(ingredient_obj)
 
@@ -98,6 +125,30 @@ class RecipeSerializer(serializers.ModelSerializer):
         instance.save()
         return instance
 
+class SideloadedIdsField(serializers.ReadOnlyField):
+    """Ids of the related objects of a recipe, the objects themselves are
+    sideloaded once next to the recipe list"""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = 'id'
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return self.context['sideload'][self.field_name].get(value, [])
+
+
+class RecipeSideloadSerializer(RecipeSerializer):
+    """Serializer for recipe lists that reference the relations named in
+    context['sideload'] by id instead of nesting them"""
+
+    def get_fields(self):
+        fields = super().get_fields()
+        for name in self.context.get('sideload', {}):
+            if name in fields:
+                fields[name] = SideloadedIdsField()
+        return fields
+
+
 class RecipeDetailSerializer(RecipeSerializer):
     """Serializer for recipe detail view. it is using RecipeSerializer
     as the baseclass since it is an extension to it and inherit all attributes
@@ -121,3 +172,151 @@ class RecipeImageSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
         extra_kwargs = {'image': {'required': 'True'}}
 
+
+class SyncDeletedSerializer(serializers.Serializer):
+    """Ids of the objects deleted since the cursor"""
+    recipes = serializers.ListField(child=serializers.IntegerField())
+    tags = serializers.ListField(child=serializers.IntegerField())
+    ingredients = serializers.ListField(child=serializers.IntegerField())
+
+
+# documents the response built by recipe.sync
+class SyncSerializer(serializers.Serializer):
+    """Page of the changes made since a sync cursor"""
+    cursor = serializers.IntegerField(
+        help_text='Pass as ?since= to get the changes after this page',
+    )
+    more = serializers.BooleanField(
+        help_text='Whether more changes follow this page',
+    )
+    recipes = RecipeDetailSerializer(many=True)
+    tags = TagSerializer(many=True)
+    ingredients = IngredientSerializer(many=True)
+    deleted = SyncDeletedSerializer()
+
+
+class MergeSerializer(serializers.Serializer):
+    """Tags or ingredients to merge into another one"""
+    target = serializers.IntegerField(help_text='Id of the one to keep')
+    sources = serializers.ListField(
+        child=serializers.IntegerField(),
+        min_length=1,
+        max_length=settings.MERGE_MAX_ITEMS,
+        help_text='Ids of the ones to merge into it and delete',
+    )
+
+
+class RenameItemSerializer(serializers.Serializer):
+    """New name of a tag or ingredient"""
+    id = serializers.IntegerField()
+    name = serializers.CharField(max_length=255)
+
+
+class BulkRenameSerializer(serializers.Serializer):
+    """Tags or ingredients to rename, the ones renamed to a name taken by
+    another are merged into the oldest"""
+    names = serializers.ListField(
+        child=RenameItemSerializer(),
+        min_length=1,
+        max_length=settings.MERGE_MAX_ITEMS,
+    )
+
+    def validate_names(self, value):
+        ids = [item['id'] for item in value]
+        if len(set(ids)) != len(ids):
+            raise serializers.ValidationError('Ensure every id is unique.')
+        return value
+
+
+class BulkSelectionSerializer(serializers.Serializer):
+    """Items selected by id, by the filters of the list endpoint or all
+    of them"""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False,
+        min_length=1,
+        max_length=settings.BULK_MAX_ROWS,
+    )
+    filter = serializers.DictField(
+        child=serializers.CharField(),
+        required=False,
+        help_text='Query parameters of the list endpoint selecting the items',
+    )
+    all = serializers.BooleanField(
+        default=False,
+        help_text='Select every item',
+    )
+
+    def validate_filter(self, value):
+        # an empty filter would select every item by mistake
+        if not value:
+            raise serializers.ValidationError(
+                'Ensure a filter is given, or select every item with all.'
+            )
+        return value
+
+    def validate(self, attrs):
+        if ('ids' in attrs) + ('filter' in attrs) + attrs['all'] != 1:
+            raise serializers.ValidationError(
+                'Ensure either ids, filter or all is given.'
+            )
+        return attrs
+
+
+class BulkFilterSerializer(serializers.Serializer):
+    """Filters of a list endpoint selecting the items of a bulk action"""
+
+    def validate(self, attrs):
+        unknown = sorted(set(self.initial_data) - set(self.fields))
+        if unknown:
+            raise serializers.ValidationError(
+                [f'"{name}" is not a valid filter.' for name in unknown]
+            )
+        return attrs
+
+
+class RecipeBulkFilterSerializer(BulkFilterSerializer):
+    """Filters of the recipe list selecting recipes"""
+    tags = serializers.RegexField(
+        r'^\d+(,\d+)*$',
+        required=False,
+        help_text='Comma separated list of tag ids',
+    )
+    ingredients = serializers.RegexField(
+        r'^\d+(,\d+)*$',
+        required=False,
+        help_text='Comma separated list of ingredient ids',
+    )
+
+
+class AttrBulkFilterSerializer(BulkFilterSerializer):
+    """Filters of the tag and ingredient lists selecting items"""
+    assigned_only = serializers.BooleanField(required=False)
+
+
+class RecipeChangesSerializer(serializers.ModelSerializer):
+    """Fields to set on every selected recipe"""
+
+    class Meta:
+        model = Recipe
+        fields = ['title', 'description', 'time_minutes', 'price', 'link']
+        extra_kwargs = {name: {'required': False} for name in fields}
+
+
+class RecipeBulkUpdateSerializer(BulkSelectionSerializer):
+    """Recipes to update and the changes to make to them"""
+    changes = RecipeChangesSerializer()
+
+    def validate_changes(self, value):
+        if not value:
+            raise serializers.ValidationError('Ensure a field is changed.')
+        return value
+
+
+class BulkResultSerializer(serializers.Serializer):
+    """Summary of a bulk update or delete"""
+    count = serializers.IntegerField(help_text='Number of items changed')
+    ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        help_text='Ids of the items selected',
+    )
@@ -0,0 +1,152 @@
+"""
+Precomputed JSON snapshots of recipes for the list endpoint.
+
+Writes delete the affected snapshots inside their transaction, so a list
+never serves a snapshot older than the committed data, and rebuild them
+once the transaction commits. Snapshots that are missing when a list is
+read are built on the spot.
+"""
+from django.db import connection
+from django.db.models.signals import m2m_changed, post_save, pre_delete
+from django.dispatch import receiver
+
+from core.commits import CommitBatch
+from core.models import Ingredient, Recipe, RecipeSnapshot, Tag
+from core.renderers import ORJSONRenderer, PrerenderedJSONList
+from recipe import readers
+
+# recipe relation name for the models embedded in a recipe's snapshot
+EMBEDDED_RELATIONS = {
+    Tag: 'tags',
+    Ingredient: 'ingredients',
+}
+
+
+def render_snapshots(recipe_ids):
+    """Render the list representation of the recipes, return a mapping
+    of recipe id to JSON"""
+    data = readers.recipe_reader.read(
+        Recipe.objects.filter(id__in=recipe_ids)
+    )
+    renderer = ORJSONRenderer()
+    return {item['id']: renderer.render(item).decode() for item in data}
+
+
+def build_snapshots(recipe_ids):
+    """Build and store the missing snapshots of the recipes, keeping any
+    snapshot another request stored in the meantime"""
+    rendered = render_snapshots(recipe_ids)
+    RecipeSnapshot.objects.bulk_create(
+        [
+            RecipeSnapshot(recipe_id=recipe_id, list_json=list_json)
+            for recipe_id, list_json in rendered.items()
+        ],
+        ignore_conflicts=True,
+    )
+    return rendered
+
+
+def refresh_snapshots(recipe_ids):
+    """Rebuild the snapshots of the recipes, overwriting any snapshot a
+    concurrent read stored from the data before the change. Recipes
+    deleted meanwhile are skipped, the recipes joined are locked against
+    deletes until the snapshots are stored"""
+    rendered = render_snapshots(recipe_ids)
+    if not rendered:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {RecipeSnapshot._meta.db_table} '
+            '(recipe_id, list_json) '
+            'SELECT recipe.id, rendered.list_json '
+            'FROM unnest(%s::bigint[], %s::text[]) '
+            'AS rendered (recipe_id, list_json) '
+            f'JOIN {Recipe._meta.db_table} recipe '
+            'ON recipe.id = rendered.recipe_id '
+            'ORDER BY recipe.id FOR KEY SHARE OF recipe '
+            'ON CONFLICT (recipe_id) '
+            'DO UPDATE SET list_json = EXCLUDED.list_json',
+            [list(rendered), list(rendered.values())],
+        )
+
+
+# recipes of the current transaction to refresh once it commits
+_refreshes = CommitBatch(refresh_snapshots)
+
+
+def schedule_refresh(recipe_ids):
+    """Refresh the snapshots of the recipes when the current transaction
+    commits, once per transaction"""
+    _refreshes.add(recipe_ids)
+
+
+def invalidate_snapshots(recipe_ids):
+    """Drop the snapshots of the recipes as part of the current
+    transaction and rebuild them once it commits"""
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    RecipeSnapshot.objects.filter(recipe_id__in=recipe_ids).delete()
+    schedule_refresh(recipe_ids)
+
+
+def get_list_snapshots(queryset):
+    """Return the list representation of the recipes in queryset, in
+    order, spliced together from their snapshots"""
+    recipe_ids = list(queryset.values_list('id', flat=True))
+    stored = dict(
+        RecipeSnapshot.objects.filter(
+            recipe_id__in=recipe_ids,
+        ).values_list('recipe_id', 'list_json')
+    )
+    missing = [pk for pk in recipe_ids if pk not in stored]
+    if missing:
+        stored.update(build_snapshots(missing))
+    return PrerenderedJSONList([
+        stored[recipe_id] for recipe_id in recipe_ids if recipe_id in stored
+    ])
+
+
+def _linked_recipe_ids(model, pk):
+    """Return the ids of the recipes linked to a tag or ingredient"""
+    field = Recipe._meta.get_field(EMBEDDED_RELATIONS[model])
+    return list(field.remote_field.through.objects.filter(
+        **{f'{model._meta.model_name}_id': pk}
+    ).values_list('recipe_id', flat=True))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, **kwargs):
+    if created:
+        schedule_refresh([instance.pk])
+    else:
+        invalidate_snapshots([instance.pk])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_links_changed(sender, instance, action, reverse, pk_set,
+                         **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate_snapshots([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        invalidate_snapshots(pk_set)
+    elif action == 'pre_clear':
+        # the links are gone after the clear, collect the recipes now
+        invalidate_snapshots(
+            _linked_recipe_ids(type(instance), instance.pk)
+        )
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def embedded_object_saved(sender, instance, created, **kwargs):
+    if not created:
+        invalidate_snapshots(_linked_recipe_ids(sender, instance.pk))
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def embedded_object_deleted(sender, instance, **kwargs):
+    invalidate_snapshots(_linked_recipe_ids(sender, instance.pk))
@@ -0,0 +1,66 @@
+"""
+Delta sync of a user's recipes, tags and ingredients.
+
+A client passes the cursor of its last sync and gets back, in pages, the
+objects that changed after it and the ids of the objects deleted after it,
+read from the change feed maintained by core.changes.
+"""
+from core.models import Ingredient, Recipe, Tag, Tombstone
+from recipe import readers
+
+# reader of the objects of each collection in a sync page
+COLLECTIONS = {
+    'recipes': (Recipe, readers.recipe_detail_reader),
+    'tags': (Tag, readers.tag_reader),
+    'ingredients': (Ingredient, readers.ingredient_reader),
+}
+
+
+def _page_end(sources, since, limit):
+    """Return the change_seq of the last change in the page of limit
+    changes after since and whether more changes follow"""
+    positions = []
+    for queryset in sources:
+        # no page holds more than limit changes from a single source
+        positions.extend(
+            queryset.filter(change_seq__gt=since).order_by(
+                'change_seq',
+            ).values_list('change_seq', flat=True)[:limit + 1]
+        )
+    positions.sort()
+    if len(positions) > limit:
+        return positions[limit - 1], True
+    return (positions[-1] if positions else since), False
+
+
+def get_changes(user, since, limit, context=None):
+    """Return the changes of user after the since cursor, at most limit
+    of them, with the cursor to pass for the next page"""
+    querysets = {
+        name: model.objects.owned_by(user)
+        for name, (model, _) in COLLECTIONS.items()
+    }
+    tombstones = Tombstone.objects.filter(user=user)
+    cursor, more = _page_end(
+        [*querysets.values(), tombstones], since, limit,
+    )
+
+    page = {'cursor': cursor, 'more': more}
+    for name, (model, reader) in COLLECTIONS.items():
+        page[name] = reader.read(
+            querysets[name].filter(
+                change_seq__gt=since, change_seq__lte=cursor,
+            ).order_by('change_seq'),
+            context,
+        )
+    deleted = {name: [] for name in COLLECTIONS}
+    kinds = {
+        model._meta.model_name: name
+        for name, (model, _) in COLLECTIONS.items()
+    }
+    for kind, object_id in tombstones.filter(
+        change_seq__gt=since, change_seq__lte=cursor,
+    ).order_by('change_seq').values_list('kind', 'object_id'):
+        deleted[kinds[kind]].append(object_id)
+    page['deleted'] = deleted
+    return page
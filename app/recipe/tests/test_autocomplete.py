@@ -0,0 +1,148 @@
+"""
+Tests for the tag and ingredient autocomplete
+"""
+import os
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.invalidation import bus, user_key
+from core.models import Ingredient, Tag
+from recipe import autocomplete
+from recipe.autocomplete import NameTrie
+
+TAGS_URL = reverse('recipe:tag-list')
+INGREDIENTS_URL = reverse('recipe:ingredient-list')
+
+ITEMS = [
+    (1, 'Vegan', 2),
+    (2, 'Vegetarian', 0),
+    (3, 'Vegetable soup', 5),
+    (4, 'Dessert', 1),
+]
+
+
+def names(items):
+    return [item[1] for item in items]
+
+
+class NameTrieTests(SimpleTestCase):
+    """Test searching the names in the trie"""
+
+    def setUp(self):
+        self.trie = NameTrie(ITEMS, size=10)
+
+    def test_prefix(self):
+        """Test names starting with the prefix, the most used first"""
+        self.assertEqual(
+            names(self.trie.search('VEG', 10)),
+            ['Vegetable soup', 'Vegan', 'Vegetarian'],
+        )
+        self.assertEqual(names(self.trie.search('veg', 1)), ['Vegetable soup'])
+
+    def test_assigned_only(self):
+        """Test unused names can be left out"""
+        self.assertEqual(
+            names(self.trie.search('veg', 10, assigned_only=True)),
+            ['Vegetable soup', 'Vegan'],
+        )
+
+    def test_typos(self):
+        """Test names one typo away follow the exact matches"""
+        for typo in ['dessret', 'dezsert', 'desert', 'dessertt']:
+            self.assertEqual(
+                names(self.trie.search(typo, 10, fuzzy=True)), ['Dessert'],
+            )
+        self.assertEqual(self.trie.search('desert', 10), [])
+
+    def test_node_size(self):
+        """Test nodes only keep the best ranked items"""
+        trie = NameTrie(ITEMS, size=1)
+
+        self.assertEqual(names(trie.search('veg', 10)), ['Vegetable soup'])
+
+
+@override_settings(
+    INVALIDATION_BUS='socket',
+    INVALIDATION_SOCKET_DIR=os.path.join(
+        tempfile.gettempdir(), 'test-invalidation-bus',
+    ),
+)
+class AutocompleteApiTests(TestCase):
+    """Test the ?q= autocomplete of tags and ingredients"""
+
+    def setUp(self):
+        # the bus clears the caches once it listens
+        bus.start()
+        bus.listening.wait(5)
+        # invalidations of later writes would join a pending one
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user = get_user_model().objects.create_user(
+                'user@example.com',
+                'testpass123',
+            )
+            for _, name, recipe_count in ITEMS:
+                Tag.objects.create(
+                    user=self.user, name=name, recipe_count=recipe_count,
+                )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def suggest(self, url=TAGS_URL, **params):
+        res = self.client.get(url, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [item['name'] for item in res.data]
+
+    def test_suggest(self):
+        """Test the matching names of the user are returned"""
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            'testpass123',
+        )
+        Tag.objects.create(user=other, name='Vegan')
+        Ingredient.objects.create(user=self.user, name='Vanilla')
+
+        self.assertEqual(
+            self.suggest(q='veg', limit=2), ['Vegetable soup', 'Vegan'],
+        )
+        self.assertEqual(self.suggest(q='dessret'), ['Dessert'])
+        self.assertEqual(self.suggest(INGREDIENTS_URL, q='v'), ['Vanilla'])
+        res = self.client.get(TAGS_URL, {'q': 'veg', 'limit': 1})
+        self.assertEqual(res.data, [
+            {'id': Tag.objects.get(name='Vegetable soup').id,
+             'name': 'Vegetable soup', 'recipe_count': 5},
+        ])
+
+    def test_cached(self):
+        """Test suggestions come from memory until the names change"""
+        self.suggest(q='veg')
+
+        with self.assertNumQueries(0):
+            self.suggest(q='ve')
+        self.assertEqual(
+            autocomplete._tries.sizes[user_key(Tag, self.user.pk)],
+            len(ITEMS),
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(user=self.user, name='Veggie')
+
+        self.assertIn('Veggie', self.suggest(q='veg'))
+
+    @override_settings(AUTOCOMPLETE_TRIE_MAX_NAMES=2)
+    def test_many_names(self):
+        """Test users with many names are searched in the database"""
+        self.assertEqual(
+            self.suggest(q='veg', assigned_only=1),
+            ['Vegetable soup', 'Vegan'],
+        )
+
+    def test_invalid_query(self):
+        """Test an empty query is refused"""
+        res = self.client.get(TAGS_URL, {'q': ' '})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,239 @@
+"""
+Tests for the bulk update and delete APIs
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recipe, RecipeSnapshot, Tag, Tombstone
+
+RECIPES_URL = reverse('recipe:recipe-list')
+RECIPE_UPDATE_URL = reverse('recipe:recipe-bulk-update')
+RECIPE_DELETE_URL = reverse('recipe:recipe-bulk-delete')
+TAG_DELETE_URL = reverse('recipe:tag-bulk-delete')
+INGREDIENT_DELETE_URL = reverse('recipe:ingredient-bulk-delete')
+
+
+def create_recipe(user, title='Sample recipe'):
+    """Create and return a sample recipe"""
+    return Recipe.objects.create(
+        user=user,
+        title=title,
+        time_minutes=10,
+        price=Decimal('5.00'),
+    )
+
+
+class PublicBulkApiTests(TestCase):
+    """Test unauthenticated API requests"""
+
+    def test_auth_required(self):
+        """Test auth is required for bulk changes"""
+        res = APIClient().post(RECIPE_DELETE_URL, {'ids': [1]})
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(BULK_CHUNK_SIZE=2)
+class PrivateBulkApiTests(TestCase):
+    """Test authenticated API requests"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+        self.other_user = get_user_model().objects.create_user(
+            'other@example.com',
+            'testpass123',
+        )
+
+    def test_update_by_ids(self):
+        """Test the changes are made to the selected recipes only"""
+        recipes = [create_recipe(self.user) for _ in range(3)]
+        untouched = create_recipe(self.user)
+        other = create_recipe(self.other_user)
+        change_seq = Recipe.objects.get(id=recipes[0].id).change_seq
+        self.client.get(RECIPES_URL)
+        ids = [recipe.id for recipe in recipes] + [other.id]
+
+        res = self.client.post(RECIPE_UPDATE_URL, {
+            'ids': ids,
+            'changes': {'time_minutes': 30, 'price': '7.50'},
+        }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['count'], 3)
+        updated = Recipe.objects.filter(time_minutes=30, price='7.50')
+        self.assertEqual(
+            set(updated.values_list('id', flat=True)),
+            {recipe.id for recipe in recipes},
+        )
+        self.assertGreater(
+            Recipe.objects.get(id=recipes[0].id).change_seq, change_seq,
+        )
+        self.assertEqual(Recipe.objects.get(id=other.id).time_minutes, 10)
+        self.assertEqual(Recipe.objects.get(id=untouched.id).time_minutes, 10)
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(
+            {recipe['id']: recipe['time_minutes'] for recipe in res.json()},
+            {recipes[0].id: 30, recipes[1].id: 30, recipes[2].id: 30,
+             untouched.id: 10},
+        )
+
+    def test_update_by_filter(self):
+        """Test recipes can be selected by the filters of the list"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        tagged = create_recipe(self.user)
+        tagged.tags.add(tag)
+        create_recipe(self.user)
+
+        res = self.client.post(RECIPE_UPDATE_URL, {
+            'filter': {'tags': str(tag.id)},
+            'changes': {'title': 'Vegan recipe'},
+        }, format='json')
+
+        self.assertEqual(res.data, {'count': 1, 'ids': [tagged.id]})
+        self.assertEqual(
+            list(Recipe.objects.filter(
+                title='Vegan recipe',
+            ).values_list('id', flat=True)),
+            [tagged.id],
+        )
+
+    def test_invalid_selection(self):
+        """Test the selection is either ids or known filters"""
+        for payload in [
+            {},
+            {'ids': [1], 'filter': {'tags': '1'}},
+            {'filter': {'title': 'Soup'}},
+            {'filter': {'tags': 'soup'}},
+            {'filter': {}},
+            {'ids': [1], 'all': True},
+        ]:
+            res = self.client.post(
+                RECIPE_DELETE_URL, payload, format='json',
+            )
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(BULK_MAX_ROWS=2)
+    def test_row_limit(self):
+        """Test a filter selecting too many recipes is refused"""
+        for _ in range(3):
+            create_recipe(self.user)
+
+        res = self.client.post(
+            RECIPE_DELETE_URL, {'all': True}, format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Recipe.objects.count(), 3)
+
+    def test_delete_recipes(self):
+        """Test the selected recipes are deleted with their links"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+        recipes = [create_recipe(self.user) for _ in range(3)]
+        for recipe in recipes:
+            recipe.tags.add(tag)
+            recipe.ingredients.add(ingredient)
+        kept = recipes.pop()
+        self.client.get(RECIPES_URL)
+        ids = [recipe.id for recipe in recipes]
+
+        res = self.client.post(
+            RECIPE_DELETE_URL, {'ids': ids}, format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['count'], 2)
+        self.assertEqual(list(Recipe.objects.all()), [kept])
+        self.assertEqual(Tag.objects.get(id=tag.id).recipe_count, 1)
+        self.assertEqual(
+            Ingredient.objects.get(id=ingredient.id).recipe_count, 1,
+        )
+        self.assertFalse(
+            RecipeSnapshot.objects.filter(recipe_id__in=ids).exists()
+        )
+        self.assertEqual(
+            set(Tombstone.objects.filter(kind='recipe').values_list(
+                'object_id', flat=True,
+            )),
+            set(ids),
+        )
+
+    def test_delete_all(self):
+        """Test every item is deleted when selected with all"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        other = Tag.objects.create(user=self.other_user, name='Vegan')
+
+        res = self.client.post(TAG_DELETE_URL, {'all': True}, format='json')
+
+        self.assertEqual(res.data['count'], 1)
+        self.assertEqual(list(Tag.objects.all()), [other])
+
+    def test_invalid_filter_value(self):
+        """Test a filter value the list doesn't accept is refused"""
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.client.post(
+            TAG_DELETE_URL, {'filter': {'assigned_only': 'x'}},
+            format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('assigned_only', res.data['filter'])
+        self.assertEqual(Tag.objects.count(), 1)
+
+    def test_empty_filter(self):
+        """Test an empty filter doesn't select the whole library"""
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.client.post(TAG_DELETE_URL, {'filter': {}}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Tag.objects.count(), 1)
+
+    def test_delete_tags(self):
+        """Test the selected tags are deleted and left out of recipes"""
+        unused = Tag.objects.create(user=self.user, name='Unused')
+        used = Tag.objects.create(user=self.user, name='Vegan')
+        recipe = create_recipe(self.user)
+        recipe.tags.add(used)
+        other = Tag.objects.create(user=self.other_user, name='Vegan')
+
+        res = self.client.post(
+            TAG_DELETE_URL, {'ids': [unused.id, used.id, other.id]},
+            format='json',
+        )
+
+        self.assertEqual(res.data['count'], 2)
+        self.assertEqual(list(Tag.objects.all()), [other])
+        self.assertEqual(list(recipe.tags.all()), [])
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.json()[0]['tags'], [])
+
+    def test_delete_ingredients_by_filter(self):
+        """Test ingredients can be selected by the filters of the list"""
+        used = Ingredient.objects.create(user=self.user, name='Salt')
+        Ingredient.objects.create(user=self.user, name='Pepper')
+        create_recipe(self.user).ingredients.add(used)
+
+        res = self.client.post(
+            INGREDIENT_DELETE_URL, {'filter': {'assigned_only': '1'}},
+            format='json',
+        )
+
+        self.assertEqual(res.data, {'count': 1, 'ids': [used.id]})
+        self.assertEqual(
+            list(Ingredient.objects.values_list('name', flat=True)),
+            ['Pepper'],
+        )
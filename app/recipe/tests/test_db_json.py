@@ -0,0 +1,133 @@
+"""
+Tests for the recipe list JSON built by the database
+"""
+import json
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.budgets import QueryBudgetExceeded
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient,
+)
+from recipe import db_json
+from recipe.views import RecipeViewSet
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        'title': 'Sample recipe title',
+        'time_minutes': 22,
+        'price': Decimal('5.25'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+def parse(content):
+    """Parse JSON keeping the order of the keys"""
+    return json.loads(content, object_pairs_hook=list)
+
+
+class DatabaseJSONTests(TestCase):
+    """Test listing recipes with JSON built by the database"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def assert_parity(self, params=None):
+        """Assert the database and python lists are the same"""
+        with override_settings(RECIPE_LIST_DB_JSON=False):
+            expected = self.client.get(RECIPES_URL, params)
+        with override_settings(RECIPE_LIST_DB_JSON=True):
+            res = self.client.get(RECIPES_URL, params)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        self.assertEqual(res['Content-Type'], 'application/json')
+        content = b''.join(res.streaming_content)
+        self.assertEqual(parse(content), parse(expected.content))
+        return content
+
+    def test_parity(self):
+        """Test the database builds the same list as the serializers"""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        dessert = Tag.objects.create(user=self.user, name='Dessert')
+        salt = Ingredient.objects.create(user=self.user, name='Salt')
+        recipe = create_recipe(
+            self.user,
+            title='Crème "brûlée" \\ \u2028 🍮',
+            price=Decimal('5.00'),
+            link='https://example.com/recipe.pdf',
+        )
+        recipe.tags.add(dessert, vegan)
+        recipe.ingredients.add(salt)
+        create_recipe(self.user, title='No relations', price=Decimal('0.5'))
+
+        content = self.assert_parity()
+
+        self.assertIn(b'\\u2028', content)
+
+    def test_parity_filtered(self):
+        """Test filtered lists keep their order and hold no duplicates"""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        dessert = Tag.objects.create(user=self.user, name='Dessert')
+        for i in range(3):
+            recipe = create_recipe(self.user, title=f'Recipe {i}')
+            recipe.tags.add(vegan, dessert)
+        create_recipe(self.user, title='Untagged')
+
+        self.assert_parity({'tags': f'{vegan.id},{dessert.id}'})
+
+    def test_parity_empty(self):
+        """Test an empty list"""
+        content = self.assert_parity()
+
+        self.assertEqual(content, b'[]')
+
+    def test_fallback_without_postgres(self):
+        """Test other databases use the python serializers"""
+        create_recipe(self.user)
+
+        with override_settings(RECIPE_LIST_DB_JSON=True), \
+                patch('recipe.db_json.connection') as patched_connection:
+            patched_connection.vendor = 'sqlite'
+            self.assertFalse(db_json.is_available())
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertFalse(res.streaming)
+        self.assertEqual(len(res.data), 1)
+
+    @override_settings(RECIPE_LIST_DB_JSON=True)
+    def test_query_budget(self):
+        """Test the streamed query runs within the budget of the request"""
+        create_recipe(self.user)
+
+        with patch.object(RecipeViewSet, 'query_budget_ms', 0):
+            res = self.client.get(RECIPES_URL)
+
+            with self.assertRaises(QueryBudgetExceeded):
+                b''.join(res.streaming_content)
+
+    def test_disabled_by_default(self):
+        """Test the database path has to be switched on"""
+        res = self.client.get(RECIPES_URL)
+
+        self.assertFalse(res.streaming)
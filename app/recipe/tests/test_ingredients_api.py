@@ -106,6 +106,8 @@ class PrivateIngredientsApiTests(TestCase):
             user=self.user,
         )
         recipe.ingredients.add(in1)
+        # pick up the recipe_count maintained by the database
+        in1.refresh_from_db()
 
         res = self.client.get(INGREDIENTS_URL, {'assigned_only': 1})
 
@@ -0,0 +1,214 @@
+"""
+Tests for merging and renaming tags and ingredients
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recipe, Tag, Tombstone
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAG_MERGE_URL = reverse('recipe:tag-merge')
+TAG_RENAME_URL = reverse('recipe:tag-bulk-rename')
+INGREDIENT_MERGE_URL = reverse('recipe:ingredient-merge')
+
+
+def recipe_url(recipe_id):
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def create_recipe(user, title='Sample recipe'):
+    """Create and return a sample recipe"""
+    return Recipe.objects.create(
+        user=user,
+        title=title,
+        time_minutes=10,
+        price=Decimal('5.00'),
+    )
+
+
+class PrivateMergeApiTests(TestCase):
+    """Test authenticated API requests"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_merge(self):
+        """Test the recipes of the sources move to the target once"""
+        target = Tag.objects.create(user=self.user, name='Vegan')
+        source = Tag.objects.create(user=self.user, name='vegan ')
+        other = Tag.objects.create(user=self.user, name='VEGAN')
+        both = create_recipe(self.user, 'Both')
+        both.tags.add(target, source)
+        moved = create_recipe(self.user, 'Moved')
+        moved.tags.add(source, other)
+        change_seq = Recipe.objects.get(id=moved.id).change_seq
+
+        res = self.client.post(
+            TAG_MERGE_URL,
+            {'target': target.id, 'sources': [source.id, other.id]},
+            format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, {
+            'id': target.id, 'name': 'Vegan', 'recipe_count': 2,
+        })
+        self.assertEqual(list(Tag.objects.filter(user=self.user)), [target])
+        for recipe in [both, moved]:
+            self.assertEqual(list(recipe.tags.all()), [target])
+        self.assertGreater(
+            Recipe.objects.get(id=moved.id).change_seq, change_seq,
+        )
+        self.assertEqual(
+            set(Tombstone.objects.filter(kind='tag').values_list(
+                'object_id', flat=True,
+            )),
+            {source.id, other.id},
+        )
+        res = self.client.get(recipe_url(moved.id))
+        self.assertEqual(
+            res.data['tags'], [{'id': target.id, 'name': 'Vegan'}],
+        )
+
+    def test_merge_ingredients(self):
+        """Test ingredients are merged the same way"""
+        target = Ingredient.objects.create(user=self.user, name='Salt')
+        source = Ingredient.objects.create(user=self.user, name='salt')
+        recipe = create_recipe(self.user)
+        recipe.ingredients.add(source)
+
+        res = self.client.post(
+            INGREDIENT_MERGE_URL,
+            {'target': target.id, 'sources': [source.id]},
+            format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['recipe_count'], 1)
+        self.assertEqual(list(recipe.ingredients.all()), [target])
+        self.assertFalse(Ingredient.objects.filter(id=source.id).exists())
+
+    def test_merge_other_users_tag(self):
+        """Test tags of other users can not be merged"""
+        other_user = get_user_model().objects.create_user(
+            'other@example.com',
+            'testpass123',
+        )
+        target = Tag.objects.create(user=self.user, name='Vegan')
+        source = Tag.objects.create(user=other_user, name='Vegan')
+
+        res = self.client.post(
+            TAG_MERGE_URL,
+            {'target': target.id, 'sources': [source.id]},
+            format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertTrue(Tag.objects.filter(id=source.id).exists())
+
+    def test_merge_target_filtered_out(self):
+        """Test the target is returned whatever the list filters"""
+        target = Tag.objects.create(user=self.user, name='Vegan')
+        source = Tag.objects.create(user=self.user, name='vegan')
+
+        res = self.client.post(
+            f'{TAG_MERGE_URL}?assigned_only=1',
+            {'target': target.id, 'sources': [source.id]},
+            format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['id'], target.id)
+
+    def test_merge_missing_target(self):
+        """Test merging into a missing target is not found"""
+        source = Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.client.post(
+            TAG_MERGE_URL,
+            {'target': source.id + 1, 'sources': [source.id]},
+            format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertTrue(Tag.objects.filter(id=source.id).exists())
+
+    def test_bulk_rename(self):
+        """Test tags are renamed, the ones renamed to a name taken merged
+        into the oldest"""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        veg = Tag.objects.create(user=self.user, name='veg')
+        vgn = Tag.objects.create(user=self.user, name='vgn')
+        sweet = Tag.objects.create(user=self.user, name='Sweet')
+        recipe = create_recipe(self.user)
+        recipe.tags.add(veg, vgn, sweet)
+
+        res = self.client.post(TAG_RENAME_URL, {'names': [
+            {'id': veg.id, 'name': 'Vegan'},
+            {'id': vgn.id, 'name': 'Vegan'},
+            {'id': sweet.id, 'name': 'Dessert'},
+        ]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            sorted(res.data, key=lambda tag: tag['id']),
+            [
+                {'id': vegan.id, 'name': 'Vegan', 'recipe_count': 1},
+                {'id': sweet.id, 'name': 'Dessert', 'recipe_count': 1},
+            ],
+        )
+        self.assertFalse(Tag.objects.filter(id__in=[veg.id, vgn.id]).exists())
+        res = self.client.get(recipe_url(recipe.id))
+        self.assertEqual(res.data['tags'], [
+            {'id': vegan.id, 'name': 'Vegan'},
+            {'id': sweet.id, 'name': 'Dessert'},
+        ])
+
+    def test_bulk_rename_duplicate_ids(self):
+        """Test an item can only be renamed once per request"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.client.post(TAG_RENAME_URL, {'names': [
+            {'id': tag.id, 'name': 'Vegetarian'},
+            {'id': tag.id, 'name': 'Veggie'},
+        ]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(NORMALIZE_NAMES=True)
+    def test_normalized_names(self):
+        """Test names differing in case and spacing are the same name"""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        comfort = Tag.objects.create(user=self.user, name='comfortfood')
+
+        res = self.client.post(RECIPES_URL, {
+            'title': 'Soup',
+            'time_minutes': 10,
+            'price': '5.00',
+            'tags': [{'name': 'vegan'}, {'name': 'Comfort   food'}],
+        }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['tags'][0]['id'], vegan.id)
+        created = Tag.objects.get(id=res.data['tags'][1]['id'])
+        self.assertEqual(created.name, 'Comfort food')
+
+        res = self.client.post(TAG_RENAME_URL, {'names': [
+            {'id': comfort.id, 'name': ' comfort  FOOD'},
+        ]}, format='json')
+
+        self.assertEqual(res.data, [
+            {'id': comfort.id, 'name': 'comfort FOOD', 'recipe_count': 1},
+        ])
+        self.assertFalse(Tag.objects.filter(id=created.id).exists())
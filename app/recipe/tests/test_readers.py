@@ -0,0 +1,132 @@
+"""
+Tests for the compiled read only serializers
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient, APIRequestFactory
+
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient,
+)
+from recipe import readers, serializers
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+class ReaderTests(TestCase):
+    """Test the readers return what the serializers do"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.ingredient = Ingredient.objects.create(
+            user=self.user, name='Salt',
+        )
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=10,
+            price=Decimal('5.5'),
+            link='https://example.com/recipe.pdf',
+        )
+        self.recipe.tags.add(
+            Tag.objects.create(user=self.user, name='Dessert'), self.tag,
+        )
+        self.recipe.ingredients.add(self.ingredient)
+        Recipe.objects.create(
+            user=self.user, title='Plain', time_minutes=5, price=Decimal('1'),
+        )
+
+    def tearDown(self):
+        self.recipe.refresh_from_db()
+        if self.recipe.image:
+            self.recipe.image.delete()
+
+    def assert_reads_like(self, reader, serializer_class, queryset,
+                          context=None):
+        context = context or {}
+        data = reader.read(queryset, context)
+        expected = serializer_class(queryset, many=True, context=context)
+        self.assertEqual(data, expected.data)
+
+    def test_tag_reader(self):
+        """Test tags read like TagSerializer"""
+        self.assert_reads_like(
+            readers.tag_reader, serializers.TagSerializer,
+            Tag.objects.order_by('id'),
+        )
+
+    def test_recipe_reader(self):
+        """Test recipes read like RecipeSerializer, with decimals and
+        nested relations ordered by id"""
+        queryset = Recipe.objects.order_by('-id')
+
+        self.assertEqual(
+            readers.recipe_reader.read(queryset)[1]['price'], '5.50',
+        )
+        self.assert_reads_like(
+            readers.recipe_reader, serializers.RecipeSerializer, queryset,
+        )
+
+    def test_recipe_detail_reader_image_url(self):
+        """Test images read as absolute URLs like the detail serializer"""
+        self.recipe.image = SimpleUploadedFile('photo.jpg', b'image')
+        self.recipe.save()
+        request = APIRequestFactory().get(RECIPES_URL)
+
+        data = readers.recipe_detail_reader.read(
+            Recipe.objects.filter(id=self.recipe.id), {'request': request},
+        )
+
+        self.assertTrue(data[0]['image'].startswith('http://testserver/'))
+        self.assert_reads_like(
+            readers.recipe_detail_reader,
+            serializers.RecipeDetailSerializer,
+            Recipe.objects.order_by('id'),
+            {'request': request},
+        )
+
+    def test_read_selected_fields(self):
+        """Test reading a subset of the fields"""
+        data = readers.recipe_reader.read(
+            Recipe.objects.filter(id=self.recipe.id),
+            fields=['tags', 'id'],
+        )
+
+        self.assertEqual(list(data[0]), ['id', 'tags'])
+
+    def test_list_views_use_readers(self):
+        """Test the list endpoints read every row with one query per
+        relation"""
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        with self.assertNumQueries(1):
+            res = client.get(TAGS_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(3):
+            res = client.get(RECIPES_URL, {'omit': 'link'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 2)
+
+    def test_retrieve_missing_recipe(self):
+        """Test retrieving an unknown recipe returns a 404"""
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        res = client.get(reverse('recipe:recipe-detail', args=[0]))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
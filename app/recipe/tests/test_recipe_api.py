@@ -10,7 +10,9 @@ from PIL import Image
 
 
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
@@ -28,6 +30,8 @@ from core.models import (
 from recipe.serializers import (
     RecipeSerializer,
     RecipeDetailSerializer,
+    RecipeTagSerializer,
+    RecipeIngredientSerializer,
 )
 
 # refer to url of  the view recipe-list in the app recipe
@@ -460,6 +464,120 @@ class PrivateRecipeApiTests(TestCase):
         self.assertIn(s2.data, res.data)
         self.assertNotIn(s3.data, res.data)
 
+    def test_list_sideloads_tags_and_ingredients(self):
+        """Test ?include= references relations by id and sideloads them"""
+        tag1 = Tag.objects.create(user=self.user, name='Vegan')
+        tag2 = Tag.objects.create(user=self.user, name='Dinner')
+        ingredient = Ingredient.objects.create(user=self.user, name='Tofu')
+        r1 = create_recipe(user=self.user, title='Tofu Curry')
+        r2 = create_recipe(user=self.user, title='Tofu Salad')
+        r1.tags.add(tag1, tag2)
+        r2.tags.add(tag1)
+        r1.ingredients.add(ingredient)
+
+        with self.assertNumQueries(5):
+            res = self.client.get(
+                RECIPES_URL, {'include': 'tags,ingredients'},
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recipes = {recipe['id']: recipe for recipe in res.data['recipes']}
+        self.assertEqual(recipes[r1.id]['tags'], [tag1.id, tag2.id])
+        self.assertEqual(recipes[r2.id]['tags'], [tag1.id])
+        self.assertEqual(recipes[r1.id]['ingredients'], [ingredient.id])
+        self.assertEqual(recipes[r2.id]['ingredients'], [])
+        self.assertEqual(
+            res.data['tags'],
+            {
+                tag1.id: RecipeTagSerializer(tag1).data,
+                tag2.id: RecipeTagSerializer(tag2).data,
+            },
+        )
+        self.assertEqual(
+            res.data['ingredients'],
+            {ingredient.id: RecipeIngredientSerializer(ingredient).data},
+        )
+
+    def test_list_sideload_keeps_other_relations_nested(self):
+        """Test relations not named in ?include= stay nested"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        ingredient = Ingredient.objects.create(user=self.user, name='Tofu')
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(tag)
+        recipe.ingredients.add(ingredient)
+
+        res = self.client.get(RECIPES_URL, {'include': 'tags'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotIn('ingredients', res.data)
+        listed = res.data['recipes'][0]
+        self.assertEqual(listed['tags'], [tag.id])
+        self.assertEqual(
+            listed['ingredients'],
+            [RecipeIngredientSerializer(ingredient).data],
+        )
+
+    def test_list_sideload_invalid_relation(self):
+        """Test including an unknown relation returns an error"""
+        res = self.client.get(RECIPES_URL, {'include': 'user'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_sparse_fields(self):
+        """Test ?fields= trims both the response and the SQL"""
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(RECIPES_URL, {'fields': 'id,title'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [{'id': recipe.id, 'title': recipe.title}])
+        self.assertEqual(len(queries), 1)
+        sql = queries[0]['sql']
+        self.assertNotIn('description', sql)
+        self.assertNotIn('core_recipe_tags', sql)
+
+    def test_detail_omit_fields(self):
+        """Test ?omit= leaves fields and their prefetches out"""
+        recipe = create_recipe(user=self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(
+                detail_url(recipe.id),
+                {'omit': 'tags,ingredients,description'},
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            list(res.data),
+            ['id', 'title', 'time_minutes', 'price', 'link', 'image'],
+        )
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('description', queries[0]['sql'])
+
+    def test_sparse_fields_invalid_field(self):
+        """Test selecting an unknown field returns an error"""
+        res = self.client.get(RECIPES_URL, {'fields': 'id,user'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_sparse_list_prefetches_selected_relations(self):
+        """Test a sparse list prefetches only the selected relations
+        instead of querying them once per recipe"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        for _ in range(3):
+            create_recipe(user=self.user).tags.add(tag)
+
+        with self.assertNumQueries(2):
+            res = self.client.get(RECIPES_URL, {'fields': 'id,tags'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 3)
+        self.assertEqual(
+            res.data[0]['tags'], [{'id': tag.id, 'name': 'Vegan'}],
+        )
+
 class ImageUploadTests(TestCase):
     """Tests for the image upload API"""
     def setUp(self):
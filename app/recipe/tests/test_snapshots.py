@@ -0,0 +1,147 @@
+"""
+Tests for the recipe list snapshots
+"""
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    Recipe,
+    RecipeSnapshot,
+    Tag,
+)
+from recipe import snapshots
+from recipe.serializers import RecipeSerializer
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        'title': 'Sample recipe title',
+        'time_minutes': 22,
+        'price': Decimal('5.25'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class RecipeSnapshotTests(TestCase):
+    """Test listing recipes from their snapshots"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def get_snapshot(self, recipe):
+        return RecipeSnapshot.objects.filter(recipe=recipe).first()
+
+    def test_list_builds_and_reuses_snapshots(self):
+        """Test missing snapshots are built once and then spliced"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe = create_recipe(self.user)
+        recipe.tags.add(tag)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertIsNotNone(self.get_snapshot(recipe))
+        with self.assertNumQueries(2):
+            cached = self.client.get(RECIPES_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        expected = RecipeSerializer([recipe], many=True).data
+        self.assertEqual(res.json(), expected)
+        self.assertEqual(cached.content, res.content)
+
+    def test_rebuilt_after_commit(self):
+        """Test a changed recipe's snapshot is rebuilt on commit"""
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = create_recipe(self.user)
+        self.assertIn('"title":"Sample recipe title"', self.get_snapshot(
+            recipe
+        ).list_json)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.title = 'New title'
+            recipe.save()
+
+        snapshot = self.get_snapshot(recipe)
+        self.assertIn('"title":"New title"', snapshot.list_json)
+
+    def test_refresh_skips_deleted_recipes(self):
+        """Test a recipe deleted while refreshing leaves the other
+        snapshots refreshed"""
+        recipe = create_recipe(self.user)
+        deleted = create_recipe(self.user)
+        rendered = snapshots.render_snapshots([recipe.id, deleted.id])
+        RecipeSnapshot.objects.all().delete()
+        deleted.delete()
+
+        with patch(
+            'recipe.snapshots.render_snapshots', return_value=rendered,
+        ):
+            snapshots.refresh_snapshots([recipe.id, deleted.id])
+
+        self.assertEqual(
+            list(RecipeSnapshot.objects.values_list('recipe_id', flat=True)),
+            [recipe.id],
+        )
+
+    def test_invalidated_by_links(self):
+        """Test adding and removing tags drops the snapshot"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe = create_recipe(self.user)
+        self.client.get(RECIPES_URL)
+
+        tag.recipe_set.add(recipe)
+
+        self.assertIsNone(self.get_snapshot(recipe))
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(
+            res.json()[0]['tags'],
+            [{'id': tag.id, 'name': 'Vegan'}],
+        )
+
+    def test_invalidated_by_tag_rename(self):
+        """Test renaming a tag refreshes the recipes using it"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe = create_recipe(self.user)
+        recipe.tags.add(tag)
+        self.client.get(RECIPES_URL)
+
+        tag.name = 'Plant based'
+        tag.save()
+
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.json()[0]['tags'][0]['name'], 'Plant based')
+
+    def test_invalidated_by_tag_delete(self):
+        """Test deleting a tag refreshes the recipes using it"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe = create_recipe(self.user)
+        recipe.tags.add(tag)
+        self.client.get(RECIPES_URL)
+
+        tag.delete()
+
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.json()[0]['tags'], [])
+
+    def test_browsable_api_uses_serializer(self):
+        """Test non JSON formats are serialized as usual"""
+        create_recipe(self.user)
+
+        res = self.client.get(RECIPES_URL, {'format': 'api'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertFalse(RecipeSnapshot.objects.exists())
@@ -0,0 +1,204 @@
+"""
+Tests for the delta sync API
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recipe, Tag
+
+SYNC_URL = reverse('recipe:sync')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def create_recipe(user, title='Sample recipe'):
+    """Create and return a sample recipe"""
+    return Recipe.objects.create(
+        user=user,
+        title=title,
+        time_minutes=10,
+        price=Decimal('5.00'),
+    )
+
+
+class PublicSyncApiTests(TestCase):
+    """Test unauthenticated API requests"""
+
+    def test_auth_required(self):
+        """Test auth is required to sync"""
+        res = APIClient().get(SYNC_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateSyncApiTests(TestCase):
+    """Test authenticated API requests"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def sync(self, since=None, **params):
+        if since is not None:
+            params['since'] = since
+        res = self.client.get(SYNC_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.json()
+
+    def test_full_sync(self):
+        """Test a sync without cursor returns every object of the user"""
+        recipe = create_recipe(self.user)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe.tags.add(tag)
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            'testpass123',
+        )
+        create_recipe(other)
+
+        page = self.sync()
+
+        self.assertFalse(page['more'])
+        self.assertEqual([r['id'] for r in page['recipes']], [recipe.id])
+        self.assertEqual(
+            page['recipes'][0]['tags'], [{'id': tag.id, 'name': 'Vegan'}],
+        )
+        self.assertEqual(page['tags'], [
+            {'id': tag.id, 'name': 'Vegan', 'recipe_count': 1},
+        ])
+        self.assertEqual(
+            page['deleted'], {'recipes': [], 'tags': [], 'ingredients': []},
+        )
+
+    def test_nothing_changed(self):
+        """Test syncing from the latest cursor returns no changes"""
+        create_recipe(self.user)
+        cursor = self.sync()['cursor']
+
+        page = self.sync(cursor)
+
+        self.assertEqual(page['cursor'], cursor)
+        self.assertEqual(page['recipes'], [])
+
+    def test_changes_since_cursor(self):
+        """Test only the objects changed after the cursor are returned"""
+        unchanged = create_recipe(self.user, 'Unchanged')
+        changed = create_recipe(self.user, 'Changed')
+        cursor = self.sync()['cursor']
+
+        changed.title = 'Renamed'
+        changed.save()
+        page = self.sync(cursor)
+
+        self.assertEqual(
+            [r['title'] for r in page['recipes']], ['Renamed'],
+        )
+        self.assertGreater(page['cursor'], cursor)
+        self.assertNotIn(
+            unchanged.id, [r['id'] for r in page['recipes']],
+        )
+
+    def test_relink_changes_recipe(self):
+        """Test adding and removing tags changes the recipe and the
+        recipe count of the tags"""
+        recipe = create_recipe(self.user)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        cursor = self.sync()['cursor']
+
+        recipe.tags.add(tag)
+        page = self.sync(cursor)
+
+        self.assertEqual([r['id'] for r in page['recipes']], [recipe.id])
+        self.assertEqual(page['tags'][0]['recipe_count'], 1)
+
+        tag.recipe_set.clear()
+        page = self.sync(page['cursor'])
+
+        self.assertEqual(page['recipes'][0]['tags'], [])
+        self.assertEqual(page['tags'][0]['recipe_count'], 0)
+
+    def test_rename_changes_recipes(self):
+        """Test renaming an ingredient changes the recipes embedding it"""
+        recipe = create_recipe(self.user)
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+        recipe.ingredients.add(ingredient)
+        cursor = self.sync()['cursor']
+
+        ingredient.name = 'Sea salt'
+        ingredient.save()
+        page = self.sync(cursor)
+
+        self.assertEqual(
+            page['recipes'][0]['ingredients'],
+            [{'id': ingredient.id, 'name': 'Sea salt'}],
+        )
+
+    def test_deletes(self):
+        """Test deleted objects are returned as tombstones"""
+        recipe = create_recipe(self.user)
+        kept = create_recipe(self.user, 'Kept')
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        kept.tags.add(tag)
+        cursor = self.sync()['cursor']
+        recipe_id, tag_id = recipe.id, tag.id
+
+        recipe.delete()
+        tag.delete()
+        page = self.sync(cursor)
+
+        self.assertEqual(page['deleted']['recipes'], [recipe_id])
+        self.assertEqual(page['deleted']['tags'], [tag_id])
+        # the kept recipe lost its tag
+        self.assertEqual([r['id'] for r in page['recipes']], [kept.id])
+
+    def test_api_writes_tracked(self):
+        """Test a recipe created through the API is in the next sync"""
+        cursor = self.sync()['cursor']
+        payload = {
+            'title': 'Curry',
+            'time_minutes': 30,
+            'price': '5.00',
+            'tags': [{'name': 'Indian'}],
+        }
+        self.client.post(RECIPES_URL, payload, format='json')
+
+        page = self.sync(cursor)
+
+        self.assertEqual([r['title'] for r in page['recipes']], ['Curry'])
+        self.assertEqual([t['name'] for t in page['tags']], ['Indian'])
+
+    def test_pages(self):
+        """Test changes are returned a page at a time in change order"""
+        recipes = [create_recipe(self.user, f'Recipe {i}') for i in range(5)]
+        deleted_id = recipes[0].id
+        recipes[0].delete()
+
+        first = self.sync(limit=2)
+        second = self.sync(first['cursor'], limit=2)
+        last = self.sync(second['cursor'], limit=2)
+
+        self.assertTrue(first['more'])
+        self.assertTrue(second['more'])
+        self.assertFalse(last['more'])
+        synced = [
+            r['title'] for page in (first, second, last)
+            for r in page['recipes']
+        ]
+        self.assertEqual(synced, [f'Recipe {i}' for i in range(1, 5)])
+        self.assertEqual(last['deleted']['recipes'], [deleted_id])
+
+    def test_invalid_params(self):
+        """Test an invalid cursor or limit is refused"""
+        for params in [{'since': 'x'}, {'limit': 0}]:
+            res = self.client.get(SYNC_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
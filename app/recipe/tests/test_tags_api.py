@@ -4,7 +4,9 @@ Tests for the tags API
 from decimal import Decimal
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
 from rest_framework import status
 from rest_framework.test import APIClient
@@ -106,6 +108,8 @@ class PrivateTagsApiTests(TestCase):
             user=self.user,
         )
         recipe.tags.add(tag1)
+        # pick up the recipe_count maintained by the database
+        tag1.refresh_from_db()
 
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
 
@@ -136,3 +140,50 @@ class PrivateTagsApiTests(TestCase):
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
 
         self.assertEqual(len(res.data), 1)
+
+    def test_assigned_only_skips_join(self):
+        """Test assigned_only filters on the stored count"""
+        tag = Tag.objects.create(user=self.user, name='Breakfast')
+        Tag.objects.create(user=self.user, name='Dinner')
+        recipe = Recipe.objects.create(
+            title='Pancakes',
+            time_minutes=5,
+            price=Decimal('5.00'),
+            user=self.user,
+        )
+        recipe.tags.add(tag)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(TAGS_URL, {'assigned_only': 1})
+
+        self.assertEqual([t['id'] for t in res.data], [tag.id])
+        self.assertEqual(res.data[0]['recipe_count'], 1)
+        self.assertNotIn('core_recipe_tags', queries[-1]['sql'])
+
+    def test_order_by_popularity(self):
+        """Test sorting tags by the number of recipes using them"""
+        rare = Tag.objects.create(user=self.user, name='Rare')
+        popular = Tag.objects.create(user=self.user, name='Popular')
+        for _ in range(2):
+            recipe = Recipe.objects.create(
+                title='Pancakes',
+                time_minutes=5,
+                price=Decimal('5.00'),
+                user=self.user,
+            )
+            recipe.tags.add(popular)
+        recipe.tags.add(rare)
+
+        res = self.client.get(TAGS_URL, {'ordering': '-recipe_count'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(t['id'], t['recipe_count']) for t in res.data],
+            [(popular.id, 2), (rare.id, 1)],
+        )
+
+    def test_invalid_ordering(self):
+        """Test sorting by an unknown field returns an error"""
+        res = self.client.get(TAGS_URL, {'ordering': 'user'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
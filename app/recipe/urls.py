@@ -31,5 +31,9 @@ app_name = 'recipe'
 #  url in app/urls
 #  include the urls generated by the router
 urlpatterns = [
+    # changes since the cursor of a client's last sync
+    path('sync/', views.SyncView.as_view(), name='sync'),
+    # deletes the whole library of the user
+    path('library/', views.LibraryView.as_view(), name='library'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
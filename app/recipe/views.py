@@ -8,22 +8,101 @@ from drf_spectacular.utils import (
     OpenApiTypes,
 )
 from rest_framework import (
+    views,
     viewsets,
     # mixins is you can mix in to a view to add additional functionality
     mixins,
     status,
 )
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.authentication import TokenAuthentication
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, SAFE_METHODS
 
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Prefetch
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+
+from core.budgets import QueryBudgetMixin
+from core.idempotency import IDEMPOTENCY_PARAMETERS, idempotent
+from core.purge import delete_library
 from core.models import (
     Recipe,
     Tag,
     Ingredient,
 )
-from recipe import serializers
+from recipe import (
+    autocomplete,
+    bulk,
+    db_json,
+    merges,
+    readers,
+    serializers,
+    snapshots,
+    sync,
+)
+
+# sparse fieldset parameters shared by the list and detail endpoints
+SPARSE_FIELDS_PARAMETERS = [
+    OpenApiParameter(
+        'fields',
+        OpenApiTypes.STR,
+        description='Comma separated list of the fields to return',
+    ),
+    OpenApiParameter(
+        'omit',
+        OpenApiTypes.STR,
+        description='Comma separated list of fields to leave out',
+    ),
+]
+
+
+class BulkActionsMixin:
+    """Add a bulk delete of the items selected by id or by the filters of
+    the list endpoint, see recipe.bulk"""
+    # validates the query parameters of the list endpoint selecting the
+    # items
+    bulk_filter_serializer_class = None
+
+    def _get_bulk_ids(self, data):
+        """Return the ids of the items selected by data"""
+        if 'ids' in data:
+            queryset = self.get_queryset({}).filter(pk__in=data['ids'])
+        elif data['all']:
+            queryset = self.get_queryset({})
+        else:
+            filters = self.bulk_filter_serializer_class(data=data['filter'])
+            if not filters.is_valid():
+                raise ValidationError({'filter': filters.errors})
+            queryset = self.get_queryset(filters.validated_data)
+        ids = list(queryset.values_list('pk', flat=True)[
+            :settings.BULK_MAX_ROWS + 1
+        ])
+        if len(ids) > settings.BULK_MAX_ROWS:
+            raise ValidationError({'filter': [
+                f'Ensure the filter selects at most {settings.BULK_MAX_ROWS} '
+                'items.'
+            ]})
+        return ids
+
+    @extend_schema(
+        request=serializers.BulkSelectionSerializer,
+        responses=serializers.BulkResultSerializer,
+    )
+    @action(methods=['POST'], detail=False, url_path='bulk-delete')
+    def bulk_delete(self, request):
+        """Delete the selected items"""
+        serializer = serializers.BulkSelectionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = self._get_bulk_ids(serializer.validated_data)
+        return Response({
+            'count': self.perform_bulk_delete(ids),
+            'ids': ids,
+        })
+
 
 # decorator used to update documentation for filtering
 @extend_schema_view(
@@ -41,44 +120,180 @@ from recipe import serializers
                 'ingredients',
                 OpenApiTypes.STR,
                 description='Comma separarted list of ingredient Ids to filter',
-            )
-        ]
-    )
+            ),
+            OpenApiParameter(
+                'include',
+                OpenApiTypes.STR,
+                description=(
+                    'Comma separated list of relations (tags, ingredients) '
+                    'to sideload. Recipes then reference them by id and '
+                    'the response becomes {"recipes": [...], '
+                    '"<relation>": {id: object}}'
+                ),
+            ),
+        ] + SPARSE_FIELDS_PARAMETERS
+    ),
+    retrieve=extend_schema(parameters=SPARSE_FIELDS_PARAMETERS),
+    create=extend_schema(parameters=IDEMPOTENCY_PARAMETERS),
 )
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(QueryBudgetMixin,
+                    BulkActionsMixin,
+                    viewsets.ModelViewSet):
     """View for manage recipe APIs"""
+    query_budget_ms = 5000
+    # reads or writes by method, actions can name another scope
+    throttle_scope = None
     # in all cases excpet listing, we want to use the detailSerializer
     serializer_class = serializers.RecipeDetailSerializer
     queryset = Recipe.objects.all()
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
+    # relations that can be sideloaded with ?include= and the serializers
+    # used for the sideloaded objects
+    sideload_serializers = {
+        'tags': serializers.RecipeTagSerializer,
+        'ingredients': serializers.RecipeIngredientSerializer,
+    }
+    bulk_filter_serializer_class = serializers.RecipeBulkFilterSerializer
 
-    def _params_to_ints(self, qs):
+    def _params_to_ints(self, qs, param):
         """Convert a list of strings to integers."""
-        return [int(str_id) for str_id in qs.split(',')]
+        str_ids = qs.split(',')
+        # every id makes the filter, and so the query, more expensive
+        if len(str_ids) > settings.MAX_FILTER_IDS:
+            raise ValidationError({param: [
+                f'Ensure this list has at most {settings.MAX_FILTER_IDS} ids.'
+            ]})
+        try:
+            return [int(str_id) for str_id in str_ids]
+        except ValueError:
+            raise ValidationError({param: ['Ensure every id is a number.']})
+
+    def _params_to_names(self, param, choices):
+        """Convert a comma separated query parameter to a list of names,
+        each of which has to be one of choices"""
+        names = []
+        for name in self.request.query_params.get(param, '').split(','):
+            name = name.strip()
+            if not name or name in names:
+                continue
+            if name not in choices:
+                raise ValidationError(
+                    {param: [f'"{name}" is not a valid choice.']}
+                )
+            names.append(name)
+        return names
+
+    def _get_sideloaded_relations(self):
+        """Return the relations requested with ?include="""
+        if self.action != 'list':
+            return []
+        relations = self._params_to_names(
+            'include', self.sideload_serializers,
+        )
+        # nothing to sideload for relations left out of a sparse fieldset
+        fields = self._get_selected_fields()
+        if fields is not None:
+            relations = [name for name in relations if name in fields]
+        return relations
+
+    def _get_selected_fields(self):
+        """Return the serializer fields picked with ?fields= and ?omit=,
+        or None when the client wants all of them"""
+        params = self.request.query_params
+        if self.request.method not in SAFE_METHODS or not (
+            'fields' in params or 'omit' in params
+        ):
+            return None
+        available = self.get_serializer_class().Meta.fields
+        selected = self._params_to_names('fields', available) or available
+        omitted = self._params_to_names('omit', available)
+        return [
+            name for name in available
+            if name in selected and name not in omitted
+        ]
+
+    def _sideload(self, name, recipe_ids):
+        """Return the ids of the related objects per recipe and the
+        serialized related objects keyed by id, read straight from the
+        through table so no related object is loaded once per recipe"""
+        field = Recipe._meta.get_field(name)
+        source = f'{field.m2m_field_name()}_id'
+        target = f'{field.m2m_reverse_field_name()}_id'
+        links = field.remote_field.through.objects.filter(
+            **{f'{source}__in': recipe_ids}
+        ).values_list(source, target).order_by(target)
+
+        ids_by_recipe = {}
+        for recipe_id, related_id in links:
+            ids_by_recipe.setdefault(recipe_id, []).append(related_id)
+
+        related_ids = {
+            related_id for ids in ids_by_recipe.values() for related_id in ids
+        }
+        related = field.related_model.objects.filter(
+            id__in=related_ids
+        ).order_by('id')
+        data = self.sideload_serializers[name](related, many=True).data
+        return ids_by_recipe, {obj['id']: obj for obj in data}
 
     # make the retrieved recipes filter down to authenticated user level
-    def get_queryset(self):
+    def get_queryset(self, params=None):
         """override to the get_queryset, retrieve recipe for authenticated user"""
         # return self.queryset.filter(user=self.request.user).order_by('-id')
 
         # refactor the code to support the optional filtering for parameter of common separated list
-        tags = self.request.query_params.get('tags')
-        ingredients = self.request.query_params.get('ingredients')
+        if params is None:
+            params = self.request.query_params
+        tags = params.get('tags')
+        ingredients = params.get('ingredients')
         queryset = self.queryset
         if tags:
-            tag_ids = self._params_to_ints(tags)
+            tag_ids = self._params_to_ints(tags, 'tags')
             # syntax for filtering unrelated fields on db, filters the tags by the id
             # tags__id__in=tag_id means filter objects where the 'id' of related tags is in the list of tag_ids
             queryset = queryset.filter(tags__id__in=tag_ids)
         if ingredients:
-            ingredient_ids = self._params_to_ints(ingredients)
+            ingredient_ids = self._params_to_ints(
+                ingredients, 'ingredients',
+            )
             queryset = queryset.filter(ingredients__id__in=ingredient_ids)
 
-        return queryset.filter(
-            user=self.request.user
+        return queryset.owned_by(
+            self.request.user
         ).order_by('-id').distinct()
 
+    def _select_related_data(self, queryset):
+        """Load only the columns and relations the response will use"""
+        fields = self._get_selected_fields()
+        if fields is not None:
+            columns = [
+                name for name in fields
+                if not Recipe._meta.get_field(name).many_to_many
+            ]
+            queryset = queryset.only('id', *columns)
+
+        # sideloaded relations are read from the through tables instead
+        sideloaded = self._get_sideloaded_relations()
+        for name in self.sideload_serializers:
+            if name in sideloaded:
+                continue
+            if fields is not None and name not in fields:
+                continue
+            related_model = Recipe._meta.get_field(name).related_model
+            queryset = queryset.prefetch_related(
+                Prefetch(name, queryset=related_model.objects.order_by('id'))
+            )
+        return queryset
+
+    def get_serializer_context(self):
+        """Pass the selected sparse fieldset on to the serializer"""
+        context = super().get_serializer_context()
+        fields = self._get_selected_fields()
+        if fields is not None:
+            context['fields'] = fields
+        return context
+
     # the method gets called when Dj rest fram wants to determine
     # the class being used for a particular, can help dynamically choose the specific serializer
     def get_serializer_class(self):
@@ -96,6 +311,81 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
         return self.serializer_class
 
+    def get_reader(self):
+        """Return the compiled reader for the serializer of the request"""
+        if self.action == 'list':
+            return readers.recipe_reader
+        return readers.recipe_detail_reader
+
+    def retrieve(self, request, *args, **kwargs):
+        # no docstring, it would replace the view's description in the
+        # OpenAPI schema; read the recipe with the compiled reader rather
+        # than the serializer
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            data = self.get_reader().read(
+                self.filter_queryset(self.get_queryset()).filter(
+                    **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+                ),
+                self.get_serializer_context(),
+                self._get_selected_fields(),
+            )
+        except (TypeError, ValueError, DjangoValidationError):
+            raise Http404
+        if not data:
+            raise Http404
+        return Response(data[0])
+
+    def list(self, request, *args, **kwargs):
+        """List recipes from their snapshots or as JSON built by the
+        database (RECIPE_LIST_DB_JSON), or sideload the relations
+        asked for in ?include= once instead of nesting them in every
+        recipe"""
+        relations = self._get_sideloaded_relations()
+        if not relations:
+            if self._get_selected_fields() is None and (
+                request.accepted_renderer.format == 'json'
+            ):
+                queryset = self.filter_queryset(self.get_queryset())
+                if db_json.is_available():
+                    # let postgres build the documents and stream them,
+                    # the query running within the budget of the request
+                    return StreamingHttpResponse(
+                        self.budgeted(db_json.stream_list_json(queryset)),
+                        content_type='application/json',
+                    )
+                # splice the precomputed JSON of each recipe together
+                # rather than serializing the recipes again
+                return Response(snapshots.get_list_snapshots(queryset))
+            return Response(self.get_reader().read(
+                self.filter_queryset(self.get_queryset()),
+                self.get_serializer_context(),
+                self._get_selected_fields(),
+            ))
+
+        recipes = list(self._select_related_data(
+            self.filter_queryset(self.get_queryset())
+        ))
+        recipe_ids = [recipe.id for recipe in recipes]
+
+        context = self.get_serializer_context()
+        context['sideload'] = {}
+        included = {}
+        for name in relations:
+            context['sideload'][name], included[name] = self._sideload(
+                name, recipe_ids,
+            )
+        serializer = serializers.RecipeSideloadSerializer(
+            recipes, many=True, context=context,
+        )
+        return Response({'recipes': serializer.data, **included})
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        # retries sent with the same Idempotency-Key don't create the
+        # recipe, its tags and ingredients again
+        return super().create(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         """Create a new recipe"""
         # when we perform a creation of new object(recipe) through this
@@ -106,7 +396,10 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     # only expect a post request, detail = True means action is apply to the detail portion
     #  (specific id of recipe) non-detail means the generic list view of all recipes
-    @action(methods=['POST'], detail=True, url_path='upload-image')
+    @extend_schema(parameters=IDEMPOTENCY_PARAMETERS)
+    @action(methods=['POST'], detail=True, url_path='upload-image',
+            throttle_scope='uploads')
+    @idempotent
     def upload_image(self, request, pk=None):
         """Upload an image to recipe"""
 
@@ -124,6 +417,24 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @extend_schema(
+        request=serializers.RecipeBulkUpdateSerializer,
+        responses=serializers.BulkResultSerializer,
+    )
+    @action(methods=['POST'], detail=False, url_path='bulk-update')
+    def bulk_update(self, request):
+        """Make the same changes to the selected recipes"""
+        serializer = serializers.RecipeBulkUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = self._get_bulk_ids(serializer.validated_data)
+        count = bulk.update_recipes(
+            request.user, ids, serializer.validated_data['changes'],
+        )
+        return Response({'count': count, 'ids': ids})
+
+    def perform_bulk_delete(self, ids):
+        return bulk.delete_recipes(self.request.user, ids)
+
 @extend_schema_view(
     list=extend_schema(
         parameters=[
@@ -132,11 +443,36 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 'assigned_only',
                 OpenApiTypes.INT, enum=[0, 1],
                 description='Filter by items assigned by recipes.',
-            )
+            ),
+            OpenApiParameter(
+                'ordering',
+                OpenApiTypes.STR,
+                enum=['-name', 'name', '-recipe_count', 'recipe_count'],
+                description=(
+                    'Sort by name or by popularity (number of recipes), '
+                    'defaults to -name.'
+                ),
+            ),
+            OpenApiParameter(
+                'q',
+                OpenApiTypes.STR,
+                description=(
+                    'Autocomplete: return the items whose name starts '
+                    'with q, or with q with one typo, the most used '
+                    'first. ordering is ignored.'
+                ),
+            ),
+            OpenApiParameter(
+                'limit',
+                OpenApiTypes.INT,
+                description='Most autocomplete suggestions, defaults to 10.',
+            ),
         ]
     )
 )
-class BaseRecipeAttrViewSet(mixins.DestroyModelMixin,
+class BaseRecipeAttrViewSet(QueryBudgetMixin,
+                        BulkActionsMixin,
+                        mixins.DestroyModelMixin,
                         mixins.UpdateModelMixin,
                         # mixins.UpdateModelMixin make the router automatically
                         # adds the detail API endpoint so we can get the detailed
@@ -145,35 +481,143 @@ class BaseRecipeAttrViewSet(mixins.DestroyModelMixin,
                         viewsets.GenericViewSet):
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget_ms = 2000
+    ordering_choices = ['-name', 'name', '-recipe_count', 'recipe_count']
+    bulk_filter_serializer_class = serializers.AttrBulkFilterSerializer
+
+    def _assigned_only(self, params):
+        """Return whether params ask for the items assigned to recipes"""
+        try:
+            return bool(int(params.get('assigned_only', 0)))
+        except ValueError:
+            raise ValidationError(
+                {'assigned_only': ['Ensure this is 0 or 1.']}
+            )
 
-    def get_queryset(self):
+    def get_queryset(self, params=None):
         """Filter queryset down to authenticated user"""
-        assigned_only = bool(
-            int(self.request.query_params.get('assigned_only', 0))
-        )
+        if params is None:
+            params = self.request.query_params
+        assigned_only = self._assigned_only(params)
         queryset = self.queryset
         if assigned_only:
             # if assigned_only is true, then apply an additional filter to the queryset
-            #  recipe__isnull=False means there is a recipe associated with the value
-#  recipe__isnull=False is a query filter condition that uses the double-underscore notation (__) to navigate related fields. In this case, it checks if there is an associated recipe for the current object.
-# When recipe__isnull=False, it means that there is a related recipe for the current object. Conversely, if recipe__isnull=True, there is no related recipe.
-            queryset = queryset.filter(recipe__isnull=False)
+            # recipe_count is maintained on every recipe link change (see
+            # core.counts) so there is no need to join through the recipes
+            # and de-duplicate the result
+            queryset = queryset.filter(recipe_count__gt=0)
 
-        return queryset.filter(
-            user=self.request.user
-        ).order_by('-name').distinct()
-        # return self.queryset.filter(user=self.request.user).order_by('-name')
+        ordering = params.get('ordering', '-name')
+        if ordering not in self.ordering_choices:
+            raise ValidationError(
+                {'ordering': [f'"{ordering}" is not a valid choice.']}
+            )
+        # break ties between equally popular items by name
+        order_by = [ordering] if 'name' in ordering else [ordering, '-name']
+
+        return queryset.owned_by(
+            self.request.user
+        ).order_by(*order_by)
+
+    def perform_bulk_delete(self, ids):
+        return bulk.delete_objects(
+            self.queryset.model, self.request.user, ids,
+        )
+
+    def get_serializer(self, *args, **kwargs):
+        # bulk renames respond with the list of the renamed items
+        if self.action == 'bulk_rename':
+            kwargs['many'] = True
+        return super().get_serializer(*args, **kwargs)
+
+    def _suggest(self):
+        """Return the autocomplete suggestions for ?q="""
+        params = self.request.query_params
+        query = params['q'].strip()
+        if not 0 < len(query) <= 100:
+            raise ValidationError(
+                {'q': ['Ensure this has 1 to 100 characters.']}
+            )
+        try:
+            limit = int(params.get('limit', 10))
+        except ValueError:
+            raise ValidationError({'limit': ['Ensure this is a number.']})
+        limit = min(max(limit, 1), settings.AUTOCOMPLETE_MAX_RESULTS)
+        return autocomplete.suggest(
+            self.queryset.model,
+            self.request.user,
+            query,
+            limit,
+            assigned_only=self._assigned_only(params),
+        )
+
+    def list(self, request, *args, **kwargs):
+        # no docstring, it would replace the view's description in the
+        # OpenAPI schema; list with the compiled reader rather than the
+        # serializer
+        if 'q' in request.query_params:
+            return Response(self._suggest())
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(
+            self.reader.read(queryset, self.get_serializer_context())
+        )
+
+    @extend_schema(request=serializers.MergeSerializer)
+    @action(methods=['POST'], detail=False)
+    def merge(self, request):
+        """Merge the sources into the target, moving their recipes to it"""
+        serializer = serializers.MergeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        model = self.queryset.model
+        target_id = serializer.validated_data['target']
+        try:
+            merges.merge(
+                model,
+                request.user,
+                target_id,
+                serializer.validated_data['sources'],
+            )
+        except model.DoesNotExist:
+            raise Http404
+        # not get_queryset(), the list filters of the query string don't
+        # apply to the target
+        target = get_object_or_404(
+            model.objects.owned_by(request.user), pk=target_id,
+        )
+        return Response(self.get_serializer(target).data)
+
+    @extend_schema(request=serializers.BulkRenameSerializer)
+    @action(methods=['POST'], detail=False, url_path='bulk-rename')
+    def bulk_rename(self, request):
+        """Rename several items at once, merging the ones renamed to the
+        name of another into the oldest"""
+        serializer = serializers.BulkRenameSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        model = self.queryset.model
+        try:
+            result = merges.rename(model, request.user, {
+                item['id']: item['name']
+                for item in serializer.validated_data['names']
+            })
+        except model.DoesNotExist:
+            raise Http404
+        objects = model.objects.owned_by(request.user).filter(
+            pk__in=result.values(),
+        ).order_by('-name')
+        return Response(self.get_serializer(objects).data)
 
 # add the CRUD implemetation to the tag model
 class TagViewSet(BaseRecipeAttrViewSet):
     """generic view set allow to throw mix in so can have viewset functionality for the particular
     Mnage tags in the db"""
     serializer_class = serializers.TagSerializer
+    reader = readers.tag_reader
     queryset = Tag.objects.all()
 
 class IngredientViewSet(BaseRecipeAttrViewSet):
     """Manage ingredients in the db"""
     serializer_class = serializers.IngredientSerializer
+    reader = readers.ingredient_reader
     # set our queryset to the ingredients objects tell django what models
     # we want to be manageable through ingredientvieset
     queryset = Ingredient.objects.all()
@@ -183,3 +627,66 @@ class IngredientViewSet(BaseRecipeAttrViewSet):
 
     # all the user need to be authenticated to use the viewset
     # permission_classes = [IsAuthenticated]
+
+
+@extend_schema_view(
+    get=extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'since',
+                OpenApiTypes.INT,
+                description=(
+                    'Cursor returned by the previous sync, leave out for '
+                    'a full sync'
+                ),
+            ),
+            OpenApiParameter(
+                'limit',
+                OpenApiTypes.INT,
+                description='Most changes to return, defaults to the maximum',
+            ),
+        ],
+        responses=serializers.SyncSerializer,
+    )
+)
+class SyncView(QueryBudgetMixin, views.APIView):
+    """Return the recipes, tags and ingredients changed and the ones
+    deleted since the cursor of the last sync, a page at a time"""
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    query_budget_ms = 5000
+
+    def _get_int_param(self, name, default, minimum, maximum):
+        value = self.request.query_params.get(name)
+        if value is None:
+            return default
+        try:
+            value = int(value)
+        except ValueError:
+            raise ValidationError({name: ['Ensure this is a number.']})
+        if not minimum <= value <= maximum:
+            raise ValidationError({name: [
+                f'Ensure this is between {minimum} and {maximum}.'
+            ]})
+        return value
+
+    def get(self, request):
+        since = self._get_int_param('since', 0, 0, 2 ** 63 - 1)
+        limit = self._get_int_param(
+            'limit', settings.SYNC_PAGE_SIZE, 1, settings.SYNC_PAGE_SIZE,
+        )
+        return Response(sync.get_changes(
+            request.user, since, limit, {'request': request},
+        ))
+
+
+class LibraryView(QueryBudgetMixin, views.APIView):
+    """Delete every recipe, tag and ingredient of the user at once, their
+    data is purged in the background"""
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(request=None, responses={204: None})
+    def delete(self, request):
+        delete_library(request.user)
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -153,4 +153,21 @@ class PrivateUserApiTests(TestCase):
         self.user.refresh_from_db()
         self.assertEqual(self.user.name, payload['name'])
         self.assertTrue(self.user.check_password(payload['password']))
-        self.assertEqual(res.status_code, status.HTTP_200_OK)
\ No newline at end of file
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_delete_account(self):
+        """Test deleting the account hides it and frees its email"""
+        res = self.client.delete(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertIsNotNone(self.user.deleted_at)
+        self.assertNotEqual(self.user.email, 'test@example.com')
+
+        res = APIClient().post(CREATE_USER_URL, {
+            'email': 'test@example.com',
+            'password': 'testpass123',
+            'name': 'Test Name',
+        })
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
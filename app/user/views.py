@@ -1,10 +1,15 @@
 """
 Views for the user API
 """
+from drf_spectacular.utils import extend_schema, extend_schema_view
 from rest_framework import generics, authentication, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.settings import api_settings
 
+from core.budgets import QueryBudgetMixin
+from core.idempotency import IDEMPOTENCY_PARAMETERS, idempotent
+from core.purge import delete_account
+
 from user.serializers import (
     UserSerializer,
     AuthTokenSerializer,
@@ -12,17 +17,31 @@ from user.serializers import (
 
 # the Create API view handles a post request that's designed for
 # creating objects
-class CreateUserView(generics.CreateAPIView):
+@extend_schema_view(post=extend_schema(parameters=IDEMPOTENCY_PARAMETERS))
+class CreateUserView(QueryBudgetMixin, generics.CreateAPIView):
     """Create a new user in the system"""
+    query_budget_ms = 2000
+    throttle_scope = 'auth'
     serializer_class = UserSerializer
 
-class CreateTokenView(ObtainAuthToken):
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        # a retried sign up returns the user created by the first attempt
+        return super().create(request, *args, **kwargs)
+
+class CreateTokenView(QueryBudgetMixin, ObtainAuthToken):
     """Create a new auth token for user"""
+    query_budget_ms = 2000
+    # every attempt hashes a password, so guessing is kept slow
+    throttle_scope = 'auth'
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    # ObtainAuthToken turns throttling off
+    throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+class ManageUserView(QueryBudgetMixin, generics.RetrieveUpdateDestroyAPIView):
     """Manage the authenticated user."""
+    query_budget_ms = 1000
     serializer_class = UserSerializer
     authentication_classes = [authentication.TokenAuthentication]
 
@@ -35,4 +54,8 @@ class ManageUserView(generics.RetrieveUpdateAPIView):
         get_Object to get user and retrieve the user that are authenticated
         and then run it through the serializer before returning the result
         to the API"""
-        return self.request.user
\ No newline at end of file
+        return self.request.user
+
+    def perform_destroy(self, instance):
+        """Hide the account now and purge its data in the background"""
+        delete_account(instance)
@@ -5,6 +5,14 @@ server {
         alias /vol/static;
     }
 
+    location /api/recipe/events/ {
+        proxy_pass            http://${APP_HOST}:${EVENTS_PORT};
+        proxy_http_version    1.1;
+        proxy_set_header      Connection '';
+        proxy_buffering       off;
+        proxy_read_timeout    1h;
+    }
+
     location / {
         uwsgi_pass            ${APP_HOST}:${APP_PORT};
         include               /etc/nginx/uwsgi_params;
@@ -4,6 +4,25 @@ set -e
 
 python manage.py wait_for_db
 python manage.py collectstatic --noinput
+# refuse to start on migrations that would block writes to large tables,
+# MIGRATIONS_REVIEWED lists the ones reviewed as safe, comma separated,
+# as app_label.migration_name
+reviewed=""
+for name in $(echo "${MIGRATIONS_REVIEWED:-}" | tr ',' ' '); do
+    reviewed="$reviewed --ignore $name"
+done
+python manage.py check_migrations $reviewed
 python manage.py migrate
+python manage.py generate_schema
 
-uwsgi --socket :9000 --workers 4 --master --enable-threads --module app.wsgi
\ No newline at end of file
+# the uwsgi master runs and restarts the other processes with the app:
+# the ASGI application serving the change events stream, which needs
+# long lived async connections, and the background jobs worker, purging
+# deleted accounts and libraries and running backfills. They get SIGTERM
+# on shutdown, letting the worker finish its job. Each uwsgi worker runs
+# WORKER_THREADS requests at once, the admission control limits of
+# app/settings.py are sized by it
+uwsgi --socket :9000 --workers 4 --threads "${WORKER_THREADS:-4}" \
+    --master --enable-threads --module app.wsgi \
+    --attach-daemon2 "cmd=uvicorn app.asgi:application --host 0.0.0.0 --port 9001 --workers 2,stopsignal=15" \
+    --attach-daemon2 "cmd=python manage.py run_jobs,stopsignal=15"